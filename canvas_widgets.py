@@ -13,36 +13,60 @@ from tkinter import ttk
 import threading
 import time
 import math
-from typing import Optional, Callable, List
-from dataclasses import dataclass
+from typing import Optional, Callable
+
+import numpy as np
 
 # Import locali
-try:
-    from gcode_generator import GCodeMove, GCodeProgram
-except ImportError:
-    # Fallback per definizioni inline
-    @dataclass
-    class GCodeMove:
-        x: float = 0.0
-        y: float = 0.0
-        laser_on: bool = False
-        is_rapid: bool = False
-        power: int = 0
-    
-    @dataclass
-    class GCodeProgram:
-        moves: list = None
-        
-        def __post_init__(self):
-            if self.moves is None:
-                self.moves = []
-        
-        def bounds(self):
-            if not self.moves:
-                return 0, 0, 0, 0
-            xs = [m.x for m in self.moves]
-            ys = [m.y for m in self.moves]
-            return min(xs), min(ys), max(xs), max(ys)
+from gcode_generator import GCodeMove, MoveTable
+
+# Stili di disegno dei segmenti
+STYLE_RAPID = 0
+STYLE_ON = 1
+STYLE_OFF = 2
+
+
+def path_polylines(moves: MoveTable, px: 'np.ndarray', py: 'np.ndarray') -> list:
+    """
+    Raggruppa i movimenti consecutivi con lo stesso stile in polilinee.
+    
+    Un solo item canvas per ogni tratto omogeneo invece di uno per
+    movimento; i punti che cadono sullo stesso pixel vengono scartati.
+    
+    Args:
+        moves: Tabella movimenti
+        px: Coordinate X canvas dei punti (origine + un punto per movimento)
+        py: Coordinate Y canvas dei punti
+    
+    Returns:
+        Lista di (stile, coords) con coords piatta [x0, y0, x1, y1, ...]
+    """
+    n = len(moves)
+    if not n:
+        return []
+    style = np.where(moves.is_rapid, STYLE_RAPID,
+                     np.where(moves.laser_on, STYLE_ON, STYLE_OFF))
+    qx = np.rint(px)
+    qy = np.rint(py)
+    
+    breaks = np.flatnonzero(style[1:] != style[:-1]) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [n]))
+    
+    out = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        # Il movimento i va dal punto i al punto i + 1
+        xs = qx[s:e + 1]
+        ys = qy[s:e + 1]
+        keep = np.ones(len(xs), dtype=bool)
+        keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+        if np.count_nonzero(keep) < 2:
+            continue
+        coords = np.empty(2 * int(np.count_nonzero(keep)))
+        coords[0::2] = xs[keep]
+        coords[1::2] = ys[keep]
+        out.append((int(style[s]), coords.tolist()))
+    return out
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -89,7 +113,7 @@ class WorkAreaCanvas(tk.Canvas):
         self.work_h_mm = work_h
         
         # Stato
-        self.moves: List[GCodeMove] = []
+        self.moves = MoveTable()
         self.model_x_mm = 0.0
         self.model_y_mm = 0.0
         
@@ -142,9 +166,9 @@ class WorkAreaCanvas(tk.Canvas):
         self.work_h_mm = h_mm
         self._fit_view()
     
-    def set_program(self, moves: List[GCodeMove]):
-        """Imposta i movimenti da visualizzare."""
-        self.moves = moves if moves else []
+    def set_program(self, moves):
+        """Imposta i movimenti da visualizzare (MoveTable o lista GCodeMove)."""
+        self.moves = MoveTable.from_moves(moves) if moves is not None else MoveTable()
         self._fit_view()
     
     def set_model_position(self, x_mm: float, y_mm: float):
@@ -278,36 +302,28 @@ class WorkAreaCanvas(tk.Canvas):
         if not self.moves:
             return
         
-        prev_x = prev_y = 0.0
+        mv = self.moves
+        # Punti in pixel: origine + destinazione di ogni movimento
+        px = self._pan_x + (np.concatenate(([0.0], mv.x)) + self.model_x_mm) * self._scale
+        py = self._pan_y + (self.work_h_mm -
+                            (np.concatenate(([0.0], mv.y)) + self.model_y_mm)) * self._scale
         
-        for mv in self.moves:
-            wx = mv.x + self.model_x_mm
-            wy = mv.y + self.model_y_mm
-            
-            px0, py0 = self._to_px(prev_x + self.model_x_mm, prev_y + self.model_y_mm)
-            px1, py1 = self._to_px(wx, wy)
-            
-            # Determina stile linea
-            if mv.is_rapid:
-                col, dash, w = t.rapid, (3, 4), 1
-            elif mv.laser_on:
-                col, dash, w = t.laser_on, (), 1
-            else:
-                col, dash, w = t.laser_off, (2, 3), 1
-            
-            self.create_line(px0, py0, px1, py1,
-                            fill=col, width=w, dash=dash, tags="path")
-            
-            prev_x, prev_y = mv.x, mv.y
+        styles = {
+            STYLE_RAPID: (t.rapid, (3, 4)),
+            STYLE_ON: (t.laser_on, ()),
+            STYLE_OFF: (t.laser_off, (2, 3)),
+        }
+        
+        for style, coords in path_polylines(mv, px, py):
+            col, dash = styles[style]
+            self.create_line(*coords, fill=col, width=1, dash=dash, tags="path")
     
     def _draw_bbox(self, t):
         """Disegna il bounding box del modello."""
         if not self.moves:
             return
         
-        prog = GCodeProgram()
-        prog.moves = self.moves
-        mn_x, mn_y, mx_x, mx_y = prog.bounds()
+        mn_x, mn_y, mx_x, mx_y = self.moves.bounds()
         
         x0 = mn_x + self.model_x_mm
         y0 = mn_y + self.model_y_mm
@@ -415,17 +431,20 @@ class WorkAreaCanvas(tk.Canvas):
         
         # Limita ai bordi dell'area di lavoro
         if self.moves:
-            prog = GCodeProgram()
-            prog.moves = self.moves
-            mn_x, mn_y, mx_x, mx_y = prog.bounds()
+            mn_x, mn_y, mx_x, mx_y = self.moves.bounds()
             
             # Impedisci di uscire dall'area
             nx = max(-mn_x, min(nx, self.work_w_mm - (mx_x - mn_x) - mn_x))
             ny = max(-mn_y, min(ny, self.work_h_mm - (mx_y - mn_y) - mn_y))
         
+        # Il modello trasla rigidamente: sposta gli item esistenti invece
+        # di ridisegnare tutti i percorsi a ogni evento di movimento
+        ddx = (nx - self.model_x_mm) * self._scale
+        ddy = -(ny - self.model_y_mm) * self._scale
         self.model_x_mm = nx
         self.model_y_mm = ny
-        self._redraw()
+        self.move("path", ddx, ddy)
+        self.move("bbox", ddx, ddy)
     
     def _on_lb_up(self, e):
         """Fine drag modello."""
@@ -550,9 +569,7 @@ class WorkAreaCanvas(tk.Canvas):
         if not self.moves:
             return
         
-        prog = GCodeProgram()
-        prog.moves = self.moves
-        mn_x, mn_y, mx_x, mx_y = prog.bounds()
+        mn_x, mn_y, mx_x, mx_y = self.moves.bounds()
         
         ox, oy = self.model_x_mm, self.model_y_mm
         
@@ -588,7 +605,7 @@ class VectorPreviewWindow(tk.Toplevel):
     Mostra tutti i movimenti GCode con statistiche e legenda.
     """
     
-    def __init__(self, parent, moves: List[GCodeMove],
+    def __init__(self, parent, moves: MoveTable,
                  work_w: float = 400, work_h: float = 400,
                  theme=None, strings=None, log_cb=None):
         """
@@ -633,7 +650,8 @@ class VectorPreviewWindow(tk.Toplevel):
                  command=lambda: canvas.fit()).pack(side="right")
         
         # Statistiche
-        laser_on = sum(1 for m in moves if m.laser_on)
+        moves = MoveTable.from_moves(moves)
+        laser_on = moves.laser_on_count()
         laser_off = len(moves) - laser_on
         
         if strings:
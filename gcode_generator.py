@@ -6,25 +6,47 @@ Modulo di generazione GCode per PyLaser v0.9
 Supporta:
 - Generazione da percorsi vettoriali (contorni, centerline, hatching, raster vettoriale)
 - Generazione diretta da immagine raster (PWM grayscale, dithering, threshold)
-- Parsing di file GCode esistenti
+- Parsing di file GCode esistenti (G0/G1/G2/G3)
+- Arc fitting G2/G3 per contorni e centerline
 - Controllo risoluzione e ottimizzazione velocità
 
 Autore: PyLaser Team
 Versione: 1.0
 """
 
+import os
 import re
+import gzip
+import hashlib
 import math
 import time
+from array import array
+from itertools import islice
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from enum import Enum, auto
-from dataclasses import dataclass, field
-from typing import Optional, Callable, List, Tuple
+from dataclasses import dataclass, field, replace, astuple
+from typing import Optional, Callable, List, Tuple, Iterator, Iterable, Union
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  DIPENDENZE OPZIONALI
+# ══════════════════════════════════════════════════════════════════════════════
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  COSTANTI
 # ══════════════════════════════════════════════════════════════════════════════
 APP_VERSION = "0.9"
 
+# Bit del campo flags della tabella movimenti
+FLAG_LASER_ON = 0x01
+FLAG_RAPID = 0x02
+
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  ENUMERAZIONI
@@ -39,7 +61,7 @@ class RasterDirection(Enum):
     """Direzione di scansione raster."""
     HORIZONTAL = auto()   # Scansione orizzontale (X)
     VERTICAL = auto()     # Scansione verticale (Y)
-    DIAGONAL = auto()     # Scansione diagonale (futuro)
+    DIAGONAL = auto()     # Scansione inclinata (angolo raster_angle)
 
 
 class RasterMode(Enum):
@@ -61,10 +83,224 @@ class GCodeMove:
     power: int = 0  # Potenza S (0-255), utile per grayscale
 
 
+@dataclass
+class Polyline:
+    """
+    Percorso vettoriale: rappresentazione intermedia tra Vectorizer e
+    generatore GCode.
+
+    Il primo punto viene raggiunto con un rapido (G0), i successivi
+    vengono percorsi con laser acceso alla potenza indicata.
+    """
+    points: 'np.ndarray'            # Array Nx2 float64 (mm)
+    laser_on: bool = True
+    power: Optional[int] = None     # None = potenza del generatore
+    closed: bool = False            # True se l'ultimo punto coincide col primo
+
+
+class MoveTable:
+    """
+    Tabella colonnare dei movimenti GCode (NumPy).
+
+    Sostituisce la lista di GCodeMove: ogni movimento occupa 23 byte
+    (x, y float64 + flags uint8 + potenza uint16 + feed float32) invece
+    di un oggetto Python completo. Le colonne sono esposte direttamente
+    (x, y, flags, power, feed) per calcoli vettoriali; l'accesso per
+    indice o l'iterazione restituiscono GCodeMove costruiti al volo per
+    il codice esistente.
+    """
+
+    # (nome colonna, dtype NumPy, typecode array.array)
+    COLUMNS = (
+        ("x", "float64", "d"),
+        ("y", "float64", "d"),
+        ("flags", "uint8", "B"),
+        ("power", "uint16", "H"),
+        ("feed", "float32", "f"),   # mm/min, 0 = non specificato
+    )
+
+    __slots__ = tuple(c[0] for c in COLUMNS) + ("_memo",)
+
+    def __init__(self, x=None, y=None, flags=None, power=None, feed=None):
+        """
+        Inizializza la tabella da colonne esistenti (o vuota).
+
+        Args:
+            x: Coordinate X (mm)
+            y: Coordinate Y (mm)
+            flags: Bit FLAG_LASER_ON / FLAG_RAPID per movimento
+            power: Potenza S per movimento
+            feed: Velocità F attiva per movimento (opzionale)
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("NumPy richiesto per la tabella movimenti")
+        self.x = np.asarray(x if x is not None else (), dtype=np.float64)
+        self.y = np.asarray(y if y is not None else (), dtype=np.float64)
+        n = len(self.x)
+        self.flags = np.asarray(flags if flags is not None else np.zeros(n), dtype=np.uint8)
+        self.power = np.asarray(power if power is not None else np.zeros(n), dtype=np.uint16)
+        self.feed = np.asarray(feed if feed is not None else np.zeros(n), dtype=np.float32)
+        # Colonne in sola lettura: i valori derivati (bounds, distanze)
+        # vengono memorizzati e restano validi finché esiste la tabella
+        for c in self.COLUMNS:
+            col = getattr(self, c[0]).view()
+            col.flags.writeable = False
+            setattr(self, c[0], col)
+        self._memo = {}
+
+    @classmethod
+    def from_moves(cls, moves) -> 'MoveTable':
+        """Crea una tabella da una sequenza di GCodeMove."""
+        if isinstance(moves, MoveTable):
+            return moves
+        builder = MoveTableBuilder()
+        for m in moves:
+            builder.add(m.x, m.y, m.laser_on, m.is_rapid, m.power)
+        return builder.build()
+
+    def columns(self) -> tuple:
+        """Restituisce le colonne nell'ordine di COLUMNS."""
+        return tuple(getattr(self, c[0]) for c in self.COLUMNS)
+
+    # ── Colonne derivate ──────────────────────────────────────────────────────
+    @property
+    def laser_on(self) -> 'np.ndarray':
+        """Maschera booleana dei movimenti con laser acceso."""
+        return (self.flags & FLAG_LASER_ON) != 0
+
+    @property
+    def is_rapid(self) -> 'np.ndarray':
+        """Maschera booleana dei movimenti rapidi (G0)."""
+        return (self.flags & FLAG_RAPID) != 0
+
+    def _cached(self, key: str, compute: Callable):
+        """Valore derivato memorizzato (le colonne sono immutabili)."""
+        if key not in self._memo:
+            self._memo[key] = compute()
+        return self._memo[key]
+
+    def laser_on_count(self) -> int:
+        """Numero di movimenti con laser acceso."""
+        return self._cached("laser_on_count",
+                            lambda: int(np.count_nonzero(self.flags & FLAG_LASER_ON)))
+
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """Restituisce i bounds (min_x, min_y, max_x, max_y)."""
+        def compute():
+            if not len(self.x):
+                return 0, 0, 0, 0
+            return (float(self.x.min()), float(self.y.min()),
+                    float(self.x.max()), float(self.y.max()))
+        return self._cached("bounds", compute)
+
+    def segment_lengths(self) -> 'np.ndarray':
+        """Lunghezza di ogni movimento dal punto precedente (si parte dall'origine)."""
+        return self._cached("segment_lengths", lambda: np.hypot(
+            np.diff(self.x, prepend=0.0), np.diff(self.y, prepend=0.0)))
+
+    def distances(self) -> Tuple[float, float]:
+        """Distanza totale e distanza con laser acceso (mm)."""
+        def compute():
+            dist = self.segment_lengths()
+            return float(dist.sum()), float(dist[self.laser_on].sum())
+        return self._cached("distances", compute)
+
+    def nbytes(self) -> int:
+        """Memoria occupata dalle colonne in byte."""
+        return sum(c.nbytes for c in self.columns())
+
+    # ── Compatibilità con List[GCodeMove] ─────────────────────────────────────
+    def __len__(self) -> int:
+        return len(self.x)
+
+    def __bool__(self) -> bool:
+        return len(self.x) > 0
+
+    def __getitem__(self, idx) -> Union[GCodeMove, 'MoveTable']:
+        if isinstance(idx, slice) or np.ndim(idx):
+            return MoveTable(*(c[idx] for c in self.columns()))
+        f = int(self.flags[idx])
+        return GCodeMove(float(self.x[idx]), float(self.y[idx]),
+                         bool(f & FLAG_LASER_ON), bool(f & FLAG_RAPID),
+                         int(self.power[idx]))
+
+    def __iter__(self) -> Iterator[GCodeMove]:
+        for x, y, f, p in zip(self.x.tolist(), self.y.tolist(),
+                              self.flags.tolist(), self.power.tolist()):
+            yield GCodeMove(x, y, bool(f & FLAG_LASER_ON), bool(f & FLAG_RAPID), p)
+
+    def __repr__(self) -> str:
+        return f"MoveTable({len(self)} movimenti, {self.nbytes() / 1024:.0f} KB)"
+
+
+class MoveTableBuilder:
+    """
+    Accumulatore per costruire una MoveTable movimento per movimento.
+
+    Usa buffer array.array compatti (niente oggetti per riga) e accetta
+    anche blocchi di colonne NumPy già calcolati; build() concatena tutto.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._reset_buffers()
+
+    def _reset_buffers(self):
+        self._x = array('d')
+        self._y = array('d')
+        self._f = array('B')
+        self._p = array('H')
+        self._feed = array('f')
+
+    def _flush(self):
+        if self._x:
+            bufs = (self._x, self._y, self._f, self._p, self._feed)
+            self._chunks.append(tuple(
+                np.frombuffer(b, dtype=c[1])
+                for b, c in zip(bufs, MoveTable.COLUMNS)))
+            self._reset_buffers()
+
+    def add(self, x: float, y: float, laser_on: bool, is_rapid: bool, power: int,
+            feed: float = 0.0):
+        """Aggiunge un singolo movimento."""
+        self._x.append(x)
+        self._y.append(y)
+        self._f.append((FLAG_LASER_ON if laser_on else 0) |
+                       (FLAG_RAPID if is_rapid else 0))
+        self._p.append(min(max(int(power), 0), 0xFFFF))
+        self._feed.append(feed)
+
+    def extend(self, x, y, flags, power, feed=0.0):
+        """Aggiunge un blocco di movimenti come colonne."""
+        self._flush()
+        n = len(x)
+        self._chunks.append(tuple(
+            np.broadcast_to(np.asarray(col, dtype=c[1]), (n,))
+            for col, c in zip((x, y, flags, power, feed), MoveTable.COLUMNS)))
+
+    def extend_table(self, table: MoveTable):
+        """Aggiunge tutti i movimenti di una MoveTable."""
+        self.extend(*table.columns())
+
+    def __len__(self) -> int:
+        return len(self._x) + sum(len(c[0]) for c in self._chunks)
+
+    def build(self) -> MoveTable:
+        """Restituisce la MoveTable con tutti i movimenti accumulati."""
+        self._flush()
+        if not self._chunks:
+            return MoveTable()
+        if len(self._chunks) == 1:
+            return MoveTable(*(np.array(c) for c in self._chunks[0]))
+        cols = [np.concatenate([c[i] for c in self._chunks])
+                for i in range(len(MoveTable.COLUMNS))]
+        return MoveTable(*cols)
+
+
 @dataclass
 class GCodeProgram:
     """Programma GCode completo con metadati."""
-    moves: List[GCodeMove] = field(default_factory=list)
+    moves: MoveTable = field(default_factory=MoveTable)
     raw_lines: List[str] = field(default_factory=list)
     width_mm: float = 0.0
     height_mm: float = 0.0
@@ -77,48 +313,333 @@ class GCodeProgram:
     total_distance_mm: float = 0.0
     laser_on_distance_mm: float = 0.0
     
+    # Programmi aperti in streaming: il testo resta su disco
+    source_file: Optional[str] = None
+    source_line_count: int = 0
+    
+    # Passate multiple: raw_lines (intestazione) + body_lines ripetuto
+    # `passes` volte + footer_lines. Le mosse del corpo sono memorizzate
+    # una sola volta in moves[body_range[0]:body_range[1]].
+    body_lines: List[str] = field(default_factory=list)
+    footer_lines: List[str] = field(default_factory=list)
+    passes: int = 1
+    body_range: Tuple[int, int] = (0, 0)
+    
+    # Parametri di lavoro come segnaposto nel testo ({lp}, {feed}, {passes}):
+    # cambiarli con retemplate() non richiede di rigenerare la geometria
+    power: Optional[int] = None
+    feed: Optional[float] = None
+    power_mask: Optional['np.ndarray'] = None    # movimenti alla potenza {lp}
+
+    def __post_init__(self):
+        # Accetta ancora liste di GCodeMove (codice esistente)
+        if not isinstance(self.moves, MoveTable):
+            self.moves = MoveTable.from_moves(self.moves)
+
     def bounds(self) -> Tuple[float, float, float, float]:
         """Restituisce i bounds (min_x, min_y, max_x, max_y)."""
-        if not self.moves:
-            return 0, 0, 0, 0
-        xs = [m.x for m in self.moves]
-        ys = [m.y for m in self.moves]
-        return min(xs), min(ys), max(xs), max(ys)
+        return self.moves.bounds()
     
-    def translated_lines(self) -> List[str]:
-        """Restituisce le righe GCode con offset applicato."""
-        out = []
-        for line in self.raw_lines:
+    def line_count(self) -> int:
+        """Numero di righe del programma (anche se non caricate in memoria)."""
+        if self.raw_lines or not self.source_file:
+            banner = 2 if self.passes > 1 else 0
+            return (len(self.raw_lines) + len(self.footer_lines) +
+                    self.passes * (len(self.body_lines) + banner))
+        return self.source_line_count
+    
+    def iter_lines(self) -> Iterator[str]:
+        """
+        Righe GCode complete.
+        
+        Le passate vengono espanse solo qui (salvataggio/invio); i file
+        aperti in streaming vengono riletti dal disco a blocchi.
+        """
+        if self.raw_lines or not self.source_file:
+            fill = self._fill_template
+            yield from map(fill, self.raw_lines)
+            for p in range(self.passes):
+                if self.passes > 1:
+                    yield ""
+                    yield f"; --- Passata {p + 1}/{self.passes} ---"
+                yield from map(fill, self.body_lines)
+            yield from map(fill, self.footer_lines)
+            return
+        for chunk in GCodeParser.iter_chunks(self.source_file):
+            yield from chunk.decode('utf-8', errors='replace').splitlines()
+    
+    def _fill_template(self, line: str) -> str:
+        """Sostituisce i segnaposto dei parametri di lavoro in una riga."""
+        if "{" not in line or (self.power is None and self.feed is None):
+            return line
+        if self.power is not None:
+            line = line.replace("{lp}", str(self.power))
+        if self.feed is not None:
+            line = line.replace("{feed}", str(self.feed))
+        return (line.replace("{passes}", str(self.passes))
+                .replace("{ox}", f"{self.offset_x:.3f}")
+                .replace("{oy}", f"{self.offset_y:.3f}"))
+    
+    def retemplate(self, feed: Optional[float] = None, power: Optional[int] = None,
+                   passes: Optional[int] = None, offset_x: Optional[float] = None,
+                   offset_y: Optional[float] = None) -> 'GCodeProgram':
+        """
+        Nuovo programma con altri parametri di lavoro e la stessa geometria.
+        
+        Testo e percorsi sono condivisi: cambiano solo i segnaposto e le
+        colonne potenza/feed della tabella movimenti. Nessuna nuova
+        vettorizzazione né parsing. Le statistiche vengono azzerate: il
+        chiamante le ricalcola con calculate_statistics(), con i propri
+        parametri macchina.
+        
+        Args:
+            feed: Velocità di lavoro (mm/min)
+            power: Potenza di lavoro (solo programmi con segnaposto {lp})
+            passes: Numero di passate
+            offset_x: Offset X
+            offset_y: Offset Y
+        
+        Returns:
+            GCodeProgram aggiornato (None = parametro invariato)
+        """
+        mv = self.moves
+        pw, fd = mv.power, mv.feed
+        if power is not None and self.power is not None and self.power_mask is not None:
+            pw = np.where(self.power_mask, power, pw)
+        else:
+            power = self.power
+        if feed is not None and self.feed is not None:
+            fd = np.where(fd == np.float32(self.feed), feed, fd)
+        else:
+            feed = self.feed
+        if pw is not mv.power or fd is not mv.feed:
+            mv = MoveTable(mv.x, mv.y, mv.flags, pw, fd)
+        
+        return replace(
+            self, moves=mv, power=power, feed=feed,
+            passes=self.passes if passes is None else passes,
+            offset_x=self.offset_x if offset_x is None else offset_x,
+            offset_y=self.offset_y if offset_y is None else offset_y,
+            estimated_time_seconds=0.0, total_distance_mm=0.0, laser_on_distance_mm=0.0)
+    
+    def simplify(self, tolerance: float = 0.0) -> 'GCodeProgram':
+        """
+        Nuovo programma con i segmenti consecutivi uniti dove possibile.
+        
+        Nelle catene di G0/G1 con stessi flag, potenza e velocità (senza
+        altri comandi in mezzo) i punti intermedi vengono eliminati con
+        Douglas-Peucker: con tolerance 0 solo i punti allineati, altrimenti
+        quelli entro `tolerance` mm dal segmento semplificato. Vengono
+        tolte sia le righe di testo sia le righe della tabella movimenti;
+        intestazione, commenti e segnaposto restano invariati.
+        
+        I programmi aperti in streaming (testo su disco) sono restituiti
+        invariati. Le statistiche vengono azzerate: il chiamante le
+        ricalcola con calculate_statistics(feed, machine).
+        
+        Args:
+            tolerance: Scostamento massimo ammesso (mm)
+        
+        Returns:
+            GCodeProgram semplificato
+        """
+        if not self.moves or (self.source_file and not self.raw_lines):
+            return self
+        s, e = self.body_range
+        if self.body_lines or self.footer_lines:
+            parts = [(self.raw_lines, 0, s), (self.body_lines, s, e),
+                     (self.footer_lines, e, len(self.moves))]
+        else:
+            parts = [(self.raw_lines, 0, len(self.moves))]
+        
+        mv = self.moves
+        mask = self.power_mask if self.power_mask is not None else np.zeros(len(mv), dtype=bool)
+        keep = np.ones(len(mv), dtype=bool)
+        new_lines = []
+        interp = GCodeInterpreter()
+        for lines, m0, m1 in parts:
+            move_line, pure = _move_lines(list(map(self._fill_template, lines)), interp)
+            if len(move_line) != m1 - m0:
+                new_lines.append(lines)     # testo non riconducibile ai movimenti
+                continue
+            sl = slice(m0, m1)
+            key = ((mv.flags[sl].astype(np.int64) << 1) | mask[sl])
+            same = ((key[:-1] == key[1:]) & (mv.power[sl][:-1] == mv.power[sl][1:]) &
+                    (mv.feed[sl][:-1] == mv.feed[sl][1:]))
+            joinable = np.zeros(m1 - m0, dtype=bool)
+            joinable[1:-1] = same[1:] & pure[1:-1]
+            k = _simplify_chains(mv.x[sl], mv.y[sl], joinable, tolerance)
+            keep[sl] = k
+            drop = np.zeros(len(lines), dtype=bool)
+            drop[move_line[~k]] = True
+            new_lines.append([l for l, d in zip(lines, drop.tolist()) if not d])
+        if keep.all():
+            return self
+        
+        idx = np.cumsum(keep)
+        body = (int(idx[s - 1]) if s else 0, int(idx[e - 1]) if e else 0)
+        return replace(
+            self, moves=mv[keep], raw_lines=new_lines[0],
+            body_lines=new_lines[1] if len(new_lines) > 1 else self.body_lines,
+            footer_lines=new_lines[2] if len(new_lines) > 2 else self.footer_lines,
+            body_range=body if len(new_lines) > 1 else self.body_range,
+            power_mask=None if self.power_mask is None else self.power_mask[keep],
+            estimated_time_seconds=0.0, total_distance_mm=0.0, laser_on_distance_mm=0.0)
+    
+    def iter_translated_lines(self) -> Iterator[str]:
+        """Come translated_lines(), una riga alla volta."""
+        return self._translate(self.iter_lines())
+    
+    def _translate(self, lines: Iterable[str]) -> Iterator[str]:
+        """Applica l'offset del programma a righe GCode qualsiasi."""
+        for line in lines:
             line = line.strip()
             if line.startswith(";") or not line:
-                out.append(line)
+                yield line
                 continue
             line = _replace_coord(line, "X", self.offset_x)
             line = _replace_coord(line, "Y", self.offset_y)
-            out.append(line)
-        return out
+            yield line
     
-    def calculate_statistics(self, feed_rate: float = 1000.0):
+    def translated_lines(self) -> List[str]:
+        """Restituisce le righe GCode con offset applicato."""
+        return list(self.iter_translated_lines())
+    
+    def iter_output_lines(self, compact: Optional['CompactSettings'] = None,
+                          keep_count: bool = False) -> Iterator[str]:
+        """
+        Righe da salvare o inviare: con offset ed eventualmente compattate.
+        
+        Args:
+            compact: Opzioni di compattazione (None = righe non compattate)
+            keep_count: Con compattazione, mantiene il numero di righe
+                        (le righe omesse diventano vuote)
+        """
+        lines = self.iter_translated_lines()
+        if compact is None:
+            return lines
+        return GCodeCompactor(compact).iter_lines(lines, keep_count)
+    
+    # Righe scritte su disco per ogni blocco di write()
+    WRITE_CHUNK_LINES = 1 << 16
+    # Livello di compressione per i file .gcode.gz
+    GZIP_LEVEL = 6
+    
+    def write(self, filepath: str, compress: Optional[bool] = None,
+              chunk_lines: int = WRITE_CHUNK_LINES,
+              compact: Optional['CompactSettings'] = None) -> int:
+        """
+        Salva il programma (con offset applicato) su file, a blocchi.
+        
+        Le righe vengono prodotte da iter_output_lines() e scritte a
+        blocchi di chunk_lines: il programma completo non viene mai
+        assemblato in memoria. Il file viene scritto in un temporaneo e
+        rinominato solo a scrittura completata.
+        
+        Args:
+            filepath: Percorso del file
+            compress: Scrive in formato gzip (None = automatico per .gz)
+            chunk_lines: Righe per blocco di scrittura
+            compact: Opzioni di compattazione (None = righe non compattate)
+        
+        Returns:
+            Numero di righe scritte
+        """
+        return _write_lines(filepath, self.iter_output_lines(compact), compress,
+                            chunk_lines, self.GZIP_LEVEL)
+    
+    def move_times(self, machine: Optional['MachineSettings'] = None,
+                   feed_rate: float = 1000.0) -> 'np.ndarray':
+        """
+        Tempo stimato (s) di ogni movimento, con accelerazioni e lookahead.
+        
+        Con più passate il corpo compare una volta sola, come in moves.
+        
+        Args:
+            machine: Parametri macchina (None = predefiniti)
+            feed_rate: Velocità per i movimenti senza F (mm/min)
+        """
+        return self.moves._cached(("move_times", machine, feed_rate),
+                                  lambda: estimate_move_times(self.moves, machine, feed_rate))
+    
+    def calculate_statistics(self, feed_rate: float = 1000.0,
+                             machine: Optional['MachineSettings'] = None):
         """
         Calcola statistiche del programma.
         
+        Le passate ripetute vengono conteggiate moltiplicando il corpo,
+        senza espandere la tabella movimenti.
+        
         Args:
             feed_rate: Velocità di avanzamento in mm/min
+            machine: Parametri macchina per la stima tempi (None = predefiniti)
         """
-        self.total_distance_mm = 0.0
-        self.laser_on_distance_mm = 0.0
-        
-        prev_x, prev_y = 0.0, 0.0
-        for move in self.moves:
-            dist = math.sqrt((move.x - prev_x)**2 + (move.y - prev_y)**2)
-            self.total_distance_mm += dist
-            if move.laser_on:
-                self.laser_on_distance_mm += dist
-            prev_x, prev_y = move.x, move.y
+        self.total_distance_mm, self.laser_on_distance_mm = self.moves.distances()
+        times = self.move_times(machine, feed_rate)
+        self.estimated_time_seconds = float(times.sum())
         
-        # Stima tempo (semplificata, non considera accelerazioni)
-        if feed_rate > 0:
-            self.estimated_time_seconds = (self.total_distance_mm / feed_rate) * 60
+        # Passate successive: il corpo riparte dalla propria fine
+        s, e = self.body_range
+        if self.passes > 1 and e > s:
+            mv = self.moves
+            seg = mv.segment_lengths()[s + 1:e]
+            on = mv.laser_on[s + 1:e]
+            link = math.hypot(mv.x[s] - mv.x[e - 1], mv.y[s] - mv.y[e - 1])
+            link_table = MoveTable(mv.x[[e - 1, s]], mv.y[[e - 1, s]],
+                                   mv.flags[[e - 1, s]], mv.power[[e - 1, s]],
+                                   mv.feed[[e - 1, s]])
+            link_time = estimate_move_times(link_table, machine, feed_rate)[1]
+            extra = self.passes - 1
+            self.total_distance_mm += extra * (float(seg.sum()) + link)
+            self.laser_on_distance_mm += extra * (float(seg[on].sum()) +
+                                                  (link if mv.laser_on[s] else 0.0))
+            self.estimated_time_seconds += extra * (float(times[s + 1:e].sum()) + link_time)
+
+
+def _write_lines(filepath: str, lines: Iterable[str], compress: Optional[bool] = None,
+                 chunk_lines: int = GCodeProgram.WRITE_CHUNK_LINES,
+                 level: int = GCodeProgram.GZIP_LEVEL) -> int:
+    """
+    Scrive righe GCode su file a blocchi di chunk_lines, passando per un
+    temporaneo rinominato solo a scrittura completata.
+    
+    Args:
+        filepath: Percorso del file
+        lines: Righe da scrivere (anche un iteratore)
+        compress: Scrive in formato gzip (None = automatico per .gz)
+        chunk_lines: Righe per blocco di scrittura
+        level: Livello di compressione gzip
+    
+    Returns:
+        Numero di righe scritte
+    """
+    if compress is None:
+        compress = filepath.lower().endswith(".gz")
+    tmp = filepath + ".tmp"
+    if compress:
+        f = gzip.open(tmp, "wt", encoding="utf-8", compresslevel=level)
+    else:
+        f = open(tmp, "w", encoding="utf-8")
+    n = 0
+    lines = iter(lines)
+    try:
+        with f:
+            while True:
+                block = list(islice(lines, chunk_lines))
+                if not block:
+                    break
+                if n:
+                    f.write("\n")
+                f.write("\n".join(block))
+                n += len(block)
+        os.replace(tmp, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return n
 
 
 def _replace_coord(line: str, axis: str, offset: float) -> str:
@@ -141,203 +662,2371 @@ def _replace_coord(line: str, axis: str, offset: float) -> str:
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-#  PARSER GCODE
+#  COMPATTAZIONE OUTPUT
 # ══════════════════════════════════════════════════════════════════════════════
-class GCodeParser:
-    """Parser per file GCode esistenti."""
+@dataclass(frozen=True)
+class CompactSettings:
+    """
+    Opzioni di compattazione del GCode in uscita.
     
-    @staticmethod
-    def parse(lines: List[str]) -> List[GCodeMove]:
+    La compattazione di base è sempre attiva: parole modali ripetute,
+    coordinate invariate e zeri decimali finali vengono eliminati.
+    """
+    strip_comments: bool = False    # Rimuove commenti e righe vuote
+    strip_header: bool = False      # Rimuove il blocco di commenti iniziale
+    strip_spaces: bool = False      # Parole senza spazi (G1X10Y5)
+
+
+_WORD_RE = re.compile(r"([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))")
+_WORDS_RE = re.compile(r"(?:[A-Z][-+]?(?:\d+\.?\d*|\.\d+))*")
+_PAREN_COMMENT_RE = re.compile(r"\([^)]*\)")
+
+
+def _trim_number(text: str) -> str:
+    """Forma più corta di un numero: senza '+', zeri decimali finali e '-0'."""
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    text = text.lstrip("+")
+    if text in ("", "-", "-0"):
+        return "0"
+    return text
+
+
+class GCodeCompactor:
+    """
+    Compattatore di righe GCode con stato modale.
+    
+    Elimina solo ciò che il controller ricaverebbe comunque dallo stato
+    modale: G0/G1/G2/G3, G90/G91 ripetuti, F e S invariati, coordinate
+    uguali alla posizione corrente (solo in G90, non negli archi) e zeri
+    decimali finali. I comandi che cambiano origine, unità o posizione
+    (G92, G28, G53, G20, $H...) passano intatti e azzerano lo stato noto,
+    così il programma compattato è equivalente all'originale.
+    """
+    # Comandi G gestiti dallo stato modale
+    MODAL_G = {0.0, 1.0, 2.0, 3.0, 4.0, 17.0, 18.0, 19.0, 90.0, 91.0, 93.0, 94.0}
+    MOTION_G = {0.0, 1.0, 2.0, 3.0}
+    # Comandi che cambiano solo la posizione/origine (riga lasciata intatta);
+    # G20/G21 azzerano anche la velocità se cambiano unità. Tutti gli altri
+    # comandi G azzerano l'intero stato.
+    POSITION_G = {10.0, 28.0, 28.1, 30.0, 30.1, 53.0, 54.0, 55.0, 56.0, 57.0,
+                  58.0, 59.0, 92.0, 92.1}
+    UNITS_G = {20.0, 21.0}
+    AXES = "XYZ"
+    
+    def __init__(self, settings: Optional[CompactSettings] = None):
+        self.settings = settings or CompactSettings()
+        self._in_header = self.settings.strip_header
+        self._reset()
+    
+    def _reset(self):
+        """Stato modale sconosciuto: nessuna parola può essere eliminata."""
+        self.motion: Optional[float] = None
+        self.absolute: Optional[bool] = None
+        self.inverse_time = False
+        self.feed: Optional[float] = None
+        self.power: Optional[float] = None
+        self.units: Optional[float] = None
+        self.pos = dict.fromkeys(self.AXES)
+    
+    def compact(self, line: str) -> Optional[str]:
         """
-        Parsa una lista di righe GCode e restituisce i movimenti.
+        Compatta una riga.
         
         Args:
-            lines: Lista di righe GCode
+            line: Riga GCode
         
         Returns:
-            Lista di GCodeMove
+            Riga compattata, None se la riga può essere omessa
         """
-        moves = []
-        cur_x = cur_y = 0.0
-        laser_on = False
-        mode_g = 0
-        current_power = 0
+        s = self.settings
+        code, sep, comment = line.partition(";")
+        comments = _PAREN_COMMENT_RE.findall(code)
+        if comments:
+            code = _PAREN_COMMENT_RE.sub(" ", code)
+        comment = " ".join(comments + [sep + comment.rstrip()] if sep else comments)
+        if s.strip_comments:
+            comment = ""
+        code = code.strip()
         
-        for line in lines:
-            line = line.strip().upper()
-            if not line or line.startswith(";"):
-                continue
-            
-            # Rimuovi commenti inline
-            if ";" in line:
-                line = line[:line.index(";")]
-            
-            # Controlla comandi laser
-            if "M3" in line:
-                laser_on = True
-                # Estrai potenza S se presente
-                s_match = re.search(r"S(\d+)", line)
-                if s_match:
-                    current_power = int(s_match.group(1))
-            if "M5" in line:
-                laser_on = False
-                current_power = 0
-            
-            # Controlla modalità movimento
-            if re.search(r"\bG0\b", line):
-                mode_g = 0
-            if re.search(r"\bG1\b", line):
-                mode_g = 1
-            
-            # Estrai coordinate
-            mx = re.search(r"X([-+]?\d*\.?\d+)", line)
-            my = re.search(r"Y([-+]?\d*\.?\d+)", line)
-            
-            if mx or my:
-                new_x = float(mx.group(1)) if mx else cur_x
-                new_y = float(my.group(1)) if my else cur_y
-                moves.append(GCodeMove(
-                    x=new_x,
-                    y=new_y,
-                    laser_on=laser_on,
-                    is_rapid=(mode_g == 0),
-                    power=current_power
-                ))
-                cur_x, cur_y = new_x, new_y
-        
-        return moves
+        if self._in_header:
+            if not code:
+                return None
+            self._in_header = False
+        if not code:
+            if comment or not s.strip_comments:
+                return comment
+            return None
+        
+        words = code.upper().replace(" ", "").replace("\t", "")
+        if not _WORDS_RE.fullmatch(words):
+            # Comandi di sistema ($H, $X...) o sintassi non gestita
+            self._reset()
+            return f"{code} {comment}" if comment else code
+        
+        out = self._compact_words([(l, v, float(v)) for l, v in _WORD_RE.findall(words)])
+        code = ("" if s.strip_spaces else " ").join(out)
+        if comment:
+            return f"{code} {comment}" if code else comment
+        return code or None
     
-    @staticmethod
-    def parse_file(filepath: str) -> GCodeProgram:
-        """
-        Parsa un file GCode completo.
+    def _compact_words(self, words: List[Tuple[str, str, float]]) -> List[str]:
+        """Parole da mantenere di una riga già suddivisa (lettera, testo, valore)."""
+        gs = [v for l, _, v in words if l == "G"]
+        special = [g for g in gs if g not in self.MODAL_G]
+        if special or any(l == "M" and v in (2.0, 30.0) for l, _, v in words):
+            return self._keep_words(words, gs, special)
         
-        Args:
-            filepath: Percorso del file
+        # Modi del blocco (G90/G91, G93/G94, movimento) valgono per tutta la riga
+        absolute, inverse_time, motion = self.absolute, self.inverse_time, self.motion
+        for g in gs:
+            if g in (90.0, 91.0):
+                absolute = g == 90.0
+            elif g in (93.0, 94.0):
+                inverse_time = g == 93.0
+            elif g in self.MOTION_G:
+                motion = g
+        arc = motion in (2.0, 3.0)
+        moving = any(l in self.AXES for l, _, _ in words)
         
-        Returns:
-            GCodeProgram
-        """
-        with open(filepath, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        out = []
+        for l, t, v in words:
+            if l == "G":
+                if v in self.MOTION_G:
+                    if v == self.motion:
+                        continue
+                elif v in (90.0, 91.0):
+                    if self.absolute is not None and (v == 90.0) == self.absolute:
+                        continue
+                elif v in (93.0, 94.0):
+                    if (v == 93.0) == self.inverse_time:
+                        continue
+            elif l in self.AXES:
+                if absolute and not arc and motion is not None and self.pos[l] == v:
+                    continue
+            elif l == "F":
+                if not inverse_time and self.feed == v:
+                    continue
+            elif l == "S":
+                if self.power == v:
+                    continue
+            out.append(l + _trim_number(t))
         
-        prog = GCodeProgram()
-        prog.raw_lines = [l.rstrip('\n') for l in lines]
-        prog.moves = GCodeParser.parse(prog.raw_lines)
+        # Aggiorna lo stato
+        self.absolute, self.inverse_time, self.motion = absolute, inverse_time, motion
+        for l, _, v in words:
+            if l == "F":
+                self.feed = v
+            elif l == "S":
+                self.power = v
+            elif l in self.AXES and moving:
+                if absolute:
+                    self.pos[l] = v
+                elif self.pos[l] is not None:
+                    self.pos[l] += v
+        if moving and (absolute is None or motion is None):
+            self.pos = dict.fromkeys(self.AXES)
+        return out
+    
+    def _keep_words(self, words: List[Tuple[str, str, float]], gs: List[float],
+                    special: List[float]) -> List[str]:
+        """Riga con comandi speciali: parole intatte, stato aggiornato o azzerato."""
+        if (any(g not in self.POSITION_G and g not in self.UNITS_G for g in special) or
+                any(l == "M" and v in (2.0, 30.0) for l, _, v in words)):
+            self._reset()
+        else:
+            for g in gs:
+                if g in (90.0, 91.0):
+                    self.absolute = g == 90.0
+                elif g in (93.0, 94.0):
+                    self.inverse_time = g == 93.0
+                elif g in self.MOTION_G:
+                    self.motion = g
+                elif g in self.UNITS_G:
+                    if g != self.units:
+                        self.feed = None
+                    self.units = g
+            for l, _, v in words:
+                if l == "F":
+                    self.feed = v
+                elif l == "S":
+                    self.power = v
+            self.pos = dict.fromkeys(self.AXES)
+        return [l + _trim_number(t) for l, t, _ in words]
+    
+    def iter_lines(self, lines: Iterable[str], keep_count: bool = False) -> Iterator[str]:
+        """
+        Compatta una sequenza di righe.
         
-        if prog.moves:
-            mn_x, mn_y, mx_x, mx_y = prog.bounds()
-            prog.width_mm = mx_x - mn_x
-            prog.height_mm = mx_y - mn_y
+        Args:
+            lines: Righe GCode
+            keep_count: Le righe omesse diventano righe vuote (stesso numero
+                        di righe, per il progresso dell'invio)
         
-        return prog
+        Yields:
+            Righe compattate
+        """
+        for line in lines:
+            line = self.compact(line)
+            if line is not None:
+                yield line
+            elif keep_count:
+                yield ""
 
 
 # ══════════════════════════════════════════════════════════════════════════════
-#  GENERATORE GCODE DA VETTORI
+#  SEMPLIFICAZIONE PERCORSI
 # ══════════════════════════════════════════════════════════════════════════════
-class VectorGCodeGenerator:
+# Scostamento sotto cui tre punti sono considerati allineati (mm)
+COLLINEAR_EPS = 1e-6
+
+
+def _move_lines(lines: List[str], interp: 'GCodeInterpreter') -> Tuple['np.ndarray', 'np.ndarray']:
     """
-    Generatore GCode da percorsi vettoriali.
-    Usato con: contorni, centerline, raster vettoriale, hatching.
+    Righe di testo che generano i movimenti.
+    
+    Args:
+        lines: Righe GCode
+        interp: Interprete con lo stato modale all'inizio delle righe
+                (viene fatto avanzare fino alla loro fine)
+    
+    Returns:
+        (move_line, pure): indice riga di ogni movimento (più movimenti per
+        gli archi) e maschera dei movimenti eliminabili (riga con sole
+        parole G0/G1, X, Y, in G90, seguita direttamente da un G0/G1)
     """
+    motion0, relative0 = interp.motion, interp.relative
+    text = "\n".join(lines).encode("utf-8", errors="replace")
+    _, move_line = interp.feed_lines(text)
+    line, letter, value = _tokenize(text)
+    n = len(lines)
+    G, X, Y = ord("G"), ord("X"), ord("Y")
+    is_g = letter == G
     
-    def __init__(self, feed: int = 1000, power: int = 200, passes: int = 1):
-        """
-        Inizializza il generatore vettoriale.
-        
-        Args:
-            feed: Velocità di avanzamento (mm/min)
-            power: Potenza laser (0-255)
-            passes: Numero di passate
-        """
-        self.feed = feed
-        self.power = power
-        self.passes = passes
-        self.rapid_feed = 3000  # Velocità movimenti rapidi
+    # Solo G0/G1 + X/Y: nessun effetto oltre al punto stesso
+    other = ~((letter == X) | (letter == Y) | (is_g & ((value == 0) | (value == 1))))
+    impure = np.zeros(n, dtype=bool)
+    impure[line[other]] = True
+    gdist = is_g & ((value == 90) | (value == 91))
+    relative = _ffill(n, line[gdist], (value[gdist] == 91).astype(float), float(relative0)) > 0
+    gmot = is_g & np.isin(value, (0, 1, 2, 3))
+    arc = _ffill(n, line[gmot], value[gmot], motion0) >= 2
+    # Un G0/G1 esplicito non si può togliere se la riga successiva lo eredita
+    explicit = np.zeros(n, dtype=bool)
+    explicit[line[is_g]] = True
     
-    def build(self, path_lines: List[str], 
-              offset_x: float = 0.0, 
-              offset_y: float = 0.0,
-              header_comment: str = "") -> GCodeProgram:
-        """
-        Costruisce un programma GCode da linee di percorso vettoriale.
-        
-        Args:
-            path_lines: Lista di comandi GCode base (G0, G1, M3, M5)
-            offset_x: Offset X da applicare
-            offset_y: Offset Y da applicare
-            header_comment: Commento opzionale per l'header
-        
-        Returns:
-            GCodeProgram completo
-        """
-        # Sostituisci placeholder potenza
-        resolved = [l.replace("{lp}", str(self.power)) for l in path_lines]
-        
-        # Costruisci header
-        raw = [
-            f"; PyLaser v{APP_VERSION}",
-            f"; Source: VECTOR",
-            f"; Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}",
-            f"; Feed: {self.feed} mm/min",
-            f"; Power: {self.power}",
-            f"; Passes: {self.passes}",
-            f"; Offset: X={offset_x:.3f} Y={offset_y:.3f}",
-        ]
+    # Righe con codice consecutive (commenti e righe vuote non contano)
+    code = np.zeros(n, dtype=bool)
+    code[line] = True
+    rank = np.cumsum(code)[move_line]
+    
+    pure = ~impure[move_line] & ~relative[move_line] & ~arc[move_line]
+    pure[:-1] &= ((rank[1:] - rank[:-1] == 1) & ~arc[move_line[1:]] &
+                  (~explicit[move_line[:-1]] | explicit[move_line[1:]]))
+    if len(pure):
+        pure[-1] = False
+    return move_line, pure
+
+
+def _simplify_chains(x: 'np.ndarray', y: 'np.ndarray', joinable: 'np.ndarray',
+                     tolerance: float) -> 'np.ndarray':
+    """
+    Douglas-Peucker vettoriale su tutte le catene di punti insieme.
+    
+    Ogni catena è una sequenza massimale di punti eliminabili, chiusa dai
+    due punti fissi adiacenti. A ogni iterazione tutti gli intervalli aperti
+    vengono elaborati in blocco: si cerca il punto più lontano dal segmento
+    (distanza dal segmento, non dalla retta, così i ritorni indietro non
+    vengono persi) e l'intervallo viene diviso se supera la tolleranza.
+    
+    Args:
+        x, y: Coordinate dei punti
+        joinable: Punti che possono essere eliminati
+        tolerance: Scostamento massimo (mm)
+    
+    Returns:
+        Maschera dei punti da mantenere
+    """
+    keep = ~joinable
+    if not joinable.any():
+        return keep
+    tol = max(tolerance, COLLINEAR_EPS)
+    
+    # Catene: [a, b] con a, b fissi e tutti i punti interni eliminabili
+    edges = np.diff(joinable.view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    a = np.flatnonzero(edges == 1) - 1
+    b = np.flatnonzero(edges == -1)
+    
+    while len(a):
+        count = b - a - 1
+        pos = np.repeat(np.cumsum(count) - count, count)
+        idx = np.arange(count.sum()) - pos + np.repeat(a + 1, count)
+        seg = np.repeat(np.arange(len(a)), count)
         
-        if header_comment:
-            raw.append(f"; {header_comment}")
+        # Distanza punto-segmento
+        ax, ay = x[a][seg], y[a][seg]
+        dx, dy = x[b][seg] - ax, y[b][seg] - ay
+        px, py = x[idx] - ax, y[idx] - ay
+        den = dx * dx + dy * dy
+        t = np.clip(np.divide(px * dx + py * dy, den, out=np.zeros_like(den), where=den > 0), 0, 1)
+        d = np.hypot(px - t * dx, py - t * dy)
         
-        raw.extend([
-            "",
-            "; === INIZIALIZZAZIONE ===",
-            "G21          ; Unità: millimetri",
-            "G90          ; Coordinate assolute",
-            "G92 X0 Y0    ; Imposta origine",
-            f"F{self.feed}       ; Velocità di lavoro",
-            "M5           ; Laser OFF (sicurezza)",
-            "",
-            "; === INIZIO PERCORSO ===",
-        ])
-        
-        # Aggiungi percorsi per ogni passata
-        for p in range(self.passes):
-            if self.passes > 1:
-                raw.append(f"")
-                raw.append(f"; --- Passata {p + 1}/{self.passes} ---")
-            raw.extend(resolved)
-        
-        # Footer
-        raw.extend([
-            "",
-            "; === FINE ===",
-            "M5           ; Laser OFF",
-            "G0 X0 Y0     ; Torna a home",
-            "M2           ; Fine programma",
-        ])
+        dmax = np.maximum.reduceat(d, np.cumsum(count) - count)
+        first = np.flatnonzero(d == dmax[seg])
+        first = first[np.unique(seg[first], return_index=True)[1]]
+        split = dmax > tol
+        k = idx[first][split]
+        keep[k] = True
+        a, b = np.concatenate((a[split], k)), np.concatenate((k, b[split]))
+        open_ = b - a > 1
+        a, b = a[open_], b[open_]
+    return keep
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  ARCHI (G2/G3)
+# ══════════════════════════════════════════════════════════════════════════════
+# Errore di corda con cui gli archi diventano segmenti nella tabella
+# movimenti (mm): anteprima, statistiche e stima tempi li vedono così,
+# come il controller che li esegue a segmenti ($12 di GRBL)
+ARC_SEGMENT_TOLERANCE = 0.01
+# Sotto questo angolo (rad) inizio e fine coincidono: cerchio completo
+ARC_ANGLE_EPS = 5e-7
+# Arc fitting: punti minimi per arco e raggio massimo (oltre è un rettilineo)
+ARC_MIN_POINTS = 4
+ARC_MAX_RADIUS = 1000.0
+
+
+def _arc_sweep(sx, sy, ex, ey, cx, cy, cw) -> 'np.ndarray':
+    """Angolo percorso (rad, negativo in senso orario) come lo calcola GRBL."""
+    rx0, ry0 = sx - cx, sy - cy
+    rx1, ry1 = ex - cx, ey - cy
+    sweep = np.arctan2(rx0 * ry1 - ry0 * rx1, rx0 * rx1 + ry0 * ry1)
+    return np.where(cw, np.where(sweep >= -ARC_ANGLE_EPS, sweep - 2 * np.pi, sweep),
+                    np.where(sweep <= ARC_ANGLE_EPS, sweep + 2 * np.pi, sweep))
+
+
+def _arc_center_from_radius(sx, sy, ex, ey, r, cw) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Centro di archi in formato R (GRBL): R negativo = arco oltre 180°.
+    
+    Returns:
+        (cx, cy)
+    """
+    dx, dy = ex - sx, ey - sy
+    d = np.hypot(dx, dy)
+    h = -np.sqrt(np.maximum(4 * r * r - d * d, 0.0)) / np.where(d > 0, d, 1.0)
+    h = np.where(cw, h, -h)
+    h = np.where(r < 0, -h, h)
+    return sx + 0.5 * (dx - dy * h), sy + 0.5 * (dy + dx * h)
+
+
+def _expand_arcs(sx, sy, ex, ey, cx, cy, cw,
+                 tolerance: float = ARC_SEGMENT_TOLERANCE) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """
+    Suddivide archi G2/G3 in segmenti entro l'errore di corda indicato.
+    
+    Tutti gli archi vengono elaborati insieme; l'ultimo punto di ogni arco
+    è esattamente la destinazione programmata.
+    
+    Args:
+        sx, sy: Punti iniziali
+        ex, ey: Punti finali
+        cx, cy: Centri
+        cw: True per G2 (orario)
+        tolerance: Errore di corda massimo (mm)
+    
+    Returns:
+        (count, px, py): segmenti per arco e punti concatenati
+    """
+    r = np.hypot(sx - cx, sy - cy)
+    sweep = _arc_sweep(sx, sy, ex, ey, cx, cy, cw)
+    step = 2 * np.arccos(np.clip(1 - tolerance / np.maximum(r, 1e-12), -1.0, 1.0))
+    count = np.where(r > tolerance, np.ceil(np.abs(sweep) / step), 1).astype(np.int64)
+    count = np.maximum(count, 1)
+    
+    arc = np.repeat(np.arange(len(count)), count)
+    k = np.arange(int(count.sum())) - np.repeat(np.cumsum(count) - count, count) + 1
+    theta = np.arctan2(sy - cy, sx - cx)[arc] + sweep[arc] * k / count[arc]
+    px = cx[arc] + r[arc] * np.cos(theta)
+    py = cy[arc] + r[arc] * np.sin(theta)
+    last = np.cumsum(count) - 1
+    px[last] = ex
+    py[last] = ey
+    return count, px, py
+
+
+def _fit_arc(pts: 'np.ndarray', s: int, e: int, tolerance: float) -> Optional[Tuple[float, float, bool]]:
+    """
+    Arco per i punti pts[s..e], se esiste entro la tolleranza.
+    
+    Il cerchio passa per il primo, il punto centrale e l'ultimo; tutti i
+    punti devono distare dal cerchio meno della tolleranza, avanzare nello
+    stesso verso senza compiere un giro completo (sono ammessi piccoli
+    ritorni entro la tolleranza, tipici delle catene di pixel), e le
+    corde originali non devono scostarsi dall'arco più della tolleranza.
+    
+    Returns:
+        (cx, cy, cw) oppure None
+    """
+    ax, ay = pts[s]
+    bx, by = pts[(s + e) // 2] - pts[s]
+    qx, qy = pts[e] - pts[s]
+    d = 2.0 * (bx * qy - by * qx)
+    if abs(d) < 1e-12:
+        return None
+    b2, q2 = bx * bx + by * by, qx * qx + qy * qy
+    ux, uy = (qy * b2 - by * q2) / d, (bx * q2 - qx * b2) / d
+    r = math.hypot(ux, uy)
+    if r > ARC_MAX_RADIUS or r < 2 * tolerance:
+        return None
+    
+    rel = pts[s:e + 1] - (ax + ux, ay + uy)
+    if np.abs(np.hypot(rel[:, 0], rel[:, 1]) - r).max() > tolerance:
+        return None
+    dth = np.arctan2(rel[:-1, 0] * rel[1:, 1] - rel[:-1, 1] * rel[1:, 0],
+                     rel[:-1, 0] * rel[1:, 0] + rel[:-1, 1] * rel[1:, 1])
+    sweep = dth.sum()
+    if sweep == 0 or abs(sweep) >= 2 * np.pi - 1e-3:
+        return None
+    back = dth * sweep < 0
+    if back.any() and np.abs(dth[back]).max() * r > 2 * tolerance:
+        return None
+    if r * (1 - math.cos(np.abs(dth).max() / 2)) > tolerance:
+        return None
+    return ax + ux, ay + uy, bool(sweep < 0)
+
+
+def fit_arcs(points: 'np.ndarray', tolerance: float) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """
+    Sostituisce sequenze di punti con archi G2/G3 (arc fitting).
+    
+    Da ogni punto l'arco viene esteso il più possibile: prima raddoppiando
+    la lunghezza, poi con una ricerca binaria sull'ultimo punto valido.
+    I punti mantenuti sono estremi di archi o di segmenti rettilinei.
+    
+    Args:
+        points: Array Nx2 del percorso (mm)
+        tolerance: Scostamento massimo dal percorso originale (mm)
+    
+    Returns:
+        (keep, kind, center): indici dei punti mantenuti; per ognuno il
+        tipo di movimento che lo raggiunge (0 = G1, 2 = G2, 3 = G3) e il
+        centro dell'arco (Kx2)
+    """
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(pts)
+    keep, kind, center = [0], [0], [(0.0, 0.0)]
+    s = 0
+    while s < n - 1:
+        e = s + ARC_MIN_POINTS - 1
+        fit = _fit_arc(pts, s, e, tolerance) if e < n else None
+        if fit is None:
+            s += 1
+            keep.append(s)
+            kind.append(0)
+            center.append((0.0, 0.0))
+            continue
+        # Estensione: raddoppio, poi ricerca binaria tra valido e non valido
+        good, bad = e, None
+        while bad is None:
+            nxt = min(s + 2 * (good - s), n - 1)
+            if nxt == good:
+                break
+            f = _fit_arc(pts, s, nxt, tolerance)
+            if f is None:
+                bad = nxt
+            else:
+                good, fit = nxt, f
+        while bad is not None and bad - good > 1:
+            mid = (good + bad) // 2
+            f = _fit_arc(pts, s, mid, tolerance)
+            if f is None:
+                bad = mid
+            else:
+                good, fit = mid, f
+        cx, cy, cw = fit
+        s = good
+        keep.append(s)
+        kind.append(2 if cw else 3)
+        center.append((cx, cy))
+    return np.array(keep), np.array(kind), np.array(center)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  ORDINAMENTO PERCORSI
+# ══════════════════════════════════════════════════════════════════════════════
+# Punti d'ingresso valutati per ogni percorso chiuso durante l'ordinamento
+# (la giunzione definitiva viene poi scelta tra tutti i vertici)
+ORDER_SEAM_CANDIDATES = 8
+# 2-opt: lunghezza massima dei tratti invertiti e numero massimo di passate
+ORDER_2OPT_WINDOW = 48
+ORDER_2OPT_PASSES = 8
+
+
+def _grid_nearest_order(cand: 'np.ndarray', cand_start: 'np.ndarray',
+                        origin: complex) -> Tuple[List[int], List[int]]:
+    """
+    Ordine di visita greedy (vicino più prossimo) su griglia uniforme.
+    
+    I candidati di un percorso escono dalle celle appena viene visitato;
+    la griglia viene ricostruita (con celle più grandi) ogni volta che
+    metà dei percorsi indicizzati è stata visitata.
+    
+    Args:
+        cand: Punti d'ingresso candidati (complessi x + iy)
+        cand_start: Primo candidato di ogni percorso (più il totale in coda)
+        origin: Posizione iniziale della testa
+    
+    Returns:
+        (order, pick): percorsi in ordine di visita e candidato d'ingresso
+    """
+    n_paths = len(cand_start) - 1
+    cand_path = np.repeat(np.arange(n_paths), np.diff(cand_start))
+    owner = cand_path.tolist()
+    start = cand_start.tolist()
+    cx_all, cy_all = cand.real.tolist(), cand.imag.tolist()
+    visited = np.zeros(n_paths, dtype=bool)
+    order, pick = [], []
+    px, py = origin.real, origin.imag
+    
+    while len(order) < n_paths:
+        # (Ri)costruzione della griglia sui candidati ancora validi
+        idx = np.flatnonzero(~visited[cand_path])
+        x, y = cand.real[idx], cand.imag[idx]
+        x0, y0 = x.min(), y.min()
+        w, h = x.max() - x0, y.max() - y0
+        size = max(math.sqrt(w * h / len(idx)) * 1.5, max(w, h) / len(idx), 1e-6)
+        nx, ny = int(w / size) + 1, int(h / size) + 1
+        key = (np.minimum(((x - x0) / size).astype(np.int64), nx - 1) * ny +
+               np.minimum(((y - y0) / size).astype(np.int64), ny - 1))
+        cells = [[] for _ in range(nx * ny)]
+        cell_of = np.zeros(len(cand), dtype=np.int64)
+        cell_of[idx] = key
+        for c, k in zip(idx.tolist(), key.tolist()):
+            cells[k].append(c)
+        cell_of = cell_of.tolist()
+        rebuild = len(order) + max((n_paths - len(order)) // 2, 1)
+        
+        while len(order) < rebuild:
+            ix, iy = math.floor((px - x0) / size), math.floor((py - y0) / size)
+            r = max(0, -ix, ix - nx + 1, -iy, iy - ny + 1)
+            best, best_d = -1, math.inf
+            while True:
+                xa, xb = max(ix - r, 0), min(ix + r, nx - 1) + 1
+                ya, yb = max(iy - r + 1, 0), min(iy + r - 1, ny - 1) + 1
+                ring = []
+                if 0 <= iy - r < ny:
+                    ring.extend(range(xa * ny + iy - r, xb * ny + iy - r, ny))
+                if r and 0 <= iy + r < ny:
+                    ring.extend(range(xa * ny + iy + r, xb * ny + iy + r, ny))
+                if r and 0 <= ix - r < nx:
+                    ring.extend(range((ix - r) * ny + ya, (ix - r) * ny + yb))
+                if r and 0 <= ix + r < nx:
+                    ring.extend(range((ix + r) * ny + ya, (ix + r) * ny + yb))
+                for k in ring:
+                    for c in cells[k]:
+                        dx, dy = cx_all[c] - px, cy_all[c] - py
+                        d = dx * dx + dy * dy
+                        if d < best_d:
+                            best, best_d = c, d
+                # I candidati oltre l'anello r distano almeno r celle
+                if best >= 0 and best_d <= (r * size) ** 2:
+                    break
+                r += 1
+            p = owner[best]
+            for c in range(start[p], start[p + 1]):
+                cells[cell_of[c]].remove(c)
+            visited[p] = True
+            order.append(p)
+            pick.append(best)
+            px, py = cx_all[best], cy_all[best]
+    return order, pick
+
+
+def _two_opt(entry: 'np.ndarray', exit_: 'np.ndarray', reverse: 'np.ndarray',
+             is_open: 'np.ndarray', order: 'np.ndarray', origin: complex):
+    """
+    Raffinamento 2-opt dell'ordine dei percorsi (in place).
+    
+    Invertire il tratto [i, k] della sequenza scambia ingresso e uscita
+    dei suoi percorsi (i percorsi aperti vengono percorsi al contrario);
+    con k = i si valuta la sola inversione di un percorso. Per ogni
+    lunghezza di tratto tutte le posizioni vengono valutate insieme con
+    NumPy e applicate le inversioni migliorative che non si sovrappongono.
+    """
+    n = len(order)
+    for _ in range(ORDER_2OPT_PASSES):
+        improved = False
+        for w in range(min(ORDER_2OPT_WINDOW, n)):
+            # Tratti [i, i + w]: uscita precedente e ingresso successivo
+            prev = np.concatenate(([origin], exit_[:n - w - 1]))
+            first, end = entry[:n - w], exit_[w:]
+            delta = np.abs(prev - end) - np.abs(prev - first)
+            delta[:-1] += np.abs(first[:-1] - entry[w + 1:]) - np.abs(end[:-1] - entry[w + 1:])
+            last = -2
+            for a in np.flatnonzero(delta < -1e-9).tolist():
+                if a <= last + 1:
+                    continue
+                s = slice(a, a + w + 1)
+                entry[s], exit_[s] = exit_[s][::-1].copy(), entry[s][::-1].copy()
+                reverse[s] = (reverse[s] ^ is_open[s])[::-1]
+                is_open[s] = is_open[s][::-1]
+                order[s] = order[s][::-1]
+                last = a + w
+                improved = True
+        if not improved:
+            break
+
+
+def order_paths(paths: List[Polyline],
+                origin: Tuple[float, float] = (0.0, 0.0)) -> Tuple[List[Polyline], float, float]:
+    """
+    Riordina i percorsi per ridurre i movimenti rapidi (G0) tra un
+    percorso e l'altro.
+    
+    1. Vicino più prossimo su griglia uniforme, con ingresso da entrambi
+       gli estremi dei percorsi aperti e da più vertici di quelli chiusi
+    2. Raffinamento 2-opt (che include l'inversione dei percorsi aperti)
+    3. Giunzione dei percorsi chiusi sul vertice più vicino alla
+       posizione di arrivo
+    
+    Args:
+        paths: Lista di Polyline (ordine del Vectorizer)
+        origin: Posizione della testa all'inizio del lavoro
+    
+    Returns:
+        (paths, before, after): percorsi riordinati e lunghezza totale dei
+        rapidi prima e dopo (mm). Se l'ordine originale è già migliore
+        viene restituito invariato.
+    """
+    paths = [pl for pl in paths if len(pl.points)]
+    if not NUMPY_AVAILABLE or len(paths) < 2:
+        return paths, 0.0, 0.0
+    points = [np.asarray(pl.points, dtype=np.float64).reshape(-1, 2) for pl in paths]
+    n = len(paths)
+    L = np.array([len(p) for p in points])
+    allp = np.concatenate(points)
+    allp = allp[:, 0] + 1j * allp[:, 1]
+    offset = np.cumsum(L) - L
+    firsts, lasts = allp[offset], allp[offset + L - 1]
+    closed = np.array([pl.closed for pl in paths]) & (L > 2) & (firsts == lasts)
+    home = complex(*origin)
+    
+    def rapids(entry, exit_):
+        return float(np.abs(entry - np.concatenate(([home], exit_[:-1]))).sum())
+    
+    before = rapids(firsts, lasts)
+    
+    # Candidati d'ingresso: estremi dei percorsi aperti, vertici campionati
+    # dei percorsi chiusi
+    n_cand = np.where(closed, np.minimum(L - 1, ORDER_SEAM_CANDIDATES),
+                      np.where(L > 1, 2, 1))
+    cand_start = np.concatenate(([0], np.cumsum(n_cand)))
+    cand_path = np.repeat(np.arange(n), n_cand)
+    j = np.arange(cand_start[-1]) - cand_start[cand_path]
+    span = (L - 1)[cand_path]
+    vertex = np.where(closed[cand_path], j * span // n_cand[cand_path], j * span)
+    cand = allp[offset[cand_path] + vertex]
+    
+    order, pick = _grid_nearest_order(cand, cand_start, home)
+    order = np.array(order)
+    pick = np.array(pick)
+    
+    is_open = ~closed[order]
+    reverse = is_open & (vertex[pick] > 0)
+    entry = cand[pick]
+    exit_ = np.where(closed[order], entry, np.where(reverse, firsts[order], lasts[order]))
+    _two_opt(entry, exit_, reverse, is_open, order, home)
+    
+    # Giunzione dei percorsi chiusi e costruzione del risultato
+    result = []
+    px, py = origin
+    after = 0.0
+    for p, rev in zip(order.tolist(), reverse.tolist()):
+        pts = points[p]
+        if closed[p]:
+            v = int(np.argmin((pts[:-1, 0] - px) ** 2 + (pts[:-1, 1] - py) ** 2))
+            if v:
+                pts = np.concatenate((pts[v:-1], pts[:v + 1]))
+        elif rev:
+            pts = pts[::-1]
+        after += math.hypot(pts[0, 0] - px, pts[0, 1] - py)
+        px, py = pts[-1]
+        result.append(replace(paths[p], points=pts) if pts is not points[p] else paths[p])
+    if after >= before:
+        return paths, before, before
+    return result, before, after
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  STIMA TEMPI (PLANNER GRBL)
+# ══════════════════════════════════════════════════════════════════════════════
+@dataclass(frozen=True)
+class MachineSettings:
+    """
+    Parametri cinematici della macchina, come le impostazioni GRBL.
+    
+    I valori predefiniti sono quelli tipici di un laser a diodo; con
+    from_grbl() si usano quelli letti dal controller con $$.
+    """
+    max_rate_x: float = 6000.0          # $110 velocità massima X (mm/min)
+    max_rate_y: float = 6000.0          # $111 velocità massima Y (mm/min)
+    accel_x: float = 1000.0             # $120 accelerazione X (mm/s²)
+    accel_y: float = 1000.0             # $121 accelerazione Y (mm/s²)
+    junction_deviation: float = 0.01    # $11 (mm)
+    laser_mode: bool = True             # $32: S/M3/M5 non fermano il movimento
+    planner_blocks: int = 16            # Blocchi nel buffer del planner (lookahead)
+    
+    @classmethod
+    def from_grbl(cls, settings: dict) -> 'MachineSettings':
+        """
+        Crea i parametri dalle impostazioni GRBL.
+        
+        Args:
+            settings: Dizionario {numero: valore}, es. {110: 5000.0, 120: 800.0}
+        
+        Returns:
+            MachineSettings (i valori mancanti restano predefiniti)
+        """
+        kwargs = {}
+        for num, name in ((110, "max_rate_x"), (111, "max_rate_y"),
+                          (120, "accel_x"), (121, "accel_y"),
+                          (11, "junction_deviation")):
+            if num in settings and settings[num] > 0:
+                kwargs[name] = float(settings[num])
+        if 32 in settings:
+            kwargs["laser_mode"] = bool(settings[32])
+        return cls(**kwargs)
+
+
+# Velocità minima alle giunzioni (GRBL MINIMUM_JUNCTION_SPEED, mm/s)
+_MIN_JUNCTION_SPEED = 0.0
+
+
+def _axis_limit(limit_x: float, limit_y: float, ux: 'np.ndarray', uy: 'np.ndarray') -> 'np.ndarray':
+    """Limite lungo la direzione (ux, uy) dati i limiti per asse (limit_value_by_axis_maximum)."""
+    ux, uy = np.abs(ux), np.abs(uy)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lx = np.where(ux > 0, limit_x / ux, np.inf)
+        ly = np.where(uy > 0, limit_y / uy, np.inf)
+    return np.minimum(lx, ly)
+
+
+def estimate_move_times(moves: MoveTable, machine: Optional[MachineSettings] = None,
+                        default_feed: float = 1000.0) -> 'np.ndarray':
+    """
+    Stima il tempo di ogni movimento con il modello del planner GRBL.
+    
+    Profilo trapezoidale per blocco con accelerazione e velocità limitate
+    per asse, velocità alle giunzioni da junction deviation ($11) e
+    lookahead limitato al buffer del planner. I passaggi all'indietro e in
+    avanti del planner sono minimi cumulativi su somme prefisse (in v²),
+    quindi l'intero calcolo è vettoriale.
+    
+    Args:
+        moves: Tabella movimenti
+        machine: Parametri macchina (None = predefiniti)
+        default_feed: Velocità (mm/min) per movimenti senza F
+    
+    Returns:
+        Array con il tempo in secondi di ogni movimento
+    """
+    machine = machine or MachineSettings()
+    times = np.zeros(len(moves))
+    dist = moves.segment_lengths()
+    # I movimenti nulli non entrano nel planner
+    blk = np.flatnonzero(dist > 1e-9)
+    m = len(blk)
+    if not m:
+        return times
+    
+    d = dist[blk]
+    ux = np.diff(moves.x, prepend=0.0)[blk] / d
+    uy = np.diff(moves.y, prepend=0.0)[blk] / d
+    
+    # Velocità nominale (mm/s) e accelerazione lungo ogni blocco
+    vmax = _axis_limit(machine.max_rate_x / 60, machine.max_rate_y / 60, ux, uy)
+    feed = moves.feed[blk].astype(np.float64)
+    feed = np.where(feed > 0, feed, default_feed) / 60
+    vn = np.where(moves.is_rapid[blk] | (feed <= 0), vmax, np.minimum(feed, vmax))
+    vn2 = vn * vn
+    acc = _axis_limit(machine.accel_x, machine.accel_y, ux, uy)
+    
+    # Velocità² massima d'ingresso di ogni blocco (J[m] = arresto finale)
+    J = np.zeros(m + 1)
+    if m > 1:
+        cos_theta = -(ux[:-1] * ux[1:] + uy[:-1] * uy[1:])
+        jx, jy = ux[1:] - ux[:-1], uy[1:] - uy[:-1]
+        jn = np.maximum(np.hypot(jx, jy), 1e-12)
+        j_acc = _axis_limit(machine.accel_x, machine.accel_y, jx / jn, jy / jn)
+        sin_d2 = np.sqrt(np.clip(0.5 * (1.0 - cos_theta), 0.0, 1.0))
+        vj2 = j_acc * machine.junction_deviation * sin_d2 / np.maximum(1.0 - sin_d2, 1e-12)
+        vj2 = np.where(cos_theta > 0.999999, _MIN_JUNCTION_SPEED ** 2, vj2)
+        vj2 = np.where(cos_theta < -0.999999, np.inf, vj2)
+        vj2 = np.minimum(vj2, np.minimum(vn2[:-1], vn2[1:]))
+        if not machine.laser_mode:
+            # Senza laser mode ($32=0) ogni cambio M3/M5/S svuota il planner
+            power = np.where(moves.laser_on[blk], moves.power[blk].astype(np.int64), -1)
+            vj2[power[1:] != power[:-1]] = 0.0
+        J[1:m] = vj2
+    
+    # Somme prefisse di 2·a·d: vincolo v_fine² ≤ v_inizio² + 2·a·d
+    S = np.concatenate(([0.0], np.cumsum(2.0 * acc * d)))
+    # Lookahead: il blocco in coda al buffer deve potersi fermare
+    ahead = np.minimum(np.arange(m) + max(int(machine.planner_blocks), 1), m)
+    J[:m] = np.minimum(J[:m], S[ahead] - S[:m])
+    J[0] = 0.0
+    
+    # Passaggio all'indietro (decelerazione) e in avanti (accelerazione)
+    entry = np.minimum.accumulate((J + S)[::-1])[::-1] - S
+    entry = np.minimum.accumulate(entry - S) + S
+    entry = np.clip(entry, 0.0, None)
+    v0s = np.minimum(entry[:-1], vn2)
+    v1s = np.minimum(entry[1:], vn2)
+    
+    # Profilo trapezoidale (o triangolare se non raggiunge la velocità nominale)
+    d_acc = (vn2 - v0s) / (2.0 * acc)
+    d_dec = (vn2 - v1s) / (2.0 * acc)
+    tri = d_acc + d_dec > d
+    vp = np.sqrt(np.where(tri, (2.0 * acc * d + v0s + v1s) / 2.0, vn2))
+    cruise = np.where(tri, 0.0, d - d_acc - d_dec)
+    times[blk] = (2.0 * vp - np.sqrt(v0s) - np.sqrt(v1s)) / acc + cruise / vn
+    return times
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  PARSER GCODE
+# ══════════════════════════════════════════════════════════════════════════════
+# Commenti ";..." e "(...)", comandi di sistema GRBL "$..." e checksum "*nn"
+_COMMENT_CHARS = b";($*%"
+
+# Maiuscolo + rimozione spazi in un'unica bytes.translate
+_UPPER_TABLE = bytes.maketrans(bytes(range(97, 123)), bytes(range(65, 91)))
+
+# Classe di ogni byte: 1 = carattere numerico [0-9.+-], 2 = lettera, 3 = inizio commento
+_CHAR_CLASS = None
+if NUMPY_AVAILABLE:
+    _CHAR_CLASS = np.zeros(256, dtype=np.uint8)
+    _CHAR_CLASS[[*range(48, 58), 46, 45, 43]] = 1
+    _CHAR_CLASS[65:91] = 2
+    _CHAR_CLASS[list(_COMMENT_CHARS)] = 3
+
+# Oltre 15 cifre la mantissa non è più esatta in float64: si usa float()
+_MAX_FAST_DIGITS = 15
+
+# G-code non modali che non generano un movimento anche se hanno X/Y
+_NON_MOTION_G = (4, 10, 28, 30, 53, 92)
+
+
+def _comment_mask(a: 'np.ndarray', cls: 'np.ndarray', nl: 'np.ndarray', starts: 'np.ndarray') -> 'np.ndarray':
+    """
+    Indica quali numeri cadono dentro un commento.
+    
+    Invece di riscrivere il testo, calcola gli intervalli [inizio, fine) dei
+    commenti: ';', '$', '*', '%' arrivano a fine riga, '(' fino a ')' o a
+    fine riga. Un inizio già dentro un commento precedente viene ignorato.
+    """
+    cs = np.flatnonzero(cls == 3)
+    if not len(cs):
+        return np.zeros(len(starts), dtype=bool)
+    line_end = np.append(nl, len(a))[np.searchsorted(nl, cs)]
+    ce = line_end.copy()
+    paren = a[cs] == 40
+    if paren.any():
+        close = np.flatnonzero(a == 41)
+        nxt = np.searchsorted(close, cs[paren])
+        close_pos = np.append(close, len(a))[nxt] + 1
+        ce[paren] = np.minimum(close_pos, line_end[paren])
+    while True:
+        cover = np.maximum.accumulate(ce)
+        keep = np.ones(len(cs), dtype=bool)
+        keep[1:] = cs[1:] >= cover[:-1]
+        if keep.all():
+            break
+        cs, ce = cs[keep], ce[keep]
+    idx = np.searchsorted(cs, starts, side='right') - 1
+    return (idx >= 0) & (starts < cover[np.maximum(idx, 0)])
+
+
+def _parse_numbers(a: 'np.ndarray', starts: 'np.ndarray', lengths: 'np.ndarray'):
+    """
+    Converte in float gli span numerici [start, start+length) di a.
+    
+    Gli span vengono raggruppati per lunghezza e posizione del punto: in
+    ogni gruppo le colonne delle cifre sono fisse, quindi la mantissa è un
+    prodotto matrice-vettore per le potenze di 10. mantissa / 10^decimali
+    è arrotondato correttamente, quindi identico a float() fino a 15 cifre.
+    
+    Returns:
+        (value, valid): valori e maschera dei numeri ben formati
+    """
+    value = np.zeros(len(starts))
+    valid = np.zeros(len(starts), dtype=bool)
+    
+    # Span troppo lunghi per l'aritmetica esatta (rarissimi): float()
+    for i in np.flatnonzero(lengths > _MAX_FAST_DIGITS).tolist():
+        try:
+            value[i] = float(a[starts[i]:starts[i] + lengths[i]].tobytes())
+            valid[i] = True
+        except ValueError:
+            pass
+    
+    dots = np.flatnonzero(a == 46)
+    dot_pos = np.append(dots, len(a))[np.searchsorted(dots, starts)] - starts
+    stride = _MAX_FAST_DIGITS + 2
+    key = np.where(lengths > _MAX_FAST_DIGITS, 0, lengths * stride + np.minimum(dot_pos, lengths))
+    
+    groups = np.flatnonzero(np.bincount(key)) if len(key) else key
+    for k in groups[groups > 0].tolist():
+        L, dp = divmod(k, stride)
+        sel = np.flatnonzero(key == k)
+        cols = np.arange(L)
+        cols = cols[cols != dp]
+        if not len(cols):
+            continue
+        # Cifre come float (carattere - '0'); segno iniziale: '-' = -3, '+' = -5
+        d = a[starts[sel, None] + cols].astype(np.float64) - 48
+        neg = d[:, 0] == -3
+        signed = neg | (d[:, 0] == -5)
+        d[signed, 0] = 0
+        ok = ((d >= 0) & (d <= 9)).all(1) & (len(cols) - signed > 0)
+        
+        v = (d @ (10.0 ** np.arange(len(cols) - 1, -1, -1))) / 10.0 ** (L - 1 - dp if dp < L else 0)
+        v[neg] = -v[neg]
+        value[sel] = v
+        valid[sel] = ok
+    return value, valid
+
+
+def _tokenize(buf: bytes):
+    """
+    Scompone un blocco di testo GCode in parole (lettera + numero).
+    
+    Maiuscolo e rimozione spazi avvengono in C (bytes.translate), poi ogni
+    numero viene individuato come sequenza di caratteri [0-9.+-] preceduta
+    da una lettera; i numeri dentro i commenti vengono scartati.
+    
+    Args:
+        buf: Testo GCode (bytes); righe separate da '\\n'
+    
+    Returns:
+        (line, letter, value): indice riga, codice ASCII lettera, valore
+    """
+    buf = buf.translate(_UPPER_TABLE, b" \t\r")
+    a = np.frombuffer(buf, dtype=np.uint8)
+    cls = _CHAR_CLASS[a]
+    
+    edges = np.diff((cls == 1).view(np.int8), prepend=np.int8(0), append=np.int8(0))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    # Ogni numero deve seguire direttamente una lettera
+    prev = a[np.maximum(starts - 1, 0)]
+    ok = (starts > 0) & (_CHAR_CLASS[prev] == 2)
+    nl = np.flatnonzero(a == 10)
+    ok &= ~_comment_mask(a, cls, nl, starts)
+    starts, ends, letters = starts[ok], ends[ok], prev[ok]
+    
+    value, valid = _parse_numbers(a, starts, ends - starts)
+    line = np.searchsorted(nl, starts[valid])
+    return line, letters[valid], value[valid]
+
+
+def _ffill(n: int, idx: 'np.ndarray', values: 'np.ndarray', initial: float) -> 'np.ndarray':
+    """Propaga in avanti (stato modale) i valori impostati alle righe idx."""
+    out = np.empty(n + 1)
+    out[0] = initial
+    setmask = np.zeros(n + 1, dtype=bool)
+    out[idx + 1] = values
+    setmask[idx + 1] = True
+    setmask[0] = True
+    src = np.maximum.accumulate(np.where(setmask, np.arange(n + 1), 0))
+    return out[src][1:]
+
+
+class GCodeInterpreter:
+    """
+    Interprete GCode con stato modale completo.
+    
+    Gestisce G0/G1/G2/G3, G90/G91, G20/G21, M3/M4/M5 (M2/M30 fine
+    programma), S e F inline. Lo stato viene mantenuto tra chiamate
+    successive a feed(), quindi il testo può essere elaborato a blocchi.
+    
+    Un movimento è a laser acceso solo con S > 0; in M4 (laser mode
+    GRBL, $32=1) i G0 non emettono mai.
+    
+    Gli archi G2/G3 (centro I/J incrementale o raggio R, piano XY) sono
+    suddivisi in segmenti con _expand_arcs, come fa il controller.
+    """
+    
+    def __init__(self):
+        self.x = 0.0
+        self.y = 0.0
+        self.motion = 0          # 0, 1, 2, 3
+        self.relative = False    # G91
+        self.unit = 1.0          # 25.4 con G20
+        self.laser = 0           # 3/4 = M3/M4 attivo, 0 = spento
+        self.s = 0.0
+        self.f = 0.0
+    
+    def feed(self, data: Union[str, bytes]) -> MoveTable:
+        """
+        Interpreta un blocco di righe complete.
+        
+        Args:
+            data: Testo GCode (str o bytes)
+        
+        Returns:
+            MoveTable con i movimenti del blocco
+        """
+        return self.feed_lines(data)[0]
+    
+    def feed_lines(self, data: Union[str, bytes]) -> Tuple[MoveTable, 'np.ndarray']:
+        """
+        Come feed(), restituendo anche la riga di origine di ogni movimento.
+        
+        Returns:
+            (MoveTable, indice riga nel blocco per ogni movimento)
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8", errors="replace")
+        line, letter, value = _tokenize(data)
+        if not len(line):
+            return MoveTable(), np.zeros(0, dtype=np.int64)
+        
+        # Compatta le righe che contengono almeno una parola
+        first = np.ones(len(line), dtype=bool)
+        first[1:] = line[1:] != line[:-1]
+        w = np.cumsum(first) - 1
+        n = int(w[-1]) + 1
+        
+        G, M, X, Y, S, F = (ord(c) for c in "GMXYSF")
+        is_g = letter == G
+        is_m = letter == M
+        
+        def events(mask):
+            return w[mask], value[mask]
+        
+        def modal(mask, mapped, initial):
+            return _ffill(n, w[mask], mapped, initial)
+        
+        gmot = is_g & ((value == 0) | (value == 1) | (value == 2) | (value == 3))
+        motion = modal(gmot, value[gmot], self.motion)
+        
+        gdist = is_g & ((value == 90) | (value == 91))
+        relative = modal(gdist, (value[gdist] == 91).astype(float), float(self.relative)) > 0
+        
+        gunit = is_g & ((value == 20) | (value == 21))
+        unit = modal(gunit, np.where(value[gunit] == 20, 25.4, 1.0), self.unit)
+        
+        mlaser = is_m & ((value == 3) | (value == 4) | (value == 5) |
+                         (value == 2) | (value == 30))
+        laser = modal(mlaser, np.where(value[mlaser] <= 4, value[mlaser], 0.0)
+                      * (value[mlaser] != 2), float(self.laser))
+        
+        s_mask = letter == S
+        spow = modal(s_mask, value[s_mask], self.s)
+        f_mask = letter == F
+        feed = modal(f_mask, value[f_mask], self.f)
+        
+        nonmotion = np.zeros(n, dtype=bool)
+        nonmotion[w[is_g & np.isin(value, _NON_MOTION_G)]] = True
+        
+        # Coordinate: assolute (reset) o incrementali (somma cumulativa)
+        coords = []
+        has_axis = np.zeros(n, dtype=bool)
+        for axis, start in ((X, self.x), (Y, self.y)):
+            m = letter == axis
+            idx = w[m]
+            keep = ~nonmotion[idx]
+            idx = idx[keep]
+            val = value[m][keep] * unit[idx]
+            has_axis[idx] = True
+            rel = relative[idx]
+            
+            delta = np.zeros(n)
+            delta[idx[rel]] = val[rel]
+            cum = np.cumsum(delta)
+            
+            # Ultimo valore assoluto (o stato iniziale) + incrementi successivi
+            base = _ffill(n, idx[~rel], val[~rel] - cum[idx[~rel]], start)
+            coords.append(base + cum)
+        xs, ys = coords
+        
+        mv = has_axis & ~nonmotion
+        on = (laser[mv] > 0) & (spow[mv] > 0) & ~((motion[mv] == 0) & (laser[mv] == 4))
+        flags = (on * FLAG_LASER_ON) | ((motion[mv] == 0) * FLAG_RAPID)
+        power = np.where(on, np.clip(spow[mv], 0, 0xFFFF), 0)
+        rows = np.flatnonzero(mv)
+        row_line = line[first][rows]
+        mx, my = xs[mv], ys[mv]
+        fd = feed[mv]
+        
+        # Archi: suddivisi in segmenti, le altre colonne ripetute
+        arc = motion[rows] >= 2
+        if arc.any():
+            ai = rows[arc]
+            sx = np.append(self.x, xs[:-1])[ai]
+            sy = np.append(self.y, ys[:-1])[ai]
+            word = {}
+            for axis in "IJR":
+                m = letter == ord(axis)
+                word[axis] = np.zeros(n)
+                word[axis][w[m]] = value[m] * unit[w[m]]
+            has_r = np.zeros(n, dtype=bool)
+            has_r[w[letter == ord("R")]] = True
+            cw = motion[ai] == 2
+            cx, cy = sx + word["I"][ai], sy + word["J"][ai]
+            rfmt = has_r[ai]
+            if rfmt.any():
+                cx[rfmt], cy[rfmt] = _arc_center_from_radius(
+                    sx[rfmt], sy[rfmt], xs[ai][rfmt], ys[ai][rfmt], word["R"][ai][rfmt], cw[rfmt])
+            count, px, py = _expand_arcs(sx, sy, xs[ai], ys[ai], cx, cy, cw)
+            
+            rep = np.ones(len(rows), dtype=np.int64)
+            rep[arc] = count
+            start = np.cumsum(rep) - rep
+            pos = (np.repeat(start[arc], count) + np.arange(len(px)) -
+                   np.repeat(np.cumsum(count) - count, count))
+            mx, my = np.repeat(mx, rep), np.repeat(my, rep)
+            mx[pos] = px
+            my[pos] = py
+            flags, power, fd = np.repeat(flags, rep), np.repeat(power, rep), np.repeat(fd, rep)
+            row_line = np.repeat(row_line, rep)
+        
+        # Stato modale per il blocco successivo
+        self.x, self.y = float(xs[-1]), float(ys[-1])
+        self.motion = int(motion[-1])
+        self.relative = bool(relative[-1])
+        self.unit = float(unit[-1])
+        self.laser = int(laser[-1])
+        self.s, self.f = float(spow[-1]), float(feed[-1])
+        
+        return MoveTable(mx, my, flags, power, fd), row_line
+
+
+class GCodeParser:
+    """Parser per file GCode esistenti."""
+    
+    # Blocco di lettura per il parsing in streaming (byte)
+    CHUNK_SIZE = 4 << 20
+    # Oltre questa dimensione parse_file lavora in streaming (byte)
+    STREAM_THRESHOLD = 64 << 20
+    
+    # Cache binaria accanto al file: <file>.pylcache.npz
+    CACHE_SUFFIX = ".pylcache.npz"
+    CACHE_VERSION = 4
+    # Blocchi campionati (inizio, centro, fine) per l'hash del contenuto
+    CACHE_HASH_BLOCK = 1 << 20
+    
+    @staticmethod
+    def open_file(filepath: str):
+        """
+        Apre un file GCode in lettura binaria, anche compresso (.gcode.gz).
+        
+        Il formato gzip è riconosciuto dai byte iniziali, non dall'estensione.
+        """
+        with open(filepath, 'rb') as f:
+            magic = f.read(2)
+        if magic == b"\x1f\x8b":
+            return gzip.open(filepath, 'rb')
+        return open(filepath, 'rb')
+    
+    @staticmethod
+    def file_size(filepath: str) -> int:
+        """
+        Dimensione del testo GCode in byte (decompresso per i file gzip).
+        
+        Per i gzip usa il campo ISIZE finale (modulo 2^32), senza
+        decomprimere il file.
+        """
+        size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            if f.read(2) != b"\x1f\x8b" or size < 18:
+                return size
+            f.seek(-4, os.SEEK_END)
+            return max(size, int.from_bytes(f.read(4), 'little'))
+    
+    @staticmethod
+    def parse(lines: List[str]) -> MoveTable:
+        """
+        Parsa una lista di righe GCode e restituisce i movimenti.
+        
+        Args:
+            lines: Lista di righe GCode
+        
+        Returns:
+            MoveTable con i movimenti
+        """
+        return GCodeInterpreter().feed("\n".join(lines))
+    
+    @staticmethod
+    def iter_chunks(filepath: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Legge un file GCode a blocchi binari di righe complete.
+        
+        Ogni blocco termina a fine riga; la riga spezzata dal limite del
+        blocco viene riportata in testa al successivo. La memoria usata è
+        limitata a circa chunk_size, qualunque sia la dimensione del file.
+        
+        Args:
+            filepath: Percorso del file
+            chunk_size: Dimensione indicativa del blocco in byte
+        
+        Yields:
+            Blocchi di testo (bytes)
+        """
+        rest = b""
+        with GCodeParser.open_file(filepath) as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                if cut == 0:
+                    rest = data
+                    continue
+                rest = data[cut:]
+                yield data[:cut]
+        if rest:
+            yield rest
+    
+    @staticmethod
+    def iter_moves(filepath: str, chunk_size: int = CHUNK_SIZE) -> Iterator[MoveTable]:
+        """
+        Parsing in streaming: restituisce i movimenti a lotti.
+        
+        Un solo GCodeInterpreter elabora i blocchi in sequenza, quindi lo
+        stato modale (G90/G91, M3/M5, S, F...) attraversa i confini.
+        
+        Args:
+            filepath: Percorso del file
+            chunk_size: Dimensione indicativa del blocco in byte
+        
+        Yields:
+            MoveTable con i movimenti di ogni blocco
+        """
+        interp = GCodeInterpreter()
+        for chunk in GCodeParser.iter_chunks(filepath, chunk_size):
+            yield interp.feed(chunk)
+    
+    @staticmethod
+    def parse_file(filepath: str, stream: Optional[bool] = None,
+                   chunk_size: int = CHUNK_SIZE, cache: bool = True,
+                   feed_rate: float = 1000.0,
+                   machine: Optional[MachineSettings] = None) -> GCodeProgram:
+        """
+        Parsa un file GCode completo (anche compresso, .gcode.gz).
+        
+        In modalità stream il testo non viene tenuto in memoria: solo la
+        tabella movimenti (compatta, colonnare) resta caricata, mentre le
+        righe vengono rilette dal file con GCodeProgram.iter_lines().
+        
+        Con cache attiva i movimenti vengono salvati in un file .npz accanto
+        al sorgente; riaprendo lo stesso file (stessa dimensione, data di
+        modifica e hash) il parsing viene saltato. Anche le statistiche
+        sono in cache e vengono ricalcolate solo se feed_rate o machine
+        sono diversi da quelli con cui sono state salvate.
+        
+        Args:
+            filepath: Percorso del file
+            stream: Legge a blocchi senza caricare le righe in raw_lines
+                    (None = automatico oltre STREAM_THRESHOLD)
+            chunk_size: Dimensione indicativa del blocco in byte
+            cache: Usa/aggiorna la cache binaria
+            feed_rate: Velocità per i movimenti senza F (statistiche)
+            machine: Parametri macchina per la stima tempi (None = predefiniti)
+        
+        Returns:
+            GCodeProgram con statistiche calcolate
+        """
+        if stream is None:
+            stream = GCodeParser.file_size(filepath) > GCodeParser.STREAM_THRESHOLD
+        key = GCodeParser._cache_key(filepath) if cache else None
+        stats_key = np.array((feed_rate,) + astuple(machine or MachineSettings()), dtype=np.float64)
+        
+        cached = GCodeParser._load_cache(filepath, key) if cache else None
+        if cached is not None:
+            prog, cached_stats_key = cached
+            if not np.array_equal(cached_stats_key, stats_key):
+                prog.calculate_statistics(feed_rate, machine)
+                GCodeParser._save_cache(filepath, key, prog, stats_key)
+            if not stream:
+                with GCodeParser.open_file(filepath) as f:
+                    prog.raw_lines = f.read().decode('utf-8', errors='replace').splitlines()
+            return prog
+        
+        prog = GCodeProgram()
+        if stream:
+            moves = MoveTableBuilder()
+            interp = GCodeInterpreter()
+            for chunk in GCodeParser.iter_chunks(filepath, chunk_size):
+                prog.source_line_count += chunk.count(b"\n") + (not chunk.endswith(b"\n"))
+                moves.extend_table(interp.feed(chunk))
+            prog.moves = moves.build()
+            prog.source_file = filepath
+        else:
+            with GCodeParser.open_file(filepath) as f:
+                data = f.read()
+            prog.raw_lines = data.decode('utf-8', errors='replace').splitlines()
+            prog.moves = GCodeInterpreter().feed(data)
+        
+        if prog.moves:
+            mn_x, mn_y, mx_x, mx_y = prog.bounds()
+            prog.width_mm = mx_x - mn_x
+            prog.height_mm = mx_y - mn_y
+        prog.calculate_statistics(feed_rate, machine)
+        
+        if cache:
+            GCodeParser._save_cache(filepath, key, prog, stats_key)
+        return prog
+    
+    # ──────────────────────────────────────────────────────────────────────
+    #  Cache binaria (.npz)
+    # ──────────────────────────────────────────────────────────────────────
+    @staticmethod
+    def _cache_key(filepath: str) -> 'np.ndarray':
+        """
+        Chiave di validità della cache: dimensione, mtime e hash.
+        
+        L'hash (BLAKE2b) copre blocchi di inizio, centro e fine file, così
+        resta immediato anche su file di GB; dimensione e mtime coprono
+        tutte le modifiche ordinarie.
+        """
+        st = os.stat(filepath)
+        block = GCodeParser.CACHE_HASH_BLOCK
+        h = hashlib.blake2b(digest_size=16)
+        with open(filepath, 'rb') as f:
+            for pos in sorted({0, max(0, st.st_size // 2 - block // 2),
+                               max(0, st.st_size - block)}):
+                f.seek(pos)
+                h.update(f.read(block))
+        digest = np.frombuffer(h.digest(), dtype=np.int64)
+        return np.concatenate(([GCodeParser.CACHE_VERSION, st.st_size, st.st_mtime_ns], digest))
+    
+    @staticmethod
+    def _load_cache(filepath: str, key: 'np.ndarray') -> Optional[Tuple[GCodeProgram, 'np.ndarray']]:
+        """
+        Carica il programma dalla cache se valida, altrimenti None.
+        
+        Returns:
+            (programma, stats_key delle statistiche salvate) o None
+        """
+        path = filepath + GCodeParser.CACHE_SUFFIX
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                if not np.array_equal(z["key"], key):
+                    return None
+                moves = MoveTable(*(z[name] for name, _, _ in MoveTable.COLUMNS))
+                meta = z["meta"]
+                stats_key = z["stats_key"]
+        except (OSError, ValueError, KeyError):
+            return None
+        prog = GCodeProgram(moves=moves, source_file=filepath,
+                            source_line_count=int(meta[0]))
+        (prog.width_mm, prog.height_mm, prog.estimated_time_seconds,
+         prog.total_distance_mm, prog.laser_on_distance_mm) = (float(v) for v in meta[1:])
+        return prog, stats_key
+    
+    @staticmethod
+    def _save_cache(filepath: str, key: 'np.ndarray', prog: GCodeProgram,
+                    stats_key: 'np.ndarray'):
+        """
+        Scrive la cache (in modo atomico); errori di scrittura ignorati.
+        
+        stats_key (feed_rate e parametri macchina) identifica i parametri
+        con cui sono state calcolate le statistiche salvate.
+        """
+        path = filepath + GCodeParser.CACHE_SUFFIX
+        meta = np.array([prog.line_count(), prog.width_mm, prog.height_mm,
+                         prog.estimated_time_seconds, prog.total_distance_mm,
+                         prog.laser_on_distance_mm])
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                np.savez(f, key=key, meta=meta, stats_key=stats_key, **dict(zip(
+                    (c[0] for c in MoveTable.COLUMNS), prog.moves.columns())))
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  SCRITTURA GCODE
+# ══════════════════════════════════════════════════════════════════════════════
+def _format_fixed(values: 'np.ndarray', decimals: int) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Formatta numeri in ASCII a virgola fissa, come f"{v:.{decimals}f}".
+    
+    Conversione intero→ASCII vettoriale: il risultato è una matrice (N, W)
+    di byte allineati a destra, con riempimento NUL da eliminare dopo
+    l'unione delle righe. I valori vicini a un arrotondamento .5 (dove il
+    prodotto per 10^decimali potrebbe scostarsi dal decimale esatto), non
+    finiti o enormi vengono segnalati per la formattazione Python.
+    
+    Args:
+        values: Valori float
+        decimals: Cifre decimali
+    
+    Returns:
+        (matrice uint8 (N, W), indici da formattare con Python)
+    """
+    v = np.asarray(values, dtype=np.float64)
+    scale = 10 ** decimals
+    t = np.abs(v) * scale
+    with np.errstate(invalid='ignore'):
+        bad = ~(t < 2.0 ** 32) | (np.abs(t - np.floor(t) - 0.5) < 1e-6)
+    n = np.where(bad, 0.0, np.rint(t)).astype(np.int64)
+    ip, fp = np.divmod(n, scale)
+    
+    top = int(ip.max()) if len(ip) else 0
+    D = len(str(top))
+    ndig = np.ones(len(ip), dtype=np.int64)
+    for k in range(1, D):
+        ndig += ip >= 10 ** k
+    
+    W = 1 + D + (decimals + 1 if decimals else 0)
+    out = np.zeros((len(v), W), dtype=np.uint8)
+    for k in range(D):
+        digit = (ip // 10 ** k) % 10
+        out[:, D - k] = np.where(k < ndig, 48 + digit, 0)
+    rows = np.flatnonzero(np.signbit(v))
+    out[rows, D - ndig[rows]] = 45
+    if decimals:
+        out[:, D + 1] = 46
+        for j in range(decimals):
+            out[:, D + 2 + j] = 48 + (fp // 10 ** (decimals - 1 - j)) % 10
+    return out, np.flatnonzero(bad)
+
+
+def _ascii_lines(*parts: 'np.ndarray') -> List[str]:
+    """Unisce matrici di byte (colonne) in righe di testo, scartando i NUL."""
+    n = len(parts[0])
+    block = np.hstack(parts + (np.full((n, 1), 10, dtype=np.uint8),))
+    return block.tobytes().translate(None, b"\0").decode("ascii").split("\n")[:-1]
+
+
+def _const_cols(text: bytes, n: int) -> 'np.ndarray':
+    """Colonne costanti (stesso testo su ogni riga)."""
+    return np.tile(np.frombuffer(text, dtype=np.uint8), (n, 1))
+
+
+class _GCodeWriter:
+    """
+    Scrive le righe GCode e, nello stesso passaggio, la tabella movimenti.
+    
+    Tiene lo stato modale (M3/M5, potenza S, velocità F) come farebbe
+    l'interprete, così i generatori non devono ri-parsare il proprio output.
+    
+    Le righe non vengono formattate una per una: ogni comando viene
+    registrato in colonne (codice, x, y, potenza) e program() produce il
+    testo in blocco con _format_fixed. emit() accetta direttamente array
+    di comandi per i generatori vettoriali.
+    """
+    
+    # Codici comando
+    OP_TEXT = 0      # Riga di testo (aux = indice in texts)
+    OP_RAPID = 1     # G0 X Y
+    OP_CUT = 2       # G1 X Y
+    OP_ON = 3        # M3 S<power>
+    OP_OFF = 4       # M5
+    OP_FEED = 5      # F (x = velocità)
+    OP_TABLE = 6     # Movimenti da parser (aux = indice in tables), nessuna riga
+    OP_ON_LP = 7     # M3 S{lp} (potenza di lavoro come segnaposto)
+    OP_ARC_CW = 8    # G2 X Y I J (aux = indice in arc_i/arc_j)
+    OP_ARC_CCW = 9   # G3 X Y I J
+    OP_ON_DYN = 10   # M4 S<power> (laser mode GRBL: potenza dinamica)
+    OP_CUT_S = 11    # G1 X Y S<power> (potenza inline, S0 = spento)
+    OP_CUT_LP = 12   # G1 X Y S{lp}
+    
+    # Comandi che accendono/spengono il laser e comandi che impostano S
+    LASER_OPS = (OP_ON, OP_ON_LP, OP_ON_DYN, OP_OFF)
+    POWER_OPS = (OP_ON, OP_ON_LP, OP_ON_DYN, OP_CUT_S, OP_CUT_LP)
+    
+    def __init__(self):
+        self._op = array('B')
+        self._x = array('d')
+        self._y = array('d')
+        self._p = array('q')
+        self._aux = array('q')       # indice testo/tabella, -1 = testo standard
+        self._chunks = []            # blocchi di colonne da emit()
+        self.texts: List[str] = []
+        self.tables: List[Tuple[MoveTable, Optional[int]]] = []
+        self.arc_i = array('d')      # Centri degli archi, relativi al punto iniziale
+        self.arc_j = array('d')
+        self.n_lines = 0
+        self.n_ops = 0
+        self.laser_is_on = False
+        self.power = 0
+        self.feed = 0.0
+        self._body = None
+        # Movimenti alla potenza di lavoro (segnaposto {lp})
+        self.job_power = False
+    
+    def _put(self, op: int, x: float = 0.0, y: float = 0.0, p: int = 0, aux: int = -1):
+        self.n_ops += 1
+        self._op.append(op)
+        self._x.append(x)
+        self._y.append(y)
+        self._p.append(p)
+        self._aux.append(aux)
+    
+    def _text_index(self, line: Optional[str]) -> int:
+        if line is None:
+            return -1
+        self.texts.append(line)
+        return len(self.texts) - 1
+    
+    def text(self, *lines: str):
+        """Aggiunge righe senza movimento (commenti, setup)."""
+        for line in lines:
+            self._put(self.OP_TEXT, aux=self._text_index(line))
+        self.n_lines += len(lines)
+    
+    def rapid(self, x: float, y: float, line: Optional[str] = None):
+        """Movimento rapido G0."""
+        self._put(self.OP_RAPID, x, y, aux=self._text_index(line))
+        self.n_lines += 1
+    
+    def cut(self, x: float, y: float):
+        """Movimento di lavoro G1."""
+        self._put(self.OP_CUT, x, y)
+        self.n_lines += 1
+    
+    def set_feed(self, feed: float):
+        """Imposta la velocità di lavoro (F, scritta come segnaposto {feed})."""
+        self._put(self.OP_FEED, float(feed), aux=self._text_index("F{feed}       ; Velocità di lavoro"))
+        self.n_lines += 1
+        self.feed = float(feed)
+    
+    def laser_on(self, power: int, job_power: bool = False):
+        """
+        Accende il laser (M3) alla potenza indicata.
+        
+        Con job_power la riga usa il segnaposto {lp}, così la potenza di
+        lavoro può cambiare senza rigenerare il programma.
+        """
+        self._put(self.OP_ON_LP if job_power else self.OP_ON, p=int(power))
+        self.n_lines += 1
+        self.laser_is_on = True
+        self.power = power
+        self.job_power = job_power
+    
+    def laser_off(self, line: Optional[str] = None):
+        """Spegne il laser (M5)."""
+        self._put(self.OP_OFF, aux=self._text_index(line))
+        self.n_lines += 1
+        self.laser_is_on = False
+        self.power = 0
+        self.job_power = False
+    
+    def laser_dynamic(self, power: int = 0):
+        """Attiva il laser mode GRBL (M4): la potenza segue poi gli S inline."""
+        self._put(self.OP_ON_DYN, p=int(power))
+        self.n_lines += 1
+        self.laser_is_on = True
+        self.power = power
+        self.job_power = False
+    
+    def emit(self, op: 'np.ndarray', x: 'np.ndarray', y: 'np.ndarray', power: 'np.ndarray',
+             i: Optional['np.ndarray'] = None, j: Optional['np.ndarray'] = None):
+        """
+        Aggiunge in blocco una sequenza di comandi OP_RAPID/OP_CUT/OP_ON/
+        OP_ON_LP/OP_OFF/OP_ARC_CW/OP_ARC_CCW/OP_ON_DYN/OP_CUT_S/OP_CUT_LP.
+        
+        Args:
+            op: Codici comando
+            x, y: Coordinate (usate dai movimenti)
+            power: Potenza (usata da OP_ON/OP_ON_LP/OP_ON_DYN/OP_CUT_S/OP_CUT_LP)
+            i, j: Centro relativo al punto iniziale (usati da OP_ARC_*)
+        """
+        op = np.asarray(op, dtype=np.uint8)
+        if not len(op):
+            return
+        self._flush()
+        n = len(op)
+        aux = np.full(n, -1, dtype=np.int64)
+        arc = np.flatnonzero((op == self.OP_ARC_CW) | (op == self.OP_ARC_CCW))
+        if len(arc):
+            aux[arc] = len(self.arc_i) + np.arange(len(arc))
+            self.arc_i.extend(np.asarray(i, dtype=np.float64)[arc].tolist())
+            self.arc_j.extend(np.asarray(j, dtype=np.float64)[arc].tolist())
+        self._chunks.append((op, np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64),
+                             np.asarray(power, dtype=np.int64), aux))
+        self.n_lines += n
+        self.n_ops += n
+        # Stato modale finale del blocco
+        state = np.flatnonzero(np.isin(op, self.LASER_OPS))
+        if len(state):
+            self.laser_is_on = op[state[-1]] != self.OP_OFF
+        setp = np.flatnonzero(np.isin(op, self.POWER_OPS))
+        if len(setp):
+            self.power = int(np.asarray(power)[setp[-1]])
+            self.job_power = op[setp[-1]] in (self.OP_ON_LP, self.OP_CUT_LP)
+        if not self.laser_is_on:
+            self.power = 0
+            self.job_power = False
+    
+    def parsed(self, lines: List[str], job_power: Optional[int] = None):
+        """
+        Aggiunge righe GCode esterne ricavandone i movimenti col parser.
+        
+        Args:
+            lines: Righe GCode, eventualmente con segnaposto {lp}
+            job_power: Valore di {lp} per il parsing dei movimenti
+        """
+        self.text(*lines)
+        if job_power is not None:
+            lines = [l.replace("{lp}", str(job_power)) for l in lines]
+        table = GCodeParser.parse(lines)
+        self.tables.append((table, job_power))
+        self._put(self.OP_TABLE, aux=len(self.tables) - 1)
+    
+    def rendered(self, lines: List[str], table: MoveTable):
+        """
+        Aggiunge in blocco righe già formattate con la loro tabella
+        movimenti (prodotte da un altro writer, es. una fascia raster).
+        
+        Come parsed(), ma senza ri-parsare: le righe non cambiano lo stato
+        modale del writer.
+        """
+        self._flush()
+        n = len(lines)
+        base = len(self.texts)
+        self.texts.extend(lines)
+        self._chunks.append((np.full(n, self.OP_TEXT, dtype=np.uint8), np.zeros(n), np.zeros(n),
+                             np.zeros(n, dtype=np.int64), base + np.arange(n, dtype=np.int64)))
+        self.n_lines += n
+        self.n_ops += n
+        self.tables.append((table, None))
+        self._put(self.OP_TABLE, aux=len(self.tables) - 1)
+    
+    def begin_body(self):
+        """Inizio del corpo ripetuto a ogni passata."""
+        self._body = (self.n_lines, self.n_ops)
+    
+    def end_body(self):
+        """Fine del corpo ripetuto: il resto è footer."""
+        self._body += (self.n_lines, self.n_ops)
+    
+    def footer(self):
+        """Scrive il footer standard (laser spento e ritorno a home)."""
+        self.text("", "; === FINE ===")
+        self.laser_off("M5           ; Laser OFF")
+        self.rapid(0.0, 0.0, "G0 X0 Y0     ; Torna a home")
+        self.text("M2           ; Fine programma")
+    
+    def _flush(self):
+        """Sposta i comandi scalari accumulati in un blocco di colonne."""
+        if not len(self._op):
+            return
+        self._chunks.append((np.frombuffer(self._op, dtype=np.uint8).copy(),
+                             np.frombuffer(self._x, dtype=np.float64).copy(),
+                             np.frombuffer(self._y, dtype=np.float64).copy(),
+                             np.frombuffer(self._p, dtype=np.int64).copy(),
+                             np.frombuffer(self._aux, dtype=np.int64).copy()))
+        for buf in (self._op, self._x, self._y, self._p, self._aux):
+            del buf[:]
+    
+    def _columns(self):
+        """Tutti i comandi come colonne NumPy."""
+        self._flush()
+        if not self._chunks:
+            return (np.zeros(0, dtype=np.uint8), np.zeros(0), np.zeros(0),
+                    np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+        return tuple(np.concatenate(c) for c in zip(*self._chunks))
+    
+    def _render(self, op, x, y, p, aux) -> List[str]:
+        """Testo di tutte le righe, formattato in blocco per tipo di comando."""
+        has_line = op != self.OP_TABLE
+        lines = np.empty(len(op), dtype=object)
+        
+        is_arc = (op == self.OP_ARC_CW) | (op == self.OP_ARC_CCW)
+        custom = (aux >= 0) & ~is_arc
+        texts = np.array(self.texts + [""], dtype=object)
+        lines[custom & has_line] = texts[aux[custom & has_line]]
+        
+        motion = np.flatnonzero(np.isin(op, (self.OP_RAPID, self.OP_CUT, self.OP_CUT_S,
+                                             self.OP_CUT_LP)) & ~custom)
+        if len(motion):
+            xs, ys = x[motion], y[motion]
+            fx, bad_x = _format_fixed(xs, 3)
+            fy, bad_y = _format_fixed(ys, 3)
+            head = np.where((op[motion] == self.OP_RAPID)[:, None],
+                            _const_cols(b"G0 X", 1), _const_cols(b"G1 X", 1))
+            text = _ascii_lines(head, fx, _const_cols(b" Y", len(motion)), fy)
+            for i in np.union1d(bad_x, bad_y).tolist():
+                g = 0 if op[motion[i]] == self.OP_RAPID else 1
+                text[i] = f"G{g} X{xs[i]:.3f} Y{ys[i]:.3f}"
+            # Potenza inline (laser mode)
+            inline = np.flatnonzero(op[motion] == self.OP_CUT_S)
+            if len(inline):
+                fp, _ = _format_fixed(p[motion[inline]], 0)
+                sfx = _ascii_lines(_const_cols(b" S", len(inline)), fp)
+                text = np.array(text, dtype=object)
+                text[inline] += np.array(sfx, dtype=object)
+            text = np.asarray(text, dtype=object)
+            text[op[motion] == self.OP_CUT_LP] += " S{lp}"
+            lines[motion] = text
+        
+        arcs = np.flatnonzero(is_arc)
+        if len(arcs):
+            ai = np.frombuffer(self.arc_i, dtype=np.float64)[aux[arcs]]
+            aj = np.frombuffer(self.arc_j, dtype=np.float64)[aux[arcs]]
+            cols = [x[arcs], y[arcs], ai, aj]
+            fmt = [_format_fixed(c, 3) for c in cols]
+            n = len(arcs)
+            head = np.where((op[arcs] == self.OP_ARC_CW)[:, None],
+                            _const_cols(b"G2 X", 1), _const_cols(b"G3 X", 1))
+            text = _ascii_lines(head, fmt[0][0], _const_cols(b" Y", n), fmt[1][0],
+                                _const_cols(b" I", n), fmt[2][0], _const_cols(b" J", n), fmt[3][0])
+            for k in np.unique(np.concatenate([f[1] for f in fmt])).astype(np.int64).tolist():
+                g = 2 if op[arcs[k]] == self.OP_ARC_CW else 3
+                text[k] = f"G{g} X{cols[0][k]:.3f} Y{cols[1][k]:.3f} I{ai[k]:.3f} J{aj[k]:.3f}"
+            lines[arcs] = text
+        
+        on = np.flatnonzero(((op == self.OP_ON) | (op == self.OP_ON_DYN)) & ~custom)
+        if len(on):
+            fp, _ = _format_fixed(p[on], 0)
+            head = np.where((op[on] == self.OP_ON)[:, None],
+                            _const_cols(b"M3 S", 1), _const_cols(b"M4 S", 1))
+            lines[on] = _ascii_lines(head, fp)
+        
+        lines[(op == self.OP_OFF) & ~custom] = "M5"
+        lines[op == self.OP_ON_LP] = "M3 S{lp}"
+        return lines[has_line].tolist()
+    
+    def _moves(self, op, x, y, p, aux):
+        """
+        Tabella movimenti e maschera potenza di lavoro dai comandi.
+        
+        Returns:
+            (MoveTable, maschera potenza di lavoro, movimenti prima di
+            ogni comando: array di len(op) + 1 elementi)
+        """
+        # Stato modale propagato in avanti dai comandi M3/M4/M5/S/F
+        # (come l'interprete: con S0 e per i G0 in M4 il laser non emette)
+        idx = np.arange(len(op))
+        state = np.isin(op, self.LASER_OPS)
+        last = np.maximum.accumulate(np.where(state, idx, -1))
+        cur = np.where(last >= 0, op[np.maximum(last, 0)], self.OP_OFF)
+        setp = np.isin(op, self.POWER_OPS)
+        lastp = np.maximum.accumulate(np.where(setp, idx, -1))
+        spow = np.where(lastp >= 0, p[np.maximum(lastp, 0)], 0)
+        on = ((cur != self.OP_OFF) & (spow > 0) &
+              ~((op == self.OP_RAPID) & (cur == self.OP_ON_DYN)))
+        power = np.where(on, spow, 0)
+        job = np.isin(op[np.maximum(lastp, 0)], (self.OP_ON_LP, self.OP_CUT_LP)) & (lastp >= 0)
+        fset = op == self.OP_FEED
+        lastf = np.maximum.accumulate(np.where(fset, idx, -1))
+        feed = np.where(lastf >= 0, x[np.maximum(lastf, 0)], 0.0)
+        
+        # Movimenti scritti: uno per G0/G1, segmenti per gli archi
+        is_arc = (op == self.OP_ARC_CW) | (op == self.OP_ARC_CCW)
+        motion = np.isin(op, (self.OP_RAPID, self.OP_CUT, self.OP_CUT_S, self.OP_CUT_LP)) | is_arc
+        sel = np.flatnonzero(motion)
+        rep = np.ones(len(sel), dtype=np.int64)
+        mx, my = x[sel], y[sel]
+        arcs = np.flatnonzero(is_arc[sel])
+        if len(arcs):
+            # Punto iniziale = fine del movimento precedente
+            prev = sel[arcs - 1] if arcs[0] > 0 else np.append(-1, sel[arcs[1:] - 1])
+            sx = np.where(prev >= 0, x[np.maximum(prev, 0)], 0.0)
+            sy = np.where(prev >= 0, y[np.maximum(prev, 0)], 0.0)
+            k = aux[sel[arcs]]
+            cx = sx + np.frombuffer(self.arc_i, dtype=np.float64)[k]
+            cy = sy + np.frombuffer(self.arc_j, dtype=np.float64)[k]
+            count, px, py = _expand_arcs(sx, sy, mx[arcs], my[arcs], cx, cy,
+                                         op[sel[arcs]] == self.OP_ARC_CW)
+            rep[arcs] = count
+            start = np.cumsum(rep) - rep
+            pos = (np.repeat(start[arcs], count) + np.arange(len(px)) -
+                   np.repeat(np.cumsum(count) - count, count))
+            mx, my = np.repeat(mx, rep), np.repeat(my, rep)
+            mx[pos] = px
+            my[pos] = py
+        flags = np.repeat((on[sel] * FLAG_LASER_ON) | ((op[sel] == self.OP_RAPID) * FLAG_RAPID), rep)
+        mpower, mfeed = np.repeat(power[sel], rep), np.repeat(feed[sel], rep)
+        mjob = np.repeat(on[sel] & job[sel], rep)
+        
+        rows = np.zeros(len(op), dtype=np.int64)
+        rows[sel] = rep
+        for t in np.flatnonzero(op == self.OP_TABLE).tolist():
+            rows[t] = len(self.tables[aux[t]][0])
+        rows_before = np.append(0, np.cumsum(rows))
+        written = np.append(0, np.cumsum(rep))
+        
+        builder = MoveTableBuilder()
+        masks = []
+        bounds = np.flatnonzero(op == self.OP_TABLE).tolist() + [len(op)]
+        start = 0
+        for b in bounds:
+            e0, e1 = written[np.searchsorted(sel, start)], written[np.searchsorted(sel, b)]
+            builder.extend(mx[e0:e1], my[e0:e1], flags[e0:e1], mpower[e0:e1], mfeed[e0:e1])
+            masks.append(mjob[e0:e1])
+            if b < len(op):
+                table, job_power = self.tables[aux[b]]
+                builder.extend_table(table)
+                masks.append(table.laser_on & (table.power == job_power) if job_power is not None
+                             else np.zeros(len(table), dtype=bool))
+            start = b + 1
+        return builder.build(), np.concatenate(masks), rows_before
+    
+    def program(self, **kwargs) -> GCodeProgram:
+        """Crea il GCodeProgram con righe e movimenti scritti."""
+        op, x, y, p, aux = self._columns()
+        lines = self._render(op, x, y, p, aux)
+        moves, power_mask, rows_before = self._moves(op, x, y, p, aux)
+        kwargs.setdefault("feed", self.feed)
+        kwargs["power_mask"] = power_mask
+        if self._body is None:
+            return GCodeProgram(moves=moves, raw_lines=lines, **kwargs)
+        l0, o0, l1, o1 = self._body
+        return GCodeProgram(moves=moves, raw_lines=lines[:l0],
+                            body_lines=lines[l0:l1], footer_lines=lines[l1:],
+                            body_range=(int(rows_before[o0]), int(rows_before[o1])), **kwargs)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  GENERATORE GCODE DA VETTORI
+# ══════════════════════════════════════════════════════════════════════════════
+class VectorGCodeGenerator:
+    """
+    Generatore GCode da percorsi vettoriali.
+    Usato con: contorni, centerline, raster vettoriale, hatching.
+    """
+    
+    def __init__(self, feed: int = 1000, power: int = 200, passes: int = 1,
+                 arc_tolerance: Optional[float] = None, laser_mode: bool = False):
+        """
+        Inizializza il generatore vettoriale.
+        
+        Args:
+            feed: Velocità di avanzamento (mm/min)
+            power: Potenza laser (0-255)
+            passes: Numero di passate
+            arc_tolerance: Arc fitting G2/G3 entro questa tolleranza in mm
+                           (None = solo segmenti G1)
+            laser_mode: Laser mode GRBL ($32=1): M4 una volta e potenza
+                        inline sul primo G1 di ogni percorso, senza M3/M5
+        """
+        self.feed = feed
+        self.power = power
+        self.passes = passes
+        self.arc_tolerance = arc_tolerance
+        self.laser_mode = laser_mode
+        self.rapid_feed = 3000  # Velocità movimenti rapidi
+    
+    def build(self, paths: List[Union[Polyline, str]], 
+              offset_x: float = 0.0, 
+              offset_y: float = 0.0,
+              header_comment: str = "") -> GCodeProgram:
+        """
+        Costruisce un programma GCode da percorsi vettoriali.
+        
+        Args:
+            paths: Lista di Polyline (da Vectorizer) oppure, per
+                   compatibilità, comandi GCode base (G0, G1, M3, M5)
+                   con placeholder potenza "{lp}"
+            offset_x: Offset X da applicare
+            offset_y: Offset Y da applicare
+            header_comment: Commento opzionale per l'header
+        
+        Returns:
+            GCodeProgram completo, con statistiche azzerate: il chiamante
+            le calcola con calculate_statistics(feed, machine)
+        """
+        w = _GCodeWriter()
+        
+        # Costruisci header
+        w.text(
+            f"; PyLaser v{APP_VERSION}",
+            f"; Source: VECTOR",
+            f"; Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            "; Feed: {feed} mm/min",
+            "; Power: {lp}",
+            "; Passes: {passes}",
+            "; Offset: X={ox} Y={oy}",
+        )
+        
+        if header_comment:
+            w.text(f"; {header_comment}")
+        
+        w.text(
+            "",
+            "; === INIZIALIZZAZIONE ===",
+            "G21          ; Unità: millimetri",
+            "G90          ; Coordinate assolute",
+            "G92 X0 Y0    ; Imposta origine",
+        )
+        w.set_feed(self.feed)
+        w.laser_off("M5           ; Laser OFF (sicurezza)")
+        w.text("", "; === INIZIO PERCORSO ===")
+        
+        legacy = bool(paths) and isinstance(paths[0], str)
+        if self.laser_mode and not legacy:
+            w.laser_dynamic(0)
+        
+        # Corpo scritto una volta: le passate sono un conteggio di ripetizioni
+        w.begin_body()
+        if legacy:
+            # Il placeholder potenza "{lp}" resta nel testo
+            w.parsed(paths, job_power=self.power)
+        else:
+            self._emit_polylines(w, paths)
+        w.end_body()
+        
+        w.footer()
         
         # Crea programma
-        prog = GCodeProgram()
-        prog.raw_lines = raw
-        prog.moves = GCodeParser.parse(raw)
-        prog.offset_x = offset_x
-        prog.offset_y = offset_y
-        prog.source = GCodeSource.VECTOR
+        prog = w.program(offset_x=offset_x, offset_y=offset_y,
+                         source=GCodeSource.VECTOR, passes=self.passes,
+                         power=self.power, feed=self.feed)
         
         if prog.moves:
             mn_x, mn_y, mx_x, mx_y = prog.bounds()
             prog.width_mm = mx_x - mn_x
             prog.height_mm = mx_y - mn_y
         
-        prog.calculate_statistics(self.feed)
-        
         return prog
+    
+    def _emit_polylines(self, w: _GCodeWriter, paths: List[Polyline]):
+        """
+        Scrive i percorsi (G0 al primo punto, G1 sui successivi).
+        
+        La sequenza di comandi di tutti i percorsi viene costruita con
+        NumPy e passata in blocco al writer (un solo emit). Con arc fitting
+        attivo i tratti curvi dei percorsi con laser diventano G2/G3.
+        
+        In laser mode non ci sono M3/M5: il G0 verso ogni percorso è
+        spento e il primo G1 porta la potenza inline (S{lp} o S<potenza>).
+        """
+        paths = [pl for pl in paths if len(pl.points)]
+        if not paths:
+            return
+        points = [np.asarray(pl.points, dtype=np.float64).reshape(-1, 2) for pl in paths]
+        kinds = [np.zeros(len(p), dtype=np.int64) for p in points]
+        centers = [np.zeros((len(p), 2)) for p in points]
+        # In laser mode il primo tratto resta un G1, che porta la potenza
+        lead = 1 if self.laser_mode else 0
+        if self.arc_tolerance:
+            for k, pl in enumerate(paths):
+                if pl.laser_on and len(points[k]) - lead >= ARC_MIN_POINTS:
+                    keep, kind, center = fit_arcs(points[k][lead:], self.arc_tolerance)
+                    keep = np.concatenate((np.arange(lead), keep + lead))
+                    kinds[k] = np.concatenate((np.zeros(lead, dtype=np.int64), kind))
+                    centers[k] = np.concatenate((np.zeros((lead, 2)), center))
+                    points[k] = points[k][keep]
+        pts = np.concatenate(points)
+        kind = np.concatenate(kinds)
+        center = np.concatenate(centers)
+        L = np.array([len(p) for p in points])
+        laser = np.array([pl.laser_on for pl in paths], dtype=bool)
+        lp = np.array([pl.power is None for pl in paths], dtype=bool)
+        power = np.array([self.power if pl.power is None else pl.power for pl in paths])
+        
+        # Comandi per percorso: G0, [M3], G1/G0 × (L - 1), [M5]
+        # (laser mode: G0, G1 S × (L - 1) con la potenza sul primo)
+        switch = 0 if self.laser_mode else 1
+        count = L + 2 * switch * laser
+        start = np.cumsum(count) - count
+        op = np.repeat(np.where(laser, w.OP_CUT, w.OP_RAPID), count).astype(np.uint8)
+        op[start] = w.OP_RAPID
+        if self.laser_mode:
+            cut = laser & (L > 1)
+            op[start[cut] + 1] = np.where(lp[cut], w.OP_CUT_LP, w.OP_CUT_S)
+        else:
+            op[start[laser] + 1] = np.where(lp[laser], w.OP_ON_LP, w.OP_ON)
+            op[(start + count - 1)[laser]] = w.OP_OFF
+        
+        # Posizione di ogni punto nella sequenza (dopo M3 dal secondo punto)
+        pid = np.repeat(np.arange(len(paths)), L)
+        j = np.arange(len(pts)) - np.repeat(np.cumsum(L) - L, L)
+        pos = start[pid] + j + switch * (laser[pid] & (j >= 1))
+        x = np.zeros(len(op))
+        y = np.zeros(len(op))
+        x[pos] = pts[:, 0]
+        y[pos] = pts[:, 1]
+        
+        # Archi: centro relativo al punto precedente
+        i = np.zeros(len(op))
+        j = np.zeros(len(op))
+        arc = np.flatnonzero(kind > 0)
+        if len(arc):
+            op[pos[arc]] = np.where(kind[arc] == 2, w.OP_ARC_CW, w.OP_ARC_CCW)
+            i[pos[arc]] = center[arc, 0] - pts[arc - 1, 0]
+            j[pos[arc]] = center[arc, 1] - pts[arc - 1, 1]
+        w.emit(op, x, y, np.repeat(power, count), i, j)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
 #  GENERATORE GCODE DA IMMAGINE (RASTER DIRETTO)
 # ══════════════════════════════════════════════════════════════════════════════
+# Pool di processi per il raster a fasce, creato alla prima richiesta e
+# riusato (su Windows avviare i processi costa più del lavoro di una fascia)
+_RASTER_POOL = None
+_RASTER_POOL_WORKERS = 0
+
+
+def _raster_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool di processi per il raster con il numero di worker indicato."""
+    global _RASTER_POOL, _RASTER_POOL_WORKERS
+    if _RASTER_POOL is None or _RASTER_POOL_WORKERS != workers:
+        if _RASTER_POOL is not None:
+            _RASTER_POOL.shutdown(wait=False)
+        _RASTER_POOL = ProcessPoolExecutor(max_workers=workers)
+        _RASTER_POOL_WORKERS = workers
+    return _RASTER_POOL
+
+
+def _raster_band(gen: 'ImageGCodeGenerator', scan, rows, flip, width_mm, height_mm,
+                 resolution, direction):
+    """
+    Worker del pool: righe GCode e movimenti di una fascia di righe raster.
+    
+    Il writer della fascia parte dallo stato che il corpo raster trova
+    dopo l'header (F di lavoro, M4 S0 in laser mode), così la tabella
+    movimenti coincide con quella del programma intero.
+    
+    Returns:
+        (testo, colonne MoveTable): righe unite da newline in un solo
+        blocco di byte (passare al processo principale milioni di str
+        costa quanto formattarle) e colonne della tabella movimenti
+    """
+    w = _GCodeWriter()
+    w.set_feed(gen.feed)
+    if gen.laser_mode:
+        w.laser_dynamic(0)
+    skip = w.n_lines
+    w.emit(*gen._raster_columns(w, scan, rows, flip, width_mm, height_mm,
+                                resolution, direction))
+    cols = w._columns()
+    lines = w._render(*cols)[skip:]
+    moves = w._moves(*cols)[0]
+    return "\n".join(lines).encode("utf-8"), moves.columns()
+
+
+def _resample_strip(source, k0: int, k1: int, sy: float, target_w: int) -> 'np.ndarray':
+    """
+    Righe k0..k1 dell'immagine ridimensionata, leggendo dalla sorgente
+    solo le righe che le coprono.
+    
+    Media per area separabile: in orizzontale con INTER_AREA (BOX con
+    PIL), in verticale con l'integrale delle righe tra i bordi (anche
+    frazionari) di ogni riga target. Con fattori interi coincide con la
+    media a blocchi di cv2.resize INTER_AREA sull'immagine intera; con
+    fattori non interi può differire di 1 livello (arrotondamenti) e in
+    ingrandimento resta una media per area (INTER_AREA è bilineare).
+    
+    Args:
+        source: Array grayscale (righe × colonne), anche np.memmap
+        k0, k1: Righe target da produrre
+        sy: Righe sorgente per riga target
+        target_w: Larghezza target in pixel
+    
+    Returns:
+        Array uint8 (k1 - k0) × target_w
+    """
+    src_h = source.shape[0]
+    a = min(src_h - 1, int(math.floor(k0 * sy)))
+    b = max(a + 1, min(src_h, int(math.ceil(k1 * sy))))
+    rows = np.asarray(source[a:b], dtype=np.float32)
+    try:
+        import cv2
+        rows = cv2.resize(rows, (target_w, b - a), interpolation=cv2.INTER_AREA)
+    except ImportError:
+        from PIL import Image
+        rows = np.asarray(Image.fromarray(rows, mode="F").resize((target_w, b - a), Image.BOX))
+    
+    # Integrale per righe: lineare a tratti tra i bordi delle righe sorgente
+    acc = np.zeros((b - a + 1, target_w))
+    np.cumsum(rows, axis=0, out=acc[1:])
+    t = np.clip(np.arange(k0, k1 + 1) * sy - a, 0, b - a)
+    i = np.minimum(t.astype(np.int64), b - a - 1)
+    f = (t - i)[:, None]
+    integral = acc[i] * (1 - f) + acc[i + 1] * f
+    out = (integral[1:] - integral[:-1]) / np.diff(t)[:, None]
+    return np.clip(np.rint(out), 0, 255).astype(np.uint8)
+
+
+def _raster_runs(scan: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray', 'np.ndarray']:
+    """
+    Run a potenza costante di tutte le righe di scansione.
+    
+    Args:
+        scan: Potenze (righe × pixel) nell'ordine di scansione
+    
+    Returns:
+        (line, start, end, power): riga, primo pixel, pixel dopo l'ultimo
+        e potenza di ogni run, in ordine di scansione
+    """
+    n_px = scan.shape[1]
+    new = np.ones(scan.shape, dtype=bool)
+    new[:, 1:] = scan[:, 1:] != scan[:, :-1]
+    idx = np.flatnonzero(new)
+    line, start = np.divmod(idx, n_px)
+    end = np.append(start[1:], n_px)
+    end[np.append(line[1:] != line[:-1], True)] = n_px
+    return line, start, end, scan.reshape(-1)[idx]
+
+
+def _rotated_frame(width_mm: float, height_mm: float,
+                   angle: float) -> Tuple[float, float, float, float, float, float]:
+    """
+    Sistema di riferimento della scansione inclinata.
+    
+    u è la coordinata lungo le righe (versore cos, sin), v quella
+    attraverso (versore -sin, cos); la prima riga è quella con v massimo,
+    come la riga in alto della scansione orizzontale.
+    
+    Args:
+        width_mm: Larghezza in mm
+        height_mm: Altezza in mm
+        angle: Angolo delle righe rispetto all'asse X (gradi, antiorario)
+    
+    Returns:
+        (cos, sin, u0, v0, along, across): versore delle righe, u minimo,
+        v massimo ed estensione dell'immagine lungo e attraverso le righe
+    """
+    a = math.radians(angle)
+    c, s = math.cos(a), math.sin(a)
+    corners = ((0.0, 0.0), (width_mm, 0.0), (0.0, height_mm), (width_mm, height_mm))
+    u = [x * c + y * s for x, y in corners]
+    v = [y * c - x * s for x, y in corners]
+    return c, s, min(u), max(v), max(u) - min(u), max(v) - min(v)
+
+
+def _diffuse_levels(level: 'np.ndarray', n: int) -> 'np.ndarray':
+    """
+    Quantizza una mappa di livelli (0-1) su n livelli diffondendo l'errore
+    lungo le righe.
+    
+    L'errore di arrotondamento di ogni pixel passa al pixel successivo
+    della stessa riga: il tono medio di ogni tratto resta quello
+    originale. Tutte le righe avanzano insieme, un passo NumPy per colonna.
+    
+    Args:
+        level: Livelli (righe × colonne), 0 = spento, 1 = potenza massima
+        n: Numero di livelli
+    
+    Returns:
+        Indici di livello 0..n-1 (uint8 per n <= 256)
+    """
+    scaled = level * (n - 1)
+    out = np.empty(level.shape, dtype=np.uint8 if n <= 256 else np.int64)
+    err = np.zeros(level.shape[0])
+    for c in range(level.shape[1]):
+        v = scaled[:, c] + err
+        q = np.clip(np.rint(v), 0, n - 1)
+        err = v - q
+        out[:, c] = q
+    return out
+
+
+def _diffuse_wavefront(img: 'np.ndarray', kernel,
+                       carry: Optional['np.ndarray'] = None) -> 'np.ndarray':
+    """
+    Error diffusion bianco/nero in ordine di scansione (sinistra → destra).
+    
+    Un pixel dipende solo dai pixel a sinistra nella sua riga e da quelli
+    delle righe sopra entro la portata del kernel: i pixel con uguale
+    x + skew·y sono indipendenti e si elaborano insieme. Nel buffer piatto
+    con bordi ogni fronte è una slice a passo costante, così ogni passo
+    è un'operazione NumPy per tap e il risultato coincide col doppio
+    ciclo pixel per pixel. L'errore che esce dai lati va perso.
+    
+    Args:
+        img: Array grayscale (righe × colonne)
+        kernel: (divisore, ((dx, dy, peso), ...))
+        carry: Errore delle righe successive (righe del kernel × colonne):
+               sommato all'ingresso e aggiornato con l'errore che esce
+               dal fondo, per elaborare l'immagine a strisce
+    
+    Returns:
+        Array uint8 con soli 0 e 255
+    """
+    div, taps = kernel
+    h, w = img.shape
+    pad = max(abs(dx) for dx, _, _ in taps)
+    rows = max(dy for _, dy, _ in taps)
+    # Il ricevente di ogni tap deve stare su un fronte successivo
+    skew = max([1] + [-dx // dy + 1 for dx, dy, _ in taps if dy > 0])
+    wp = w + 2 * pad
+    buf = np.zeros((h + rows + 1) * wp)
+    grid = buf.reshape(-1, wp)
+    grid[:h, pad:pad + w] = img
+    if carry is not None:
+        grid[:rows, pad:pad + w] += carry
+    step = wp - skew
+    offsets = [(dy * wp + dx, wt / div) for dx, dy, wt in taps]
+    
+    for t in range(w + skew * (h - 1)):
+        y0 = max(0, -(-(t - w + 1) // skew))
+        y1 = min(h - 1, t // skew)
+        start = y0 * step + t + pad
+        stop = start + (y1 - y0) * step + 1
+        v = buf[start:stop:step]
+        q = np.where(v > 127, 255.0, 0.0)
+        err = v - q
+        buf[start:stop:step] = q
+        for off, wt in offsets:
+            buf[start + off:stop + off:step] += err * wt
+    
+    if carry is not None:
+        carry[:] = grid[h:h + rows, pad:pad + w]
+    return grid[:h, pad:pad + w].astype(np.uint8)
+
+
+def _diffuse_serpentine(img: 'np.ndarray', kernel, carry: Optional['np.ndarray'] = None,
+                        row0: int = 0) -> 'np.ndarray':
+    """
+    Error diffusion bianco/nero a scansione serpentina.
+    
+    Le righe dispari vanno da destra a sinistra con il kernel specchiato,
+    evitando le scie diagonali dell'ordine fisso. Ogni riga dipende dalla
+    riga intera precedente, quindi si procede riga per riga: il passaggio
+    dell'errore lungo la riga è un ciclo su liste, la distribuzione alle
+    righe sotto è vettoriale.
+    
+    Args:
+        img: Array grayscale (righe × colonne)
+        kernel: (divisore, ((dx, dy, peso), ...)), con tap sulla stessa
+                riga solo a dx = 1 e dx = 2
+        carry: Errore delle righe successive, come in _diffuse_wavefront
+        row0: Indice della prima riga nell'immagine intera (verso delle righe)
+    
+    Returns:
+        Array uint8 con soli 0 e 255
+    """
+    div, taps = kernel
+    h, w = img.shape
+    pad = max(abs(dx) for dx, _, _ in taps)
+    rows = max(dy for _, dy, _ in taps)
+    buf = np.zeros((h + rows, w + 2 * pad))
+    buf[:h, pad:pad + w] = img
+    if carry is not None:
+        buf[:rows, pad:pad + w] += carry
+    same_row = {dx: wt / div for dx, dy, wt in taps if dy == 0}
+    c1 = same_row.get(1, 0.0)
+    c2 = same_row.get(2, 0.0)
+    below = [(dy, dx, wt / div) for dx, dy, wt in taps if dy > 0]
+    out = np.empty((h, w), dtype=np.uint8)
+    
+    for y in range(h):
+        reverse = (row0 + y) % 2 == 1
+        row = buf[y, pad:pad + w]
+        vals = (row[::-1] if reverse else row).tolist()
+        e1 = e2 = 0.0
+        for i in range(w):
+            v = vals[i] + c1 * e1 + c2 * e2
+            vals[i] = v
+            e2 = e1
+            e1 = v - 255.0 if v > 127 else v
+        v = np.array(vals)
+        if reverse:
+            v = v[::-1]
+        on = v > 127
+        out[y] = on * 255
+        err = v - on * 255.0
+        for dy, dx, wt in below:
+            if reverse:
+                dx = -dx
+            buf[y + dy, pad + dx:pad + dx + w] += err * wt
+    
+    if carry is not None:
+        carry[:] = buf[h:h + rows, pad:pad + w]
+    return out
+
+
+def _bayer_matrix(n: int) -> 'np.ndarray':
+    """Matrice di Bayer (ordine dei ranghi 0..n²-1), n potenza di 2."""
+    m = np.zeros((1, 1), dtype=np.int64)
+    while m.shape[0] < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+
+def _clustered_dot_matrix(n: int) -> 'np.ndarray':
+    """
+    Matrice clustered-dot n×n: i ranghi crescono dal centro della cella
+    verso l'esterno, così ogni cella accende un unico punto che si allarga
+    con il grigio.
+    """
+    c = (n - 1) / 2
+    y, x = np.mgrid[0:n, 0:n]
+    order = np.lexsort((np.arctan2(y - c, x - c).ravel(),
+                        np.hypot(y - c, x - c).ravel()))
+    rank = np.empty(n * n, dtype=np.int64)
+    rank[order] = np.arange(n * n)
+    return rank.reshape(n, n)
+
+
+@lru_cache(maxsize=None)
+def _blue_noise_tile(n: int = 64, sigma: float = 1.5, seed: int = 0) -> 'np.ndarray':
+    """
+    Tile di blue noise n×n (ranghi 0..n²-1) con il metodo void-and-cluster.
+    
+    Calcolata una volta per processo (~0.1 s) e poi riusata: l'energia
+    di ogni pixel è la somma di gaussiane periodiche centrate sui punti
+    accesi, aggiornata a ogni punto aggiunto o tolto.
+    
+    Args:
+        n: Lato della tile
+        sigma: Ampiezza della gaussiana (pixel)
+        seed: Seme del pattern iniziale (tile riproducibile)
+    
+    Returns:
+        Array int64 n×n di ranghi
+    """
+    d = np.minimum(np.arange(n), n - np.arange(n))
+    gauss = np.tile(np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma ** 2)), (2, 2))
+    
+    def splat(energy, p, sign):
+        y, x = divmod(int(p), n)
+        energy += sign * gauss[n - y:2 * n - y, n - x:2 * n - x]
+    
+    # Pattern iniziale: 10% di punti casuali, poi si sposta il punto nel
+    # cluster più denso nel vuoto più grande finché è stabile
+    rng = np.random.default_rng(seed)
+    pattern = np.zeros((n, n), dtype=bool)
+    energy = np.zeros((n, n))
+    for p in rng.choice(n * n, n * n // 10, replace=False):
+        pattern.flat[p] = True
+        splat(energy, p, 1)
+    while True:
+        cluster = np.where(pattern, energy, -np.inf).argmax()
+        pattern.flat[cluster] = False
+        splat(energy, cluster, -1)
+        void = np.where(pattern, np.inf, energy).argmin()
+        pattern.flat[void] = True
+        splat(energy, void, 1)
+        if void == cluster:
+            break
+    
+    # Ranghi: i punti iniziali in ordine inverso di densità, poi i vuoti
+    rank = np.empty(n * n, dtype=np.int64)
+    ones = int(pattern.sum())
+    p1, e1 = pattern.copy(), energy.copy()
+    for r in range(ones - 1, -1, -1):
+        cluster = np.where(p1, e1, -np.inf).argmax()
+        p1.flat[cluster] = False
+        splat(e1, cluster, -1)
+        rank[cluster] = r
+    for r in range(ones, n * n):
+        void = np.where(pattern, np.inf, energy).argmin()
+        pattern.flat[void] = True
+        splat(energy, void, 1)
+        rank[void] = r
+    return rank.reshape(n, n)
+
+
 class ImageGCodeGenerator:
     """
     Generatore GCode direttamente da immagine raster.
@@ -346,7 +3035,10 @@ class ImageGCodeGenerator:
     
     Modalità supportate:
     - Grayscale PWM: modula S in base al grigio (più scuro = più potenza)
-    - Dithering: converte in pattern on/off con Floyd-Steinberg
+    - Dithering: converte in pattern on/off per diffusione dell'errore
+      (Floyd-Steinberg, Atkinson, Jarvis-Judice-Ninke, Stucki, Sierra)
+    - Halftone: soglia con matrice ripetuta (Bayer, clustered-dot,
+      blue noise), un solo confronto NumPy sull'intera immagine
     - Threshold: semplice soglia on/off
     """
     
@@ -355,12 +3047,59 @@ class ImageGCodeGenerator:
         GRAYSCALE = auto()    # Modula potenza in base al grigio
         DITHERING = auto()    # Floyd-Steinberg dithering
         THRESHOLD = auto()    # Semplice soglia
+        ATKINSON = auto()     # Atkinson: diffonde 3/4 dell'errore, più contrasto
+        JARVIS = auto()       # Jarvis-Judice-Ninke: kernel 5×3, toni più morbidi
+        STUCKI = auto()       # Stucki: come JJN, più nitido
+        SIERRA = auto()       # Sierra (3 righe)
+        BAYER = auto()        # Halftone ordinato Bayer (2×2 … 8×8)
+        CLUSTERED_DOT = auto()  # Halftone a punti raggruppati (retino)
+        BLUE_NOISE = auto()   # Halftone con tile di blue noise
+    
+    # Kernel di diffusione dell'errore: (divisore, ((dx, dy, peso), ...))
+    DIFFUSION_KERNELS = {
+        Mode.DITHERING: (16, ((1, 0, 7),
+                              (-1, 1, 3), (0, 1, 5), (1, 1, 1))),
+        Mode.ATKINSON: (8, ((1, 0, 1), (2, 0, 1),
+                            (-1, 1, 1), (0, 1, 1), (1, 1, 1),
+                            (0, 2, 1))),
+        Mode.JARVIS: (48, ((1, 0, 7), (2, 0, 5),
+                           (-2, 1, 3), (-1, 1, 5), (0, 1, 7), (1, 1, 5), (2, 1, 3),
+                           (-2, 2, 1), (-1, 2, 3), (0, 2, 5), (1, 2, 3), (2, 2, 1))),
+        Mode.STUCKI: (42, ((1, 0, 8), (2, 0, 4),
+                           (-2, 1, 2), (-1, 1, 4), (0, 1, 8), (1, 1, 4), (2, 1, 2),
+                           (-2, 2, 1), (-1, 2, 2), (0, 2, 4), (1, 2, 2), (2, 2, 1))),
+        Mode.SIERRA: (32, ((1, 0, 5), (2, 0, 3),
+                           (-2, 1, 2), (-1, 1, 4), (0, 1, 5), (1, 1, 4), (2, 1, 2),
+                           (-1, 2, 2), (0, 2, 3), (1, 2, 2))),
+    }
+    # Modalità a soglia con matrice ripetuta
+    HALFTONE_MODES = (Mode.BAYER, Mode.CLUSTERED_DOT, Mode.BLUE_NOISE)
+    
+    # Potenze fino a min_power + SKIP_MARGIN: laser spento (risparmia comandi)
+    SKIP_MARGIN = 5
+    # Laser mode: tratti spenti più lunghi (mm) percorsi in G0 invece che a S0
+    RAPID_GAP_MM = 10.0
+    # Raster a fasce nel pool di processi da questa dimensione (pixel) in su
+    PARALLEL_MIN_PIXELS = 1_000_000
+    # Memoria di lavoro per pixel target nella generazione a strisce
+    # (mappa potenze, dithering, colonne dei comandi e righe di testo;
+    # caso peggiore misurato, grayscale su rumore: ~400 byte)
+    TILE_BYTES_PER_PIXEL = 450
     
     def __init__(self, 
                  feed: int = 1000,
                  max_power: int = 255,
                  min_power: int = 0,
-                 passes: int = 1):
+                 passes: int = 1,
+                 gamma: float = 1.0,
+                 overscan: float = 0.0,
+                 laser_mode: bool = False,
+                 power_levels: int = 0,
+                 diffuse_levels: bool = False,
+                 serpentine: bool = False,
+                 halftone_size: int = 4,
+                 raster_angle: float = 45.0,
+                 workers: int = 0):
         """
         Inizializza il generatore da immagine.
         
@@ -369,11 +3108,40 @@ class ImageGCodeGenerator:
             max_power: Potenza massima (0-255)
             min_power: Potenza minima (0-255)
             passes: Numero di passate
+            gamma: Curva di risposta grigio → potenza (1 = lineare,
+                   > 1 schiarisce i mezzitoni)
+            overscan: Tratto a laser spento prima e dopo ogni riga (mm),
+                      per accelerare e frenare fuori dall'immagine
+            laser_mode: Laser mode GRBL ($32=1): M4 una volta e potenza
+                        inline su ogni G1 (S0 nei tratti spenti)
+            power_levels: Livelli di potenza in GRAYSCALE (es. 8/16/32,
+                          0 = tutti): run più lunghi e meno righe
+            diffuse_levels: Diffonde l'errore di quantizzazione lungo la
+                            scansione per conservare i toni
+            serpentine: Dithering a serpentina (righe alterne invertite,
+                        niente scie diagonali ma ciclo Python per pixel:
+                        circa 1 s a 2000×2000); False = ordine fisso a
+                        fronti vettoriali, 0.2-0.5 s
+            halftone_size: Lato della cella per BAYER (2, 4, 8) e
+                           CLUSTERED_DOT (pixel)
+            raster_angle: Angolo delle righe per RasterDirection.DIAGONAL
+                          (gradi dall'asse X, antiorario)
+            workers: Processi per il raster dei lavori grandi (0 = un
+                     processo per core, 1 = tutto nel processo corrente)
         """
         self.feed = feed
         self.max_power = max_power
         self.min_power = min_power
         self.passes = passes
+        self.gamma = gamma
+        self.overscan = overscan
+        self.laser_mode = laser_mode
+        self.power_levels = power_levels
+        self.diffuse_levels = diffuse_levels
+        self.serpentine = serpentine
+        self.halftone_size = halftone_size
+        self.raster_angle = raster_angle
+        self.workers = workers
         self.rapid_feed = 3000
     
     # ══════════════════════════════════════════════════════════════════════════
@@ -381,7 +3149,8 @@ class ImageGCodeGenerator:
     # ══════════════════════════════════════════════════════════════════════════
     @staticmethod
     def calculate_resolution(width_mm: float, height_mm: float, 
-                            max_lines: int, direction: RasterDirection) -> Tuple[float, int, int]:
+                            max_lines: int, direction: RasterDirection,
+                            angle: float = 45.0) -> Tuple[float, int, int]:
         """
         Calcola risoluzione ottimale in base al numero massimo di righe.
         
@@ -389,7 +3158,8 @@ class ImageGCodeGenerator:
             width_mm: Larghezza in mm
             height_mm: Altezza in mm
             max_lines: Numero massimo di righe di scansione
-            direction: RasterDirection (HORIZONTAL o VERTICAL)
+            direction: RasterDirection
+            angle: Angolo delle righe in DIAGONAL (gradi)
         
         Returns:
             (resolution_mm, actual_lines, pixels_per_line)
@@ -398,6 +3168,11 @@ class ImageGCodeGenerator:
             resolution_mm = height_mm / max_lines
             actual_lines = max_lines
             pixels_per_line = max(1, int(width_mm / resolution_mm))
+        elif direction == RasterDirection.DIAGONAL:
+            _, _, _, _, along, across = _rotated_frame(width_mm, height_mm, angle)
+            resolution_mm = across / max_lines
+            actual_lines = max_lines
+            pixels_per_line = max(1, math.ceil(round(along / resolution_mm, 6)))
         else:
             resolution_mm = width_mm / max_lines
             actual_lines = max_lines
@@ -407,7 +3182,8 @@ class ImageGCodeGenerator:
     
     @staticmethod
     def preview_image(image_array, width_mm: float, height_mm: float,
-                     max_lines: int, direction: RasterDirection):
+                     max_lines: int, direction: RasterDirection,
+                     angle: float = 45.0):
         """
         Genera anteprima dell'immagine ridimensionata per la generazione GCode.
         
@@ -417,6 +3193,7 @@ class ImageGCodeGenerator:
             height_mm: Altezza target in mm
             max_lines: Numero massimo righe
             direction: Direzione scansione
+            angle: Angolo delle righe in DIAGONAL (gradi)
         
         Returns:
             (preview_array, resolution_mm, total_lines, estimated_moves)
@@ -424,12 +3201,16 @@ class ImageGCodeGenerator:
         import numpy as np
         
         resolution_mm, actual_lines, pixels_per_line = \
-            ImageGCodeGenerator.calculate_resolution(width_mm, height_mm, max_lines, direction)
+            ImageGCodeGenerator.calculate_resolution(width_mm, height_mm, max_lines,
+                                                     direction, angle)
         
         # Calcola dimensioni preview
         if direction == RasterDirection.HORIZONTAL:
             preview_h = actual_lines
             preview_w = pixels_per_line
+        elif direction == RasterDirection.DIAGONAL:
+            preview_w = max(1, round(width_mm / resolution_mm))
+            preview_h = max(1, round(height_mm / resolution_mm))
         else:
             preview_w = actual_lines
             preview_h = pixels_per_line
@@ -474,7 +3255,9 @@ class ImageGCodeGenerator:
             width_mm: Larghezza finale in mm
             height_mm: Altezza finale in mm
             max_lines: Numero massimo di righe di scansione (controlla risoluzione)
-            mode: Modalità di conversione (GRAYSCALE, DITHERING, THRESHOLD)
+            mode: Modalità di conversione (GRAYSCALE, THRESHOLD o un
+                  dithering: DITHERING, ATKINSON, JARVIS, STUCKI, SIERRA,
+                  BAYER, CLUSTERED_DOT, BLUE_NOISE)
             direction: Direzione di scansione
             raster_mode: Unidirezionale o bidirezionale
             invert: Se True, nero=laser ON (tipico per incisione)
@@ -483,7 +3266,8 @@ class ImageGCodeGenerator:
             threshold: Soglia per modalità THRESHOLD
         
         Returns:
-            GCodeProgram completo
+            GCodeProgram completo, con statistiche azzerate: il chiamante
+            le calcola con calculate_statistics(feed, machine)
         """
         import numpy as np
         
@@ -492,11 +3276,16 @@ class ImageGCodeGenerator:
         
         # Calcola risoluzione in base a max_lines
         resolution_mm, actual_lines, pixels_per_line = \
-            self.calculate_resolution(width_mm, height_mm, max_lines, direction)
+            self.calculate_resolution(width_mm, height_mm, max_lines, direction,
+                                      self.raster_angle)
         
-        # Ridimensiona immagine alla risoluzione target
+        # Ridimensiona immagine alla risoluzione target (in DIAGONAL pixel
+        # quadrati di lato resolution_mm, campionati poi lungo le righe)
         if direction == RasterDirection.HORIZONTAL:
             target_w, target_h = pixels_per_line, actual_lines
+        elif direction == RasterDirection.DIAGONAL:
+            target_w = max(1, round(width_mm / resolution_mm))
+            target_h = max(1, round(height_mm / resolution_mm))
         else:
             target_w, target_h = actual_lines, pixels_per_line
         
@@ -510,54 +3299,276 @@ class ImageGCodeGenerator:
             pil_img = pil_img.resize((target_w, target_h), Image.LANCZOS)
             img_resized = np.array(pil_img)
         
-        # Applica dithering se richiesto
-        if mode == self.Mode.DITHERING:
-            img_resized = self._floyd_steinberg_dithering(img_resized.astype(np.float32))
+        # DIAGONAL: da qui si lavora sulla griglia delle righe inclinate,
+        # così dithering e livelli seguono la scansione reale
+        inside = None
+        if direction == RasterDirection.DIAGONAL:
+            img_resized, inside = self._rotated_scan(
+                img_resized, width_mm, height_mm, resolution_mm,
+                background=255 if invert else 0)
+        
+        power_map = self._power_map(img_resized, mode, direction, invert, threshold)
+        if inside is not None:
+            power_map[~inside] = 0
         
         # Genera header
-        raw = self._generate_header(width_mm, height_mm, resolution_mm, mode, direction)
-        raw.append(f"; Max Lines Limit: {max_lines}")
-        raw.append(f"; Actual Lines: {actual_lines}")
-        raw.append(f"; Pixels per Line: {pixels_per_line}")
-        raw.append(f"; Raster Mode: {raster_mode.name}")
-        raw.append("")
-        
-        # Genera percorsi per ogni passata
-        for p in range(self.passes):
-            if self.passes > 1:
-                raw.append(f"")
-                raw.append(f"; --- Passata {p + 1}/{self.passes} ---")
-            
-            if direction == RasterDirection.HORIZONTAL:
-                raw.extend(self._generate_horizontal_raster(
-                    img_resized, width_mm, height_mm, resolution_mm,
-                    mode, raster_mode, invert, threshold))
-            else:
-                raw.extend(self._generate_vertical_raster(
-                    img_resized, width_mm, height_mm, resolution_mm,
-                    mode, raster_mode, invert, threshold))
+        w = _GCodeWriter()
+        self._generate_header(w, width_mm, height_mm, resolution_mm, mode, direction)
+        self._raster_info(w, max_lines, actual_lines, pixels_per_line, mode,
+                          direction, raster_mode)
         
-        raw.extend(self._generate_footer())
+        # Raster generato una volta: le passate sono un conteggio di ripetizioni
+        w.begin_body()
+        self._generate_raster(w, power_map, width_mm, height_mm, resolution_mm,
+                              direction, raster_mode)
+        w.end_body()
+        
+        w.footer()
         
         # Crea programma
-        prog = GCodeProgram()
-        prog.raw_lines = raw
-        prog.moves = GCodeParser.parse(raw)
-        prog.offset_x = offset_x
-        prog.offset_y = offset_y
-        prog.width_mm = width_mm
-        prog.height_mm = height_mm
-        prog.source = GCodeSource.IMAGE
-        prog.calculate_statistics(self.feed)
+        prog = w.program(offset_x=offset_x, offset_y=offset_y,
+                         width_mm=width_mm, height_mm=height_mm,
+                         source=GCodeSource.IMAGE, passes=self.passes,
+                         feed=self.feed)
+        
+        return prog
+    
+    # ══════════════════════════════════════════════════════════════════════════
+    #  GENERAZIONE A STRISCE (IMMAGINI PIÙ GRANDI DELLA MEMORIA)
+    # ══════════════════════════════════════════════════════════════════════════
+    def tile_rows(self, source_shape: Tuple[int, int], target_w: int, target_h: int,
+                  memory_mb: int = 256) -> int:
+        """
+        Righe target per striscia entro il budget di memoria.
+        
+        Per riga target: righe sorgente lette in float32 e ridimensionate
+        in orizzontale, più TILE_BYTES_PER_PIXEL per pixel target.
+        """
+        src_h, src_w = source_shape
+        sy = src_h / target_h
+        per_line = ((sy + 1) * (src_w * 4 + target_w * 12) +
+                    target_w * self.TILE_BYTES_PER_PIXEL)
+        return max(1, min(target_h, int(memory_mb * 2 ** 20 // per_line)))
+    
+    def iter_tiled(self,
+                   source,
+                   width_mm: float,
+                   height_mm: float,
+                   max_lines: int = 200,
+                   mode: Optional['ImageGCodeGenerator.Mode'] = None,
+                   direction: RasterDirection = RasterDirection.HORIZONTAL,
+                   raster_mode: RasterMode = RasterMode.BIDIRECTIONAL,
+                   invert: bool = True,
+                   offset_x: float = 0.0,
+                   offset_y: float = 0.0,
+                   threshold: int = 128,
+                   memory_mb: int = 256,
+                   compact: Optional['CompactSettings'] = None,
+                   stats: Optional[GCodeProgram] = None) -> Iterator[str]:
+        """
+        Righe GCode del raster orizzontale generato a strisce.
+        
+        Per immagini più grandi della memoria: ogni striscia di righe
+        target viene letta dalla sorgente, ridimensionata, convertita in
+        potenze e formattata, poi rilasciata. Il dithering porta l'errore
+        da una striscia alla successiva e halftone e verso delle righe
+        proseguono dalla striscia precedente.
+        
+        Limiti rispetto a build_from_array:
+        - solo RasterDirection.HORIZONTAL (le altre direzioni richiedono
+          colonne intere o righe inclinate dell'immagine): ValueError;
+        - sorgente grayscale 2D già in memoria o mappata (np.memmap, .npy),
+          nessun decoder di formati immagine a strisce;
+        - ridimensionamento per area di _resample_strip: con fattori di
+          scala interi le righe coincidono con build_from_array, con
+          fattori non interi i livelli possono differire di 1 (arrotondamenti)
+          e in ingrandimento la media per area sostituisce l'interpolazione
+          bilineare di INTER_AREA;
+        - la tabella movimenti non viene conservata: le statistiche sono
+          accumulate striscia per striscia (tempi stimati con lookahead
+          che riparte a ogni striscia).
+        
+        Args:
+            source: Array grayscale (righe × colonne), tipicamente
+                    np.memmap, o percorso di un file .npy (aperto in mmap)
+            width_mm, height_mm, max_lines, mode, raster_mode, invert,
+            offset_x, offset_y, threshold: Come in build_from_array
+            direction: Solo RasterDirection.HORIZONTAL
+            memory_mb: Memoria di lavoro per striscia (MB)
+            compact: Opzioni di compattazione (None = righe non compattate)
+            stats: Programma in cui scrivere statistiche e numero di righe
+                   a generazione completata
+        
+        Returns:
+            Iteratore delle righe con offset applicato, pronte per il file
+            o l'invio
+        """
+        if mode is None:
+            mode = self.Mode.GRAYSCALE
+        if direction != RasterDirection.HORIZONTAL:
+            raise ValueError(f"La generazione a strisce supporta solo la direzione "
+                             f"HORIZONTAL, non {direction.name}")
+        if isinstance(source, (str, os.PathLike)):
+            source = np.load(source, mmap_mode="r")
+        if len(source.shape) != 2:
+            raise ValueError("La generazione a strisce richiede un'immagine grayscale (2D)")
+        
+        resolution_mm, actual_lines, pixels_per_line = \
+            self.calculate_resolution(width_mm, height_mm, max_lines, direction)
+        target_w, target_h = pixels_per_line, actual_lines
+        sy = source.shape[0] / target_h
+        strip = self.tile_rows(source.shape, target_w, target_h, memory_mb)
+        
+        # Header e footer come in build_from_array (corpo vuoto)
+        w = _GCodeWriter()
+        self._generate_header(w, width_mm, height_mm, resolution_mm, mode, direction)
+        self._raster_info(w, max_lines, actual_lines, pixels_per_line, mode,
+                          direction, raster_mode)
+        w.begin_body()
+        w.end_body()
+        w.footer()
+        frame = w.program(offset_x=offset_x, offset_y=offset_y,
+                          width_mm=width_mm, height_mm=height_mm,
+                          source=GCodeSource.IMAGE, passes=self.passes,
+                          feed=self.feed)
+        
+        # Statistiche: ogni blocco di movimenti riparte dall'ultimo del precedente
+        total = [0.0, 0.0, 0.0]
+        prev = None
+        
+        def account(moves: MoveTable):
+            nonlocal prev
+            if not len(moves):
+                return
+            k = 0
+            if prev is not None:
+                moves = MoveTable(*(np.concatenate(c) for c in zip(prev.columns(), moves.columns())))
+                k = 1
+            on = moves.laser_on[k:]
+            seg = moves.segment_lengths()[k:]
+            total[0] += float(seg.sum())
+            total[1] += float(seg[on].sum())
+            total[2] += float(estimate_move_times(moves, None, self.feed)[k:].sum())
+            prev = moves[len(moves) - 1:]
+        
+        def body() -> Iterator[str]:
+            yield from frame.raw_lines
+            for p in range(self.passes):
+                if self.passes > 1:
+                    yield ""
+                    yield f"; --- Passata {p + 1}/{self.passes} ---"
+                carry = (self.diffusion_carry(mode, target_w)
+                         if mode in self.DIFFUSION_KERNELS else None)
+                u = None
+                for k0 in range(0, target_h, strip):
+                    k1 = min(target_h, k0 + strip)
+                    img = _resample_strip(source, k0, k1, sy, target_w)
+                    power_map = self._power_map(img, mode, direction, invert,
+                                                threshold, carry, k0)
+                    # Writer della striscia nello stato del corpo raster
+                    sw = _GCodeWriter()
+                    sw.set_feed(self.feed)
+                    if self.laser_mode:
+                        sw.laser_dynamic(0)
+                    skip = sw.n_lines
+                    u = self._generate_raster(sw, power_map, width_mm, height_mm,
+                                              resolution_mm, direction, raster_mode, k0, u)
+                    cols = sw._columns()
+                    yield from sw._render(*cols)[skip:]
+                    account(sw._moves(*cols)[0])
+            account(frame.moves)
+            yield from frame.footer_lines
+        
+        def counted(lines: Iterator[str]) -> Iterator[str]:
+            n = 0
+            for line in lines:
+                n += 1
+                yield line
+            if stats is not None:
+                stats.total_distance_mm, stats.laser_on_distance_mm, \
+                    stats.estimated_time_seconds = total
+                stats.source_line_count = n
+        
+        # Parametri verificati subito, le righe prodotte su richiesta
+        lines = frame._translate(map(frame._fill_template, body()))
+        if compact is not None:
+            lines = GCodeCompactor(compact).iter_lines(lines)
+        return counted(lines)
+    
+    def write_tiled(self, source, filepath: str, width_mm: float, height_mm: float,
+                    compress: Optional[bool] = None, **kwargs) -> GCodeProgram:
+        """
+        Genera il raster a strisce (vedi iter_tiled) direttamente su file.
+        
+        Args:
+            source: Immagine sorgente, come in iter_tiled
+            filepath: Percorso del file GCode
+            width_mm, height_mm: Dimensioni finali in mm
+            compress: Scrive in formato gzip (None = automatico per .gz)
+            **kwargs: Altri parametri di iter_tiled
         
+        Returns:
+            GCodeProgram in streaming dal file scritto (offset già
+            applicato), con statistiche e senza tabella movimenti
+        """
+        prog = GCodeProgram(width_mm=width_mm, height_mm=height_mm,
+                            source=GCodeSource.IMAGE, source_file=filepath)
+        _write_lines(filepath, self.iter_tiled(source, width_mm, height_mm,
+                                               stats=prog, **kwargs), compress)
         return prog
     
+    def _power_map(self, img, mode: 'ImageGCodeGenerator.Mode', direction: RasterDirection,
+                   invert: bool, threshold: int, carry: Optional['np.ndarray'] = None,
+                   row0: int = 0) -> 'np.ndarray':
+        """
+        Mappa potenze (righe × colonne) dall'immagine alla risoluzione target.
+        
+        Applica dithering o halftone se richiesti, poi la LUT delle potenze
+        (livelli con errore diffuso lungo la direzione di scansione).
+        
+        Args:
+            img: Array numpy grayscale (0-255) alla risoluzione target
+            mode, direction, invert, threshold: Come in build_from_array
+            carry: Errore del dithering dalla striscia precedente
+            row0: Indice della prima riga nell'immagine intera
+        """
+        if mode in self.DIFFUSION_KERNELS:
+            img = self._error_diffusion(img, mode, carry, row0)
+        elif mode in self.HALFTONE_MODES:
+            img = self._ordered_halftone(img, mode, row0)
+        
+        if mode == self.Mode.GRAYSCALE and self.power_levels > 1 and self.diffuse_levels:
+            n = self.power_levels
+            level = self.gray_levels(invert)[img]
+            if direction == RasterDirection.VERTICAL:
+                index = _diffuse_levels(level.T, n).T
+            else:
+                index = _diffuse_levels(level, n)
+            return self._level_power(np.arange(n) / (n - 1))[index]
+        return self.power_lut(mode, invert, threshold)[img]
+    
     # ══════════════════════════════════════════════════════════════════════════
     #  GENERAZIONE HEADER/FOOTER
     # ══════════════════════════════════════════════════════════════════════════
-    def _generate_header(self, width_mm, height_mm, resolution, mode, direction) -> List[str]:
+    def _raster_info(self, w, max_lines, actual_lines, pixels_per_line, mode,
+                     direction, raster_mode):
+        """Righe informative del raster dopo l'header e stato iniziale del laser."""
+        w.text(f"; Max Lines Limit: {max_lines}",
+               f"; Actual Lines: {actual_lines}",
+               f"; Pixels per Line: {pixels_per_line}",
+               f"; Raster Mode: {raster_mode.name}")
+        if direction == RasterDirection.DIAGONAL:
+            w.text(f"; Raster Angle: {self.raster_angle:g} deg")
+        if mode in self.HALFTONE_MODES:
+            n = self.threshold_matrix(mode).shape[0]
+            w.text(f"; Halftone Cell: {n}x{n}")
+        w.text("")
+        if self.laser_mode:
+            w.laser_dynamic(0)
+    
+    def _generate_header(self, w, width_mm, height_mm, resolution, mode, direction):
         """Genera header GCode."""
-        return [
+        w.text(
             f"; PyLaser v{APP_VERSION}",
             f"; Source: IMAGE (Direct Raster)",
             f"; Generated: {time.strftime('%Y-%m-%d %H:%M:%S')}",
@@ -565,285 +3576,338 @@ class ImageGCodeGenerator:
             f"; Direction: {direction.name}",
             f"; Size: {width_mm:.2f} x {height_mm:.2f} mm",
             f"; Resolution: {resolution:.3f} mm/line",
-            f"; Feed: {self.feed} mm/min",
+            "; Feed: {feed} mm/min",
             f"; Max Power: {self.max_power}",
             f"; Min Power: {self.min_power}",
-            f"; Passes: {self.passes}",
+            f"; Gamma: {self.gamma:g}",
+            f"; Overscan: {self.overscan:.2f} mm",
+            f"; Laser Mode: {'M4 (GRBL $32=1)' if self.laser_mode else 'M3/M5'}",
+            f"; Power Levels: {self.power_levels or 'all'}"
+            f"{' (diffused)' if self.power_levels > 1 and self.diffuse_levels else ''}",
+            "; Passes: {passes}",
             "",
             "; === INIZIALIZZAZIONE ===",
             "G21          ; Unità: millimetri",
             "G90          ; Coordinate assolute",
             "G92 X0 Y0    ; Imposta origine",
-            f"F{self.feed}       ; Velocità di lavoro",
-            "M5           ; Laser OFF (sicurezza)",
-            "",
-            "; === INIZIO RASTER ===",
-        ]
-    
-    def _generate_footer(self) -> List[str]:
-        """Genera footer GCode."""
-        return [
-            "",
-            "; === FINE ===",
-            "M5           ; Laser OFF",
-            "G0 X0 Y0     ; Torna a home",
-            "M2           ; Fine programma",
-        ]
+        )
+        w.set_feed(self.feed)
+        w.laser_off("M5           ; Laser OFF (sicurezza)")
+        w.text("", "; === INIZIO RASTER ===")
     
     # ══════════════════════════════════════════════════════════════════════════
-    #  GENERAZIONE RASTER ORIZZONTALE
+    #  MAPPA POTENZE
     # ══════════════════════════════════════════════════════════════════════════
-    def _generate_horizontal_raster(self, img, width_mm, height_mm, resolution,
-                                     mode, raster_mode, invert, threshold) -> List[str]:
-        """Genera scansione raster orizzontale."""
-        lines = []
-        num_rows, num_cols = img.shape
-        
-        for row in range(num_rows):
-            y = height_mm - (row * resolution)  # Dall'alto verso il basso
-            
-            # Direzione X alternata per bidirezionale
-            if raster_mode == RasterMode.BIDIRECTIONAL and row % 2 == 1:
-                x_range = range(num_cols - 1, -1, -1)
-                x_start = width_mm
-            else:
-                x_range = range(num_cols)
-                x_start = 0.0
-            
-            # Vai all'inizio della riga (movimento rapido)
-            lines.append(f"G0 X{x_start:.3f} Y{y:.3f}")
-            
-            # Scansiona la riga
-            if mode == self.Mode.GRAYSCALE:
-                lines.extend(self._raster_line_grayscale(
-                    img[row, :], x_range, y, resolution, width_mm, invert))
-            else:
-                lines.extend(self._raster_line_threshold(
-                    img[row, :], x_range, y, resolution, width_mm, invert, threshold))
+    def gray_levels(self, invert: bool = True) -> 'np.ndarray':
+        """
+        Tabella grigio → livello di potenza 0-1 (256 valori, curva gamma).
         
-        return lines
+        Args:
+            invert: Se True, nero = livello massimo
+        """
+        level = np.arange(256) / 255.0
+        if invert:
+            level = 1.0 - level
+        return level ** self.gamma
     
-    def _raster_line_grayscale(self, row_data, x_range, y, resolution, width_mm, invert) -> List[str]:
-        """Genera linea raster con modulazione grayscale PWM."""
-        lines = []
-        laser_was_on = False
-        last_power = -1
-        
-        for i, col_idx in enumerate(x_range):
-            pixel = row_data[col_idx]
-            
-            # Calcola potenza (inverte se necessario)
-            if invert:
-                # Nero (0) = max potenza, Bianco (255) = min potenza
-                power = int(self.max_power - (pixel / 255.0) * (self.max_power - self.min_power))
-            else:
-                power = int(self.min_power + (pixel / 255.0) * (self.max_power - self.min_power))
-            
-            # Calcola coordinata X
-            if isinstance(x_range, range):
-                if x_range.step > 0:  # Range normale
-                    x = col_idx * resolution
-                else:  # Range inverso
-                    x = col_idx * resolution
-            else:
-                x = i * resolution
-            
-            # Ottimizzazione: salta pixel quasi bianchi (risparmia comandi)
-            if power <= self.min_power + 5:
-                if laser_was_on:
-                    lines.append("M5")
-                    laser_was_on = False
-                continue
-            
-            # Cambia potenza solo se diversa (ottimizzazione)
-            if power != last_power:
-                if laser_was_on:
-                    lines.append(f"M3 S{power}")
-                else:
-                    lines.append(f"M3 S{power}")
-                    laser_was_on = True
-                last_power = power
-            
-            lines.append(f"G1 X{x:.3f} Y{y:.3f}")
+    def _level_power(self, level: 'np.ndarray') -> 'np.ndarray':
+        """Potenze S dei livelli 0-1 (0 = laser spento sotto SKIP_MARGIN)."""
+        power = (self.min_power + level * (self.max_power - self.min_power)).astype(np.int64)
+        power[power <= self.min_power + self.SKIP_MARGIN] = 0
+        return np.clip(power, 0, None).astype(np.uint16)
+    
+    def power_lut(self, mode: 'ImageGCodeGenerator.Mode', invert: bool = True,
+                  threshold: int = 128) -> 'np.ndarray':
+        """
+        Tabella grigio → potenza S (256 valori) per la modalità indicata.
         
-        if laser_was_on:
-            lines.append("M5")
+        In GRAYSCALE la potenza segue la curva di risposta gamma tra
+        min_power e max_power, arrotondata a power_levels livelli se
+        impostati; i grigi che non superano min_power + SKIP_MARGIN
+        diventano 0 (laser spento). Nelle altre modalità il pixel è
+        acceso a max_power o spento.
         
-        return lines
-    
-    def _raster_line_threshold(self, row_data, x_range, y, resolution, width_mm, invert, threshold) -> List[str]:
-        """Genera linea raster con soglia semplice (on/off)."""
-        lines = []
-        laser_on = False
+        Args:
+            mode: Modalità di conversione
+            invert: Se True, nero = potenza massima
+            threshold: Soglia per le modalità on/off
         
-        for i, col_idx in enumerate(x_range):
-            pixel = row_data[col_idx]
-            
-            # Determina se laser deve essere acceso
-            if invert:
-                should_be_on = pixel < threshold  # Scuro = ON
-            else:
-                should_be_on = pixel >= threshold  # Chiaro = ON
-            
-            # Calcola coordinata X
-            if isinstance(x_range, range):
-                x = col_idx * resolution
-            else:
-                x = i * resolution
-            
-            if should_be_on and not laser_on:
-                lines.append(f"G0 X{x:.3f} Y{y:.3f}")
-                lines.append(f"M3 S{self.max_power}")
-                laser_on = True
-            elif not should_be_on and laser_on:
-                lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-                lines.append("M5")
-                laser_on = False
-            elif laser_on:
-                lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-        
-        if laser_on:
-            lines.append("M5")
-        
-        return lines
+        Returns:
+            Array uint16 di 256 potenze
+        """
+        if mode == self.Mode.GRAYSCALE:
+            level = self.gray_levels(invert)
+            if self.power_levels > 1:
+                n = self.power_levels - 1
+                level = np.rint(level * n) / n
+            return self._level_power(level)
+        v = np.arange(256)
+        on = v < threshold if invert else v >= threshold
+        return np.where(on, self.max_power, 0).astype(np.uint16)
     
     # ══════════════════════════════════════════════════════════════════════════
-    #  GENERAZIONE RASTER VERTICALE
+    #  GENERAZIONE RASTER
     # ══════════════════════════════════════════════════════════════════════════
-    def _generate_vertical_raster(self, img, width_mm, height_mm, resolution,
-                                   mode, raster_mode, invert, threshold) -> List[str]:
-        """Genera scansione raster verticale."""
-        lines = []
-        num_rows, num_cols = img.shape
-        
-        for col in range(num_cols):
-            x = col * resolution
-            
-            # Direzione Y alternata per bidirezionale
-            if raster_mode == RasterMode.BIDIRECTIONAL and col % 2 == 1:
-                y_range = range(num_rows - 1, -1, -1)
-                y_start = 0.0
-            else:
-                y_range = range(num_rows)
-                y_start = height_mm
-            
-            # Vai all'inizio della colonna
-            lines.append(f"G0 X{x:.3f} Y{y_start:.3f}")
-            
-            # Scansiona la colonna
-            if mode == self.Mode.GRAYSCALE:
-                lines.extend(self._raster_col_grayscale(
-                    img[:, col], y_range, x, height_mm, resolution, invert))
-            else:
-                lines.extend(self._raster_col_threshold(
-                    img[:, col], y_range, x, height_mm, resolution, invert, threshold))
+    def _rotated_scan(self, img, width_mm: float, height_mm: float,
+                      resolution: float, background: int = 255):
+        """
+        Campiona l'immagine lungo le righe di scansione inclinate.
+        
+        Il pixel j della riga k è il punto u = u0 + (j + ½)·resolution,
+        v = v0 - (k + ½)·resolution del sistema di _rotated_frame; il grigio
+        è interpolato bilinearmente, tutto in un'unica passata NumPy.
+        
+        Args:
+            img: Array grayscale dell'immagine intera (0-255)
+            width_mm: Larghezza in mm
+            height_mm: Altezza in mm
+            resolution: Passo tra le righe e tra i pixel (mm)
+            background: Grigio dei punti fuori dall'immagine (laser spento)
+        
+        Returns:
+            (scan, inside): griglia righe × pixel uint8 e maschera dei punti
+            che cadono dentro l'immagine
+        """
+        c, s, u0, v0, along, across = _rotated_frame(width_mm, height_mm,
+                                                     self.raster_angle)
+        n_lines = max(1, math.ceil(round(across / resolution, 6)))
+        n_px = max(1, math.ceil(round(along / resolution, 6)))
+        u = u0 + (np.arange(n_px) + 0.5) * resolution
+        v = v0 - (np.arange(n_lines) + 0.5) * resolution
+        x = u[None, :] * c - v[:, None] * s
+        y = u[None, :] * s + v[:, None] * c
+        inside = (x >= 0) & (x < width_mm) & (y > 0) & (y <= height_mm)
         
-        return lines
+        # Coordinate immagine con i centri dei pixel sugli interi
+        th, tw = img.shape
+        fx = x * (tw / width_mm) - 0.5
+        fy = (height_mm - y) * (th / height_mm) - 0.5
+        ix, iy = np.floor(fx), np.floor(fy)
+        ax, ay = fx - ix, fy - iy
+        ix, iy = ix.astype(np.int64), iy.astype(np.int64)
+        x0, x1 = np.clip(ix, 0, tw - 1), np.clip(ix + 1, 0, tw - 1)
+        y0, y1 = np.clip(iy, 0, th - 1), np.clip(iy + 1, 0, th - 1)
+        f = img.astype(np.float32)
+        val = ((f[y0, x0] * (1 - ax) + f[y0, x1] * ax) * (1 - ay) +
+               (f[y1, x0] * (1 - ax) + f[y1, x1] * ax) * ay)
+        scan = np.where(inside, np.rint(val), background).astype(np.uint8)
+        return scan, inside
     
-    def _raster_col_grayscale(self, col_data, y_range, x, height_mm, resolution, invert) -> List[str]:
-        """Genera colonna raster con modulazione grayscale."""
-        lines = []
-        laser_was_on = False
-        last_power = -1
+    def _generate_raster(self, w, power_map, width_mm, height_mm, resolution,
+                         direction, raster_mode, row0: int = 0,
+                         u: Optional[float] = None) -> Optional[float]:
+        """
+        Genera la scansione raster dalla mappa potenze (righe × colonne).
         
-        for row_idx in y_range:
-            pixel = col_data[row_idx]
-            
-            if invert:
-                power = int(self.max_power - (pixel / 255.0) * (self.max_power - self.min_power))
-            else:
-                power = int(self.min_power + (pixel / 255.0) * (self.max_power - self.min_power))
-            
-            y = height_mm - (row_idx * resolution)
-            
-            if power <= self.min_power + 5:
-                if laser_was_on:
-                    lines.append("M5")
-                    laser_was_on = False
-                continue
-            
-            if power != last_power:
-                if not laser_was_on:
-                    lines.append(f"M3 S{power}")
-                    laser_was_on = True
-                else:
-                    lines.append(f"M3 S{power}")
-                last_power = power
-            
-            lines.append(f"G1 X{x:.3f} Y{y:.3f}")
+        Ogni riga di scansione (riga o colonna dell'immagine, o riga
+        inclinata della griglia di _rotated_scan in DIAGONAL) viene
+        divisa in run a potenza costante: un G1 per run acceso, con M3 S
+        al cambio di potenza; i tratti spenti diventano M5 + G0 fino al
+        run successivo (in laser mode: un G1 S<potenza> per run e G1 S0
+        nei tratti spenti fino a RAPID_GAP_MM, senza M3/M5). Ogni pixel
+        copre [i, i + 1] × resolution lungo la scansione. Tutti i comandi
+        sono costruiti con NumPy e passati al writer con un solo emit.
+        
+        Oltre PARALLEL_MIN_PIXELS le righe vengono divise in fasce,
+        generate e formattate nel pool di processi e ricucite in ordine;
+        il verso delle righe è deciso prima, sull'intera scansione, quindi
+        il risultato è identico a quello in un solo processo.
+        
+        Le righe senza pixel accesi vengono saltate e ogni riga inizia e
+        finisce sul primo e sull'ultimo pixel acceso, più l'overscan
+        percorso a laser spento alla velocità di lavoro. In bidirezionale
+        ogni riga viene percorsa nel verso che parte più vicino al punto
+        in cui è finita la precedente.
+        
+        Per generare a strisce, row0 è l'indice della prima riga di
+        power_map nella scansione completa e u la posizione (in pixel
+        lungo la scansione) in cui è finita la striscia precedente.
+        
+        Returns:
+            Posizione u a fine striscia, da passare alla successiva
+        """
+        scan = power_map.T if direction == RasterDirection.VERTICAL else power_map
+        n_px = scan.shape[1]
+        lit = scan > 0
+        rows = np.flatnonzero(lit.any(axis=1))
+        if not len(rows):
+            return u
+        lo = np.argmax(lit[rows], axis=1)                 # primo pixel acceso
+        hi = n_px - np.argmax(lit[rows, ::-1], axis=1)    # dopo l'ultimo
+        ov = self.overscan / resolution                   # overscan in pixel
         
-        if laser_was_on:
-            lines.append("M5")
+        # Verso delle righe: coordinate u in pixel lungo la scansione
+        # (u = 0 a sinistra in orizzontale, in alto in verticale)
+        flip = np.zeros(len(rows), dtype=bool)
+        if raster_mode == RasterMode.BIDIRECTIONAL:
+            if u is None:
+                if direction == RasterDirection.HORIZONTAL:
+                    u = 0.0
+                elif direction == RasterDirection.VERTICAL:
+                    u = height_mm / resolution
+                else:
+                    u = -_rotated_frame(width_mm, height_mm, self.raster_angle)[2] / resolution
+            for k, (a, b) in enumerate(zip(lo.tolist(), hi.tolist())):
+                flip[k] = abs(u - b - ov) < abs(u - a + ov)
+                u = a - ov if flip[k] else b + ov
         
-        return lines
+        scan = scan[rows]
+        rows = rows + row0
+        workers = self.workers or os.cpu_count() or 1
+        if workers > 1 and scan.size >= self.PARALLEL_MIN_PIXELS:
+            cuts = np.linspace(0, len(rows), min(len(rows), 4 * workers) + 1).astype(np.int64)
+            args = (width_mm, height_mm, resolution, direction)
+            try:
+                pool = _raster_pool(workers)
+                bands = [pool.submit(_raster_band, self, scan[a:b], rows[a:b], flip[a:b], *args)
+                         for a, b in zip(cuts[:-1].tolist(), cuts[1:].tolist()) if b > a]
+                bands = [f.result() for f in bands]
+            except (OSError, BrokenProcessPool):
+                bands = None      # processi non disponibili: si prosegue qui
+            if bands is not None:
+                for text, moves in bands:
+                    w.rendered(text.decode("utf-8").split("\n"), MoveTable(*moves))
+                return u
+        w.emit(*self._raster_columns(w, scan, rows, flip, width_mm, height_mm,
+                                     resolution, direction))
+        return u
     
-    def _raster_col_threshold(self, col_data, y_range, x, height_mm, resolution, invert, threshold) -> List[str]:
-        """Genera colonna raster con soglia."""
-        lines = []
-        laser_on = False
+    def _raster_columns(self, w, scan, rows, flip, width_mm, height_mm,
+                        resolution, direction):
+        """
+        Comandi raster (op, x, y, potenza) per le righe indicate.
         
-        for row_idx in y_range:
-            pixel = col_data[row_idx]
-            y = height_mm - (row_idx * resolution)
-            
-            if invert:
-                should_be_on = pixel < threshold
-            else:
-                should_be_on = pixel >= threshold
-            
-            if should_be_on and not laser_on:
-                lines.append(f"G0 X{x:.3f} Y{y:.3f}")
-                lines.append(f"M3 S{self.max_power}")
-                laser_on = True
-            elif not should_be_on and laser_on:
-                lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-                lines.append("M5")
-                laser_on = False
-            elif laser_on:
-                lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-        
-        if laser_on:
-            lines.append("M5")
-        
-        return lines
+        Args:
+            w: Writer (per i codici comando)
+            scan: Potenze delle righe con pixel accesi (righe × pixel)
+            rows: Indice di ogni riga nella scansione completa
+            flip: Righe percorse al contrario
+            width_mm, height_mm, resolution, direction: Geometria del raster
+        """
+        n_px = scan.shape[1]
+        ov = self.overscan / resolution
+        line, start, end, power = _raster_runs(np.where(flip[:, None], scan[:, ::-1], scan))
+        
+        # Solo i run tra il primo e l'ultimo pixel acceso di ogni riga
+        first = np.ones(len(line), dtype=bool)
+        first[1:] = line[1:] != line[:-1]
+        last = np.append(first[1:], True)
+        burn = power > 0
+        inner = burn | ~(first | last)
+        line, start, end, power, burn = line[inner], start[inner], end[inner], power[inner], burn[inner]
+        first = np.ones(len(line), dtype=bool)
+        first[1:] = line[1:] != line[:-1]
+        last = np.append(first[1:], True)
+        after_gap = np.append(True, ~burn[:-1]) | first
+        before_gap = np.append(~burn[1:], True) | last
+        
+        # Slot per run: G0 inizio riga, G1 di ingresso (overscan), G0 dopo
+        # un tratto spento, M3, G1, M5, G1 di uscita (overscan)
+        none = 255
+        op = np.full((len(line), 7), none, dtype=np.uint8)
+        op[first, 0] = w.OP_RAPID
+        if self.laser_mode:
+            off = w.OP_CUT_S
+            gap = (start - np.append(0, end[:-1])) * resolution
+            op[burn & after_gap & ~first, 2] = np.where(
+                gap > self.RAPID_GAP_MM, w.OP_RAPID, w.OP_CUT_S)[burn & after_gap & ~first]
+            op[burn, 4] = w.OP_CUT_S
+        else:
+            off = w.OP_CUT
+            op[burn & after_gap & ~first, 2] = w.OP_RAPID
+            op[burn, 3] = w.OP_ON
+            op[burn, 4] = w.OP_CUT
+            op[burn & before_gap, 5] = w.OP_OFF
+        if ov > 0:
+            op[first, 1] = off
+            op[last, 6] = off
+        pw = np.zeros((len(line), 7), dtype=np.int64)
+        pw[:, 3] = pw[:, 4] = power
+        
+        s = np.stack((start - ov, start, start, start, end, end, end + ov), axis=1)
+        s = np.where(flip[line, None], n_px - s, s) * resolution
+        cross = np.repeat(rows[line] * resolution, 7).reshape(-1, 7)
+        if direction == RasterDirection.HORIZONTAL:
+            x, y = s, height_mm - cross
+        elif direction == RasterDirection.VERTICAL:
+            x, y = cross, height_mm - s
+        else:
+            c, sn, u0, v0, _, _ = _rotated_frame(width_mm, height_mm, self.raster_angle)
+            u = u0 + s
+            v = v0 - cross - resolution / 2
+            x, y = u * c - v * sn, u * sn + v * c
+        
+        keep = op.reshape(-1) != none
+        return (op.reshape(-1)[keep], x.reshape(-1)[keep], y.reshape(-1)[keep],
+                pw.reshape(-1)[keep])
     
     # ══════════════════════════════════════════════════════════════════════════
     #  DITHERING
     # ══════════════════════════════════════════════════════════════════════════
-    def _floyd_steinberg_dithering(self, img) -> 'np.ndarray':
+    def _error_diffusion(self, img, mode: 'ImageGCodeGenerator.Mode',
+                         carry: Optional['np.ndarray'] = None, row0: int = 0) -> 'np.ndarray':
         """
-        Applica Floyd-Steinberg dithering all'immagine.
-        Crea un effetto halftone con pattern di punti.
+        Converte l'immagine in punti on/off per diffusione dell'errore.
         
         Args:
-            img: Array numpy float32
+            img: Array numpy grayscale (0-255)
+            mode: Modalità di dithering (chiave di DIFFUSION_KERNELS)
+            carry: Errore portato dalla striscia precedente (vedi
+                   _diffuse_wavefront), aggiornato per la successiva
+            row0: Indice della prima riga nell'immagine intera
         
         Returns:
-            Array numpy uint8 dithered
+            Array numpy uint8 con soli 0 e 255
         """
-        import numpy as np
+        kernel = self.DIFFUSION_KERNELS[mode]
+        if self.serpentine:
+            return _diffuse_serpentine(img, kernel, carry, row0)
+        return _diffuse_wavefront(img, kernel, carry)
+    
+    def diffusion_carry(self, mode: 'ImageGCodeGenerator.Mode', width: int) -> 'np.ndarray':
+        """Buffer vuoto dell'errore tra strisce per la modalità di dithering."""
+        rows = max(dy for _, dy, _ in self.DIFFUSION_KERNELS[mode][1])
+        return np.zeros((rows, width))
+    
+    def threshold_matrix(self, mode: 'ImageGCodeGenerator.Mode') -> 'np.ndarray':
+        """
+        Matrice di soglie (0-256) della modalità halftone indicata.
+        
+        Args:
+            mode: BAYER, CLUSTERED_DOT o BLUE_NOISE
+        
+        Returns:
+            Array float32 da ripetere sull'immagine
+        """
+        if mode == self.Mode.BAYER:
+            rank = _bayer_matrix(self.halftone_size)
+        elif mode == self.Mode.CLUSTERED_DOT:
+            rank = _clustered_dot_matrix(self.halftone_size)
+        else:
+            rank = _blue_noise_tile()
+        return ((rank + 0.5) * (256.0 / rank.size)).astype(np.float32)
+    
+    def _ordered_halftone(self, img, mode: 'ImageGCodeGenerator.Mode',
+                          row0: int = 0) -> 'np.ndarray':
+        """
+        Converte l'immagine in punti on/off confrontandola con la matrice
+        di soglie ripetuta: ogni pixel è indipendente dagli altri.
+        
+        Args:
+            img: Array numpy grayscale (0-255)
+            mode: Modalità halftone
+            row0: Indice della prima riga nell'immagine intera (fase della
+                  matrice tra una striscia e l'altra)
         
+        Returns:
+            Array numpy uint8 con soli 0 e 255
+        """
+        m = self.threshold_matrix(mode)
         h, w = img.shape
-        result = img.copy()
-        
-        for y in range(h):
-            for x in range(w):
-                old_pixel = result[y, x]
-                new_pixel = 255 if old_pixel > 127 else 0
-                result[y, x] = new_pixel
-                error = old_pixel - new_pixel
-                
-                # Distribuisci errore ai pixel vicini
-                if x + 1 < w:
-                    result[y, x + 1] += error * 7 / 16
-                if y + 1 < h:
-                    if x > 0:
-                        result[y + 1, x - 1] += error * 3 / 16
-                    result[y + 1, x] += error * 5 / 16
-                    if x + 1 < w:
-                        result[y + 1, x + 1] += error * 1 / 16
-        
-        return np.clip(result, 0, 255).astype(np.uint8)
+        th, tw = m.shape
+        r = row0 % th
+        tile = np.tile(m, (-(-(h + r) // th), -(-w // tw)))[r:r + h, :w]
+        return np.where(img < tile, 0, 255).astype(np.uint8)
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -858,26 +3922,47 @@ class GCodeFactory:
     @staticmethod
     def create_vector_generator(feed: int = 1000, 
                                  power: int = 200, 
-                                 passes: int = 1) -> VectorGCodeGenerator:
+                                 passes: int = 1,
+                                 arc_tolerance: Optional[float] = None,
+                                 laser_mode: bool = False) -> VectorGCodeGenerator:
         """Crea un generatore per percorsi vettoriali."""
-        return VectorGCodeGenerator(feed=feed, power=power, passes=passes)
+        return VectorGCodeGenerator(feed=feed, power=power, passes=passes,
+                                    arc_tolerance=arc_tolerance, laser_mode=laser_mode)
     
     @staticmethod
     def create_image_generator(feed: int = 1000,
                                 max_power: int = 255,
                                 min_power: int = 0,
-                                passes: int = 1) -> ImageGCodeGenerator:
+                                passes: int = 1,
+                                gamma: float = 1.0,
+                                overscan: float = 0.0,
+                                laser_mode: bool = False,
+                                power_levels: int = 0,
+                                diffuse_levels: bool = False,
+                                serpentine: bool = False,
+                                halftone_size: int = 4,
+                                raster_angle: float = 45.0,
+                                workers: int = 0) -> ImageGCodeGenerator:
         """Crea un generatore per immagini raster."""
         return ImageGCodeGenerator(
             feed=feed,
             max_power=max_power,
             min_power=min_power,
-            passes=passes
+            passes=passes,
+            gamma=gamma,
+            overscan=overscan,
+            laser_mode=laser_mode,
+            power_levels=power_levels,
+            diffuse_levels=diffuse_levels,
+            serpentine=serpentine,
+            halftone_size=halftone_size,
+            raster_angle=raster_angle,
+            workers=workers
         )
     
     @staticmethod
     def generate(source: GCodeSource,
-                 data,  # path_lines per VECTOR, image_array per IMAGE
+                 data,  # Polyline per VECTOR, image_array per IMAGE
                  width_mm: float,
                  height_mm: float,
                  feed: int = 1000,
@@ -885,13 +3970,14 @@ class GCodeFactory:
                  passes: int = 1,
                  offset_x: float = 0.0,
                  offset_y: float = 0.0,
+                 tolerance: Optional[float] = None,
                  **kwargs) -> GCodeProgram:
         """
         Metodo unificato per generare GCode da qualsiasi sorgente.
         
         Args:
             source: GCodeSource.VECTOR o GCodeSource.IMAGE
-            data: Lista di path lines (VECTOR) o numpy array (IMAGE)
+            data: Lista di Polyline (VECTOR) o numpy array (IMAGE)
             width_mm: Larghezza in mm
             height_mm: Altezza in mm
             feed: Velocità mm/min
@@ -899,24 +3985,41 @@ class GCodeFactory:
             passes: Numero passate
             offset_x: Offset X
             offset_y: Offset Y
+            tolerance: Semplificazione dei percorsi in mm (None = nessuna,
+                       0 = unisce solo i segmenti allineati)
             **kwargs: Parametri aggiuntivi per il generatore specifico
-                      IMAGE: max_lines, mode, direction, raster_mode, invert, threshold
+                      VECTOR: arc_tolerance, laser_mode
+                      IMAGE: max_lines, mode, direction, raster_mode, invert, threshold,
+                             min_power, gamma, overscan, laser_mode,
+                             power_levels, diffuse_levels, serpentine,
+                             halftone_size, raster_angle, workers
         
         Returns:
-            GCodeProgram
+            GCodeProgram (statistiche da calcolare con calculate_statistics)
         """
         if source == GCodeSource.VECTOR:
-            gen = VectorGCodeGenerator(feed=feed, power=power, passes=passes)
-            return gen.build(data, offset_x=offset_x, offset_y=offset_y)
+            gen = VectorGCodeGenerator(feed=feed, power=power, passes=passes,
+                                       arc_tolerance=kwargs.get('arc_tolerance'),
+                                       laser_mode=kwargs.get('laser_mode', False))
+            prog = gen.build(data, offset_x=offset_x, offset_y=offset_y)
         
         elif source == GCodeSource.IMAGE:
             gen = ImageGCodeGenerator(
                 feed=feed,
                 max_power=power,
                 min_power=kwargs.get('min_power', 0),
-                passes=passes
+                passes=passes,
+                gamma=kwargs.get('gamma', 1.0),
+                overscan=kwargs.get('overscan', 0.0),
+                laser_mode=kwargs.get('laser_mode', False),
+                power_levels=kwargs.get('power_levels', 0),
+                diffuse_levels=kwargs.get('diffuse_levels', False),
+                serpentine=kwargs.get('serpentine', False),
+                halftone_size=kwargs.get('halftone_size', 4),
+                raster_angle=kwargs.get('raster_angle', 45.0),
+                workers=kwargs.get('workers', 0)
             )
-            return gen.build_from_array(
+            prog = gen.build_from_array(
                 data,
                 width_mm=width_mm,
                 height_mm=height_mm,
@@ -932,6 +4035,10 @@ class GCodeFactory:
         
         else:
             raise ValueError(f"Sorgente GCode non supportata: {source}")
+        
+        if tolerance is not None:
+            prog = prog.simplify(tolerance)
+        return prog
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -960,7 +4067,8 @@ if __name__ == "__main__":
         "M5"
     ]
     prog = vec_gen.build(test_paths, offset_x=5, offset_y=5)
-    print(f"   Linee generate: {len(prog.raw_lines)}")
+    prog.calculate_statistics(vec_gen.feed)
+    print(f"   Linee generate: {prog.line_count()}")
     print(f"   Movimenti: {len(prog.moves)}")
     print(f"   Bounds: {prog.bounds()}")
     print(f"   Distanza totale: {prog.total_distance_mm:.2f} mm")
@@ -968,7 +4076,7 @@ if __name__ == "__main__":
     
     # Test 2: Parser
     print("\n2. Test GCodeParser:")
-    moves = GCodeParser.parse(prog.raw_lines)
+    moves = GCodeParser.parse(list(prog.iter_lines()))
     print(f"   Movimenti parsati: {len(moves)}")
     laser_on_moves = sum(1 for m in moves if m.laser_on)
     print(f"   Movimenti laser ON: {laser_on_moves}")
@@ -983,7 +4091,7 @@ if __name__ == "__main__":
         feed=2000,
         power=200
     )
-    print(f"   Programma generato: {len(prog2.raw_lines)} linee")
+    print(f"   Programma generato: {prog2.line_count()} linee")
     
     # Test 4: Generatore immagine (richiede numpy)
     print("\n4. Test ImageGCodeGenerator:")
@@ -1014,10 +4122,55 @@ if __name__ == "__main__":
             max_lines=10,
             mode=ImageGCodeGenerator.Mode.GRAYSCALE
         )
-        print(f"   Linee generate: {len(prog3.raw_lines)}")
+        print(f"   Linee generate: {prog3.line_count()}")
         print(f"   Source: {prog3.source.name}")
+        prog3.calculate_statistics(img_gen.feed)
         print(f"   Tempo stimato: {prog3.estimated_time_seconds:.1f} s")
         
+        # Test 5: Velocità dithering (obiettivo: < 1 s su 2000×2000)
+        print("\n5. Test velocità dithering 2000x2000:")
+        noise = np.random.default_rng(0).integers(0, 256, (2000, 2000)).astype(np.float64)
+        for mode in ImageGCodeGenerator.DIFFUSION_KERNELS:
+            t0 = time.perf_counter()
+            img_gen._error_diffusion(noise, mode)
+            dt = time.perf_counter() - t0
+            print(f"   {mode.name:<10} {dt:.2f} s {'OK' if dt < 1.0 else 'LENTO'}")
+        
+        # Test 6: Generazione a strisce. Con fattore di scala intero le
+        # righe coincidono con build_from_array; con fattori non interi il
+        # ridimensionamento differisce da INTER_AREA al più di 1 livello
+        print("\n6. Test generazione a strisce:")
+        res, lines, ppl = ImageGCodeGenerator.calculate_resolution(
+            60, 40, 80, RasterDirection.HORIZONTAL)
+        small = np.random.default_rng(1).integers(0, 256, (lines, ppl)).astype(np.uint8)
+        big = np.repeat(np.repeat(small, 3, axis=0), 3, axis=1)
+        for mode in (ImageGCodeGenerator.Mode.GRAYSCALE, ImageGCodeGenerator.Mode.DITHERING,
+                     ImageGCodeGenerator.Mode.BAYER):
+            for serpentine in (False, True):
+                gen = ImageGCodeGenerator(feed=1000, max_power=200, serpentine=serpentine)
+                ref = gen.build_from_array(big, 60, 40, 80, mode, offset_x=2).iter_output_lines()
+                tiled = gen.iter_tiled(big, 60, 40, 80, mode, offset_x=2, memory_mb=0.05)
+                same = ([l for l in ref if not l.startswith("; Generated")] ==
+                        [l for l in tiled if not l.startswith("; Generated")])
+                print(f"   {mode.name:<10} serpentina={serpentine!s:<5} "
+                      f"{'OK' if same else 'DIVERSO'}")
+        try:
+            import cv2
+            src = cv2.GaussianBlur(np.random.default_rng(2).integers(
+                0, 256, (600, 800)).astype(np.uint8), (15, 15), 0)
+            whole = cv2.resize(src, (ppl, lines), interpolation=cv2.INTER_AREA)
+            strips = np.vstack([_resample_strip(src, k, min(lines, k + 7), 600 / lines, ppl)
+                                for k in range(0, lines, 7)])
+            d = int(np.abs(strips.astype(int) - whole).max())
+            print(f"   Fattore non intero: differenza massima {d} {'OK' if d <= 1 else 'DIVERSO'}")
+        except ImportError:
+            pass
+        try:
+            img_gen.iter_tiled(big, 60, 40, 80, direction=RasterDirection.VERTICAL)
+            print("   VERTICAL: DIVERSO (nessun errore)")
+        except ValueError:
+            print("   VERTICAL: OK (ValueError)")
+        
     except ImportError:
         print("   (numpy non disponibile, test saltato)")
     
@@ -10,9 +10,10 @@ Gestisce:
 - Modalità simulazione
 """
 
+import re
 import time
 import threading
-from typing import Optional, Callable, List, Tuple
+from typing import Optional, Callable, Iterable, List, Tuple
 from dataclasses import dataclass
 from enum import Enum, auto
 
@@ -215,7 +216,6 @@ class LaserController:
                     self._controller_info.firmware = greeting
                     
                     # Estrai versione se presente
-                    import re
                     version_match = re.search(r'(\d+\.\d+[a-z]?)', greeting)
                     if version_match:
                         self._controller_info.version = version_match.group(1)
@@ -270,24 +270,27 @@ class LaserController:
                     self.log(strings.log_tx_error.format(err=e))
                 return "error"
     
-    def send_gcode(self, lines: List[str], 
+    def send_gcode(self, lines: Iterable[str], 
                    progress_cb: Optional[Callable] = None,
                    stop_event: Optional[threading.Event] = None,
-                   strings=None) -> bool:
+                   strings=None,
+                   total: Optional[int] = None) -> bool:
         """
         Invia un programma GCode completo.
         
         Args:
-            lines: Lista di righe GCode
+            lines: Righe GCode (lista o iteratore, es. file in streaming)
             progress_cb: Callback per progresso (current, total)
             stop_event: Event per interrompere l'invio
             strings: Oggetto stringhe
+            total: Numero di righe, se lines non ha len()
         
         Returns:
             True se completato senza errori
         """
         stop = stop_event or threading.Event()
-        total = len(lines)
+        if total is None:
+            total = len(lines)
         errors = 0
         
         for i, line in enumerate(lines):
@@ -337,6 +340,31 @@ class LaserController:
         else:
             self.log("🚨 EMERGENCY STOP")
     
+    def query_settings(self) -> dict:
+        """
+        Legge le impostazioni GRBL con $$ (es. $110-$121, $11, $32).
+        
+        Returns:
+            Dizionario {numero: valore}; vuoto in simulazione o se il
+            controller non risponde
+        """
+        if self._simulating or not self.ser:
+            return {}
+        settings = {}
+        with self._lock:
+            try:
+                self.ser.write(b"$$\n")
+                while True:
+                    resp = self.ser.readline().decode(errors="ignore").strip()
+                    if not resp or resp.startswith(("ok", "error", "ALARM")):
+                        break
+                    m = re.match(r"\$(\d+)=([-+]?[\d.]+)", resp)
+                    if m:
+                        settings[int(m.group(1))] = float(m.group(2))
+            except Exception:
+                return {}
+        return settings
+    
     def home(self):
         """Esegue homing automatico."""
         self.send_command("$H")
@@ -17,9 +17,11 @@ Moduli richiesti:
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
+import multiprocessing
 import time
 import sys
 import json
+from itertools import islice
 from pathlib import Path
 from typing import Optional
 
@@ -48,7 +50,8 @@ try:
     from gcode_generator import (
         GCodeFactory, GCodeSource, GCodeProgram, GCodeParser,
         ImageGCodeGenerator, VectorGCodeGenerator,
-        RasterDirection, RasterMode
+        RasterDirection, RasterMode, MachineSettings, CompactSettings,
+        order_paths
     )
 except ImportError:
     print("❌ ERRORE: gcode_generator.py non trovato!")
@@ -67,7 +70,10 @@ except ImportError:
     sys.exit(1)
 
 try:
-    from canvas_widgets import WorkAreaCanvas, VectorPreviewWindow
+    from canvas_widgets import (
+        WorkAreaCanvas, VectorPreviewWindow, path_polylines,
+        STYLE_RAPID, STYLE_ON, STYLE_OFF
+    )
 except ImportError:
     print("❌ ERRORE: canvas_widgets.py non trovato!")
     sys.exit(1)
@@ -109,6 +115,7 @@ except ImportError:
 APP_VERSION = "0.93"
 BAUDRATES   = [9600, 19200, 38400, 57600, 115200, 250000]
 CONFIG_FILE = Path(__file__).parent / ".pylaser_config.json"
+GCODE_VIEW_MAX_LINES = 200_000   # righe mostrate nel visualizzatore GCode
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -133,6 +140,31 @@ def load_config() -> dict:
         "method"        : "Contours",
         "width_mm"      : 100.0,
         "height_mm"     : 100.0,
+        "compact_output": False,
+        # Semplificazione percorsi generati (mm, 0 = solo segmenti allineati)
+        "simplify_tolerance": 0.0,
+        # Arc fitting G2/G3 per i percorsi vettoriali (mm, 0 = disattivato)
+        "arc_tolerance": 0.0,
+        # Riordino dei percorsi vettoriali per ridurre i rapidi
+        "optimize_order": True,
+        # Curva di risposta grigio → potenza del raster (1 = lineare)
+        "image_gamma": 1.0,
+        # Tratto a laser spento prima e dopo ogni riga raster (mm)
+        "image_overscan": 0.0,
+        # Laser mode GRBL ($32=1): M4 una volta e potenza S inline
+        "laser_mode": False,
+        # Livelli di potenza del raster in scala di grigi (0 = tutti)
+        "power_levels": 0,
+        # Diffusione dell'errore di quantizzazione sui livelli di potenza
+        "power_level_diffusion": False,
+        # Dithering a serpentina (False = ordine fisso, più veloce)
+        "dither_serpentine": False,
+        # Lato della cella halftone Bayer (2/4/8) e clustered-dot (pixel)
+        "halftone_size": 4,
+        # Angolo delle righe per la scansione diagonale (gradi dall'asse X)
+        "raster_angle": 45.0,
+        # Processi per il raster dei lavori grandi (0 = uno per core)
+        "raster_workers": 0,
     }
     try:
         if CONFIG_FILE.exists():
@@ -293,6 +325,8 @@ class App(tk.Tk):
         self.original_image : Optional[Image.Image] = None
         self.binary_np      : Optional["np.ndarray"] = None
         self.gcode_program  : Optional[GCodeProgram] = None
+        # Ultima geometria generata: (chiave, sorgente, programma)
+        self._gen_cache     = None
         self.rotation       = 0
         self._stop_event    = threading.Event()
         self._photo_orig    = None
@@ -303,6 +337,10 @@ class App(tk.Tk):
         self.vec        = Vectorizer(log_cb=self._log)
         self.vec.set_strings(self.s)
         self.ctrl       = LaserController(log_cb=self._log)
+        # Parametri macchina per la stima tempi (ultimi letti dal controller)
+        self.machine    = MachineSettings.from_grbl(
+            {int(k): v for k, v in
+             self.config_data.get("grbl_settings", {}).items()})
         self.preset_mgr = MaterialPresetManager()
 
         # ── Build UI ───────────────────────────────────────────────────────
@@ -679,6 +717,13 @@ class App(tk.Tk):
             value=self.config_data.get("img_mode", "grayscale"))
         for txt, val in [("Grayscale (PWM)", "grayscale"),
                           ("Dithering",       "dithering"),
+                          ("Atkinson",        "atkinson"),
+                          ("Jarvis-Judice-Ninke", "jarvis"),
+                          ("Stucki",          "stucki"),
+                          ("Sierra",          "sierra"),
+                          ("Bayer",           "bayer"),
+                          ("Clustered-dot",   "clustered_dot"),
+                          ("Blue noise",      "blue_noise"),
                           ("Threshold",       "threshold")]:
             ttk.Radiobutton(self.f_image_opts, text=txt,
                             variable=self.v_image_mode,
@@ -710,7 +755,8 @@ class App(tk.Tk):
         self.v_img_direction = tk.StringVar(
             value=self.config_data.get("img_direction", "horizontal"))
         for txt, val in [("↔ Orizzontale", "horizontal"),
-                          ("↕ Verticale",   "vertical")]:
+                          ("↕ Verticale",   "vertical"),
+                          ("⤢ Diagonale",   "diagonal")]:
             ttk.Radiobutton(self.f_image_opts, text=txt,
                             variable=self.v_img_direction,
                             value=val).pack(anchor="w")
@@ -955,6 +1001,12 @@ class App(tk.Tk):
                         command=self._toggle_sim_mode).pack(
             anchor="w", pady=2)
 
+        # Elimina parole modali ripetute e zeri finali (salvataggio e invio)
+        self.v_compact = tk.BooleanVar(
+            value=self.config_data.get("compact_output", False))
+        ttk.Checkbutton(f, text=s.chk_compact_output,
+                        variable=self.v_compact).pack(anchor="w", pady=2)
+
         r3 = ttk.Frame(f)
         r3.pack(fill="x", pady=4)
         self.btn_conn = ttk.Button(r3, text=s.btn_connect,
@@ -1307,10 +1359,7 @@ class App(tk.Tk):
         t     = self.t
 
         # Calcola bounds del percorso
-        xs    = [m.x for m in moves]
-        ys    = [m.y for m in moves]
-        mn_x  = min(xs);  mx_x = max(xs)
-        mn_y  = min(ys);  mx_y = max(ys)
+        mn_x, mn_y, mx_x, mx_y = moves.bounds()
         w_mm  = mx_x - mn_x or 1.0
         h_mm  = mx_y - mn_y or 1.0
 
@@ -1338,29 +1387,19 @@ class App(tk.Tk):
             bx0, by1, bx1, by0,
             fill=t.base, outline=t.surface1, width=1)
 
-        # Disegna percorsi
-        prev_x = prev_y = 0.0
-        for mv in moves:
-            px0, py0 = to_px(prev_x, prev_y)
-            px1, py1 = to_px(mv.x, mv.y)
-
-            # Salta segmenti troppo corti (ottimizzazione rendering)
-            if abs(px1 - px0) < 0.5 and abs(py1 - py0) < 0.5:
-                prev_x, prev_y = mv.x, mv.y
-                continue
-
-            if mv.is_rapid:
-                col, dash, lw = t.rapid, (2, 3), 1
-            elif mv.laser_on:
-                col, dash, lw = t.laser_on, (), 1
-            else:
-                col, dash, lw = t.laser_off, (1, 2), 1
-
+        # Disegna percorsi (una polilinea per tratto omogeneo,
+        # i segmenti sotto il pixel vengono scartati)
+        px, py = to_px(np.concatenate(([0.0], moves.x)),
+                       np.concatenate(([0.0], moves.y)))
+        styles = {
+            STYLE_RAPID: (t.rapid, (2, 3)),
+            STYLE_ON:    (t.laser_on, ()),
+            STYLE_OFF:   (t.laser_off, (1, 2)),
+        }
+        for style, coords in path_polylines(moves, px, py):
+            col, dash = styles[style]
             self.canvas_proc.create_line(
-                px0, py0, px1, py1,
-                fill=col, width=lw, dash=dash)
-
-            prev_x, prev_y = mv.x, mv.y
+                *coords, fill=col, width=1, dash=dash)
 
         # Marcatore origine
         ox, oy = to_px(0, 0)
@@ -1375,7 +1414,7 @@ class App(tk.Tk):
                 ox, oy - r, ox, oy + r, fill=t.home, width=1)
 
         # Info dimensioni in basso
-        on_moves  = sum(1 for m in moves if m.laser_on)
+        on_moves  = moves.laser_on_count()
         src_label = (f"VECTOR:{self.v_method.get()}"
                      if self.gcode_program.source == GCodeSource.VECTOR
                      else f"IMAGE:{self.v_image_mode.get()}")
@@ -1391,6 +1430,12 @@ class App(tk.Tk):
     # ══════════════════════════════════════════════════════════════════════
     #  ANTEPRIMA RISOLUZIONE IMMAGINE
     # ══════════════════════════════════════════════════════════════════════
+    def _img_direction(self) -> RasterDirection:
+        """Direzione di scansione raster scelta nelle opzioni immagine."""
+        return {"vertical": RasterDirection.VERTICAL,
+                "diagonal": RasterDirection.DIAGONAL}.get(
+            self.v_img_direction.get(), RasterDirection.HORIZONTAL)
+
     def _preview_image_resolution(self):
         """Mostra l'immagine ridimensionata per la generazione GCode."""
         if self.original_image is None:
@@ -1400,16 +1445,15 @@ class App(tk.Tk):
         w_mm      = self.v_width.get()
         h_mm      = self.v_height.get()
         max_lines = int(self.v_max_lines.get())
-        direction = (RasterDirection.HORIZONTAL
-                     if self.v_img_direction.get() == "horizontal"
-                     else RasterDirection.VERTICAL)
+        direction = self._img_direction()
 
         gray_img  = self.original_image.convert("L")
         img_array = np.array(gray_img)
 
+        angle     = self.config_data["raster_angle"]
         preview, resolution_mm, actual_lines, est_moves = \
             ImageGCodeGenerator.preview_image(
-                img_array, w_mm, h_mm, max_lines, direction)
+                img_array, w_mm, h_mm, max_lines, direction, angle)
 
         t   = self.t
         win = tk.Toplevel(self)
@@ -1423,9 +1467,8 @@ class App(tk.Tk):
         info_frame.pack(fill="x", padx=10, pady=10)
 
         orig_w, orig_h = img_array.shape[1], img_array.shape[0]
-        px_per_line    = (preview.shape[1]
-                          if direction == RasterDirection.HORIZONTAL
-                          else preview.shape[0])
+        px_per_line    = ImageGCodeGenerator.calculate_resolution(
+            w_mm, h_mm, max_lines, direction, angle)[2]
 
         for line in [
             f"  Immagine originale : {orig_w} × {orig_h} px",
@@ -1531,6 +1574,12 @@ class App(tk.Tk):
         ox     = self.v_model_x.get()
         oy     = self.v_model_y.get()
 
+        # Cambiano solo i parametri di lavoro: stessa geometria, nuovo template
+        key    = ("vector", method, w_mm, h_mm, gap, angle, simp)
+        binary = self.binary_np
+        if self._retemplate_cached(key, binary, feed, power, passes, ox, oy):
+            return
+
         self._log(s.log_generating.format(
             method=method, w=w_mm, h=h_mm))
         self.v_status.set(s.status_generating)
@@ -1550,14 +1599,25 @@ class App(tk.Tk):
                     paths = self.vec.hatch_paths(
                         self.binary_np, w_mm, h_mm, angle, gap)
 
+                if self.config_data["optimize_order"]:
+                    paths, before, after = order_paths(paths)
+                    if before > 0:
+                        self._log(s.log_path_order.format(
+                            before=before, after=after,
+                            pct=100.0 * (1.0 - after / before)))
+
                 prog = GCodeFactory.generate(
                     source=GCodeSource.VECTOR,
                     data=paths,
                     width_mm=w_mm, height_mm=h_mm,
                     feed=feed, power=power, passes=passes,
-                    offset_x=ox, offset_y=oy)
+                    offset_x=ox, offset_y=oy,
+                    tolerance=self.config_data["simplify_tolerance"],
+                    arc_tolerance=self.config_data["arc_tolerance"] or None,
+                    laser_mode=self.config_data["laser_mode"])
 
                 self.gcode_program = prog
+                self._gen_cache = (key, binary, prog)
                 self._finalize_gcode_generation()
 
             except Exception as e:
@@ -1585,13 +1645,28 @@ class App(tk.Tk):
         mode_map = {
             "grayscale": ImageGCodeGenerator.Mode.GRAYSCALE,
             "dithering": ImageGCodeGenerator.Mode.DITHERING,
+            "atkinson":  ImageGCodeGenerator.Mode.ATKINSON,
+            "jarvis":    ImageGCodeGenerator.Mode.JARVIS,
+            "stucki":    ImageGCodeGenerator.Mode.STUCKI,
+            "sierra":    ImageGCodeGenerator.Mode.SIERRA,
+            "bayer":     ImageGCodeGenerator.Mode.BAYER,
+            "clustered_dot": ImageGCodeGenerator.Mode.CLUSTERED_DOT,
+            "blue_noise": ImageGCodeGenerator.Mode.BLUE_NOISE,
             "threshold": ImageGCodeGenerator.Mode.THRESHOLD,
         }
         mode = mode_map.get(self.v_image_mode.get(),
                             ImageGCodeGenerator.Mode.GRAYSCALE)
-        direction = (RasterDirection.HORIZONTAL
-                     if self.v_img_direction.get() == "horizontal"
-                     else RasterDirection.VERTICAL)
+        direction = self._img_direction()
+
+        invert    = self.v_invert.get()
+        threshold = int(self.v_threshold.get())
+
+        # La potenza è nei valori S di ogni pixel: fa parte della geometria
+        key   = ("image", w_mm, h_mm, max_lines, mode, direction,
+                 invert, threshold, power)
+        image = self.original_image
+        if self._retemplate_cached(key, image, feed, None, passes, ox, oy):
+            return
 
         self._log(
             f"🖼 Genera GCode da immagine: "
@@ -1601,8 +1676,7 @@ class App(tk.Tk):
 
         def _run():
             try:
-                img_array = np.array(
-                    self.original_image.convert("L"))
+                img_array = np.array(image.convert("L"))
 
                 prog = GCodeFactory.generate(
                     source=GCodeSource.IMAGE,
@@ -1610,14 +1684,25 @@ class App(tk.Tk):
                     width_mm=w_mm, height_mm=h_mm,
                     feed=feed, power=power, passes=passes,
                     offset_x=ox, offset_y=oy,
+                    tolerance=self.config_data["simplify_tolerance"],
                     max_lines=max_lines,
                     mode=mode,
                     direction=direction,
                     raster_mode=RasterMode.BIDIRECTIONAL,
-                    invert=self.v_invert.get(),
-                    threshold=int(self.v_threshold.get()))
+                    invert=invert,
+                    threshold=threshold,
+                    gamma=self.config_data["image_gamma"],
+                    overscan=self.config_data["image_overscan"],
+                    laser_mode=self.config_data["laser_mode"],
+                    power_levels=self.config_data["power_levels"],
+                    diffuse_levels=self.config_data["power_level_diffusion"],
+                    serpentine=self.config_data["dither_serpentine"],
+                    halftone_size=self.config_data["halftone_size"],
+                    raster_angle=self.config_data["raster_angle"],
+                    workers=self.config_data["raster_workers"])
 
                 self.gcode_program = prog
+                self._gen_cache = (key, image, prog)
                 self._finalize_gcode_generation()
 
             except Exception as e:
@@ -1626,13 +1711,34 @@ class App(tk.Tk):
 
         threading.Thread(target=_run, daemon=True).start()
 
+    def _retemplate_cached(self, key, source, feed, power, passes,
+                           ox, oy) -> bool:
+        """
+        Riusa l'ultimo programma se la geometria non è cambiata.
+
+        Solo potenza/velocità/passate/offset diversi: il programma viene
+        ri-templato in pochi ms, senza Vectorizer né parser.
+
+        Returns:
+            True se il programma è stato aggiornato dalla cache
+        """
+        cached = self._gen_cache
+        if not cached or cached[0] != key or cached[1] is not source:
+            return False
+        self.gcode_program = cached[2].retemplate(
+            feed=feed, power=power, passes=passes,
+            offset_x=ox, offset_y=oy)
+        self._finalize_gcode_generation()
+        return True
+
     def _finalize_gcode_generation(self):
         """Aggiorna UI dopo la generazione GCode (chiamato dal thread)."""
         s    = self.s
         prog = self.gcode_program
-        n    = len(prog.raw_lines)
+        n    = prog.line_count()
         mvs  = len(prog.moves)
-        on_m = sum(1 for m in prog.moves if m.laser_on)
+        on_m = prog.moves.laser_on_count()
+        prog.calculate_statistics(self.v_feed_rate.get(), self.machine)
 
         info = (
             s.gcode_lines.format(n=n, moves=mvs) + "\n" +
@@ -1780,6 +1886,10 @@ class App(tk.Tk):
             self.work_canvas.work_h_mm,
             self.t, self.s, self._log)
 
+    def _compact_settings(self) -> Optional[CompactSettings]:
+        """Opzioni di compattazione dell'output (None = disattivata)."""
+        return CompactSettings() if self.v_compact.get() else None
+
     def _save_gcode(self):
         """Salva GCode su file."""
         if not self.gcode_program:
@@ -1789,29 +1899,29 @@ class App(tk.Tk):
             title=self.s.menu_save_gcode,
             defaultextension=".gcode",
             filetypes=[("GCode", "*.gcode *.nc *.cnc"),
+                       ("GCode gzip", "*.gcode.gz"),
                        ("All", "*.*")])
         if path:
-            Path(path).write_text(
-                "\n".join(self.gcode_program.translated_lines()),
-                encoding="utf-8")
+            self.gcode_program.write(path, compact=self._compact_settings())
             self._log(self.s.log_saved.format(path=path))
 
     def _load_gcode(self):
         """Carica GCode da file."""
         path = filedialog.askopenfilename(
             title=self.s.menu_load_gcode,
-            filetypes=[("GCode", "*.gcode *.nc *.cnc"),
+            filetypes=[("GCode", "*.gcode *.nc *.cnc *.gcode.gz"),
                        ("All", "*.*")])
         if not path:
             return
-        prog = GCodeParser.parse_file(path)
+        prog = GCodeParser.parse_file(path, feed_rate=self.v_feed_rate.get(),
+                                      machine=self.machine)
         self.gcode_program = prog
         self._update_work_canvas()
         self._update_model_info()
         self._show_gcode_on_proc_canvas()
         self._log(self.s.log_loaded.format(
             path=path,
-            lines=len(prog.raw_lines),
+            lines=prog.line_count(),
             moves=len(prog.moves)))
 
     def _show_gcode_text(self):
@@ -1828,8 +1938,12 @@ class App(tk.Tk):
             w, bg=t.surface0, fg=t.text,
             font=("Consolas", 9), borderwidth=0)
         txt.pack(fill="both", expand=True, padx=8, pady=8)
-        txt.insert("end",
-                   "\n".join(self.gcode_program.translated_lines()))
+        # Limite di righe: i file in streaming possono essere di GB
+        lines = list(islice(self.gcode_program.iter_translated_lines(),
+                            GCODE_VIEW_MAX_LINES + 1))
+        if len(lines) > GCODE_VIEW_MAX_LINES:
+            lines[-1] = "; ..."
+        txt.insert("end", "\n".join(lines))
         txt.configure(state="disabled")
 
     # ══════════════════════════════════════════════════════════════════════
@@ -1863,6 +1977,14 @@ class App(tk.Tk):
                     if info.version:
                         ctrl_str += f" v{info.version}"
                     self.after(0, self.v_controller_info.set, ctrl_str)
+                grbl = self.ctrl.query_settings()
+                if grbl:
+                    self.machine = MachineSettings.from_grbl(grbl)
+                    self.config_data["grbl_settings"] = {
+                        str(k): v for k, v in grbl.items()}
+                    save_config(self.config_data)
+                    self._log(f"⚙ Parametri macchina letti dal controller "
+                              f"({len(grbl)} impostazioni $)")
 
         threading.Thread(target=_do, daemon=True).start()
 
@@ -1983,7 +2105,7 @@ class App(tk.Tk):
             s.dlg_start_body.format(
                 w=mx_x - mn_x, h=mx_y - mn_y,
                 ox=ox, oy=oy,
-                lines=len(self.gcode_program.raw_lines)) + note)
+                lines=self.gcode_program.line_count()) + note)
         if not ok:
             return
 
@@ -1992,7 +2114,10 @@ class App(tk.Tk):
         self.v_progress_lbl.set(s.lbl_waiting)
         self.v_status.set(s.status_engraving)
 
-        lines = self.gcode_program.translated_lines()
+        # Iteratore: i file aperti in streaming vengono letti durante l'invio
+        lines = self.gcode_program.iter_output_lines(
+            self._compact_settings(), keep_count=True)
+        total = self.gcode_program.line_count()
 
         def _prog(cur, tot):
             pct = cur / tot * 100
@@ -2003,7 +2128,8 @@ class App(tk.Tk):
         def _run():
             ok2 = self.ctrl.send_gcode(
                 lines, progress_cb=_prog,
-                stop_event=self._stop_event, strings=self.s)
+                stop_event=self._stop_event, strings=self.s,
+                total=total)
             self.after(0, self._engrave_done, ok2)
 
         threading.Thread(target=_run, daemon=True).start()
@@ -2051,6 +2177,7 @@ class App(tk.Tk):
             "method"        : self.v_method.get(),
             "width_mm"      : self.v_width.get(),
             "height_mm"     : self.v_height.get(),
+            "compact_output": self.v_compact.get(),
         })
         save_config(self.config_data)
 
@@ -2089,4 +2216,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Il raster dei lavori grandi usa un pool di processi: nell'eseguibile
+    # PyInstaller i processi figli devono fermarsi qui
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
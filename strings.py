@@ -151,6 +151,7 @@ class Strings:
     lbl_port               : str = ""
     lbl_baud               : str = ""
     chk_simulation         : str = ""
+    chk_compact_output     : str = ""
     btn_connect            : str = ""
     btn_disconnect         : str = ""
     lbl_not_connected      : str = ""
@@ -223,6 +224,7 @@ class Strings:
     log_contours_found     : str = ""
     log_raster_info        : str = ""
     log_hatch_info         : str = ""
+    log_path_order         : str = ""
     log_tx_error           : str = ""
     log_alarm              : str = ""
     log_work_area_set      : str = ""
@@ -410,6 +412,7 @@ IT = Strings(
     lbl_port               = "Porta:",
     lbl_baud               = "Baud:",
     chk_simulation         = "Modalità simulazione (offline)",
+    chk_compact_output     = "Output GCode compatto",
     btn_connect            = "Connetti",
     btn_disconnect         = "Disconnetti",
     lbl_not_connected      = "⚫  Non connesso",
@@ -482,6 +485,7 @@ IT = Strings(
     log_contours_found     = "   Contorni: {n}",
     log_raster_info        = "   Raster: {rows} righe, {segs} segmenti accesi",
     log_hatch_info         = "   Hatching {angle}°: {n} istruzioni",
+    log_path_order         = "   Ordine percorsi: rapidi {before:.0f} → {after:.0f} mm (−{pct:.0f}%)",
     log_tx_error           = "⚠ TX: {err}",
     log_alarm              = "🚨 ALARM: {resp}",
     log_work_area_set      = "📏 Area di lavoro: {w}×{h} mm",
@@ -674,6 +678,7 @@ EN = Strings(
     lbl_port               = "Port:",
     lbl_baud               = "Baud:",
     chk_simulation         = "Simulation mode (offline)",
+    chk_compact_output     = "Compact G-code output",
     btn_connect            = "Connect",
     btn_disconnect         = "Disconnect",
     lbl_not_connected      = "⚫  Not connected",
@@ -746,6 +751,7 @@ EN = Strings(
     log_contours_found     = "   Contours: {n}",
     log_raster_info        = "   Raster: {rows} rows, {segs} active segments",
     log_hatch_info         = "   Hatching {angle}°: {n} instructions",
+    log_path_order         = "   Path order: rapids {before:.0f} → {after:.0f} mm (−{pct:.0f}%)",
     log_tx_error           = "⚠ TX: {err}",
     log_alarm              = "🚨 ALARM: {resp}",
     log_work_area_set      = "📏 Work area: {w}×{h} mm",
@@ -938,6 +944,7 @@ ES = Strings(
     lbl_port               = "Puerto:",
     lbl_baud               = "Baud:",
     chk_simulation         = "Modo simulación (sin conexión)",
+    chk_compact_output     = "Salida G-code compacta",
     btn_connect            = "Conectar",
     btn_disconnect         = "Desconectar",
     lbl_not_connected      = "⚫  No conectado",
@@ -1010,6 +1017,7 @@ ES = Strings(
     log_contours_found     = "   Contornos: {n}",
     log_raster_info        = "   Raster: {rows} filas, {segs} segmentos activos",
     log_hatch_info         = "   Tramado {angle}°: {n} instrucciones",
+    log_path_order         = "   Orden de trayectos: rápidos {before:.0f} → {after:.0f} mm (−{pct:.0f}%)",
     log_tx_error           = "⚠ TX: {err}",
     log_alarm              = "🚨 ALARMA: {resp}",
     log_work_area_set      = "📏 Área de trabajo: {w}×{h} mm",
@@ -1202,6 +1210,7 @@ DE = Strings(
     lbl_port               = "Port:",
     lbl_baud               = "Baud:",
     chk_simulation         = "Simulationsmodus (offline)",
+    chk_compact_output     = "Kompakte G-Code-Ausgabe",
     btn_connect            = "Verbinden",
     btn_disconnect         = "Trennen",
     lbl_not_connected      = "⚫  Nicht verbunden",
@@ -1274,6 +1283,7 @@ DE = Strings(
     log_contours_found     = "   Konturen: {n}",
     log_raster_info        = "   Raster: {rows} Zeilen, {segs} aktive Segmente",
     log_hatch_info         = "   Schraffur {angle}°: {n} Anweisungen",
+    log_path_order         = "   Pfadreihenfolge: Eilgänge {before:.0f} → {after:.0f} mm (−{pct:.0f}%)",
     log_tx_error           = "⚠ TX: {err}",
     log_alarm              = "🚨 ALARM: {resp}",
     log_work_area_set      = "📏 Arbeitsbereich: {w}×{h} mm",
@@ -8,11 +8,16 @@ Metodi supportati:
 - Centerline (skeletonization)
 - Raster (scansione lineare)
 - Hatching (tratteggio angolato)
+
+Tutti i metodi restituiscono percorsi strutturati (Polyline con punti Nx2
+in mm): il testo GCode viene generato una sola volta dal generatore.
 """
 
 import math
 from typing import List, Optional, Callable
 
+from gcode_generator import Polyline
+
 # ══════════════════════════════════════════════════════════════════════════════
 #  DIPENDENZE OPZIONALI
 # ══════════════════════════════════════════════════════════════════════════════
@@ -112,7 +117,7 @@ class Vectorizer:
     def contour_paths(self, binary: 'np.ndarray', 
                       width_mm: float, 
                       height_mm: float, 
-                      simplify: float = 1.0) -> List[str]:
+                      simplify: float = 1.0) -> List[Polyline]:
         """
         Estrae i contorni dall'immagine binaria.
         
@@ -123,7 +128,7 @@ class Vectorizer:
             simplify: Fattore di semplificazione (0-10)
         
         Returns:
-            Lista di comandi GCode
+            Lista di Polyline (contorni chiusi)
         """
         if not CV2_AVAILABLE:
             self.log("⚠ OpenCV richiesto per contorni")
@@ -138,7 +143,7 @@ class Vectorizer:
             binary, cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE
         )
         
-        lines = []
+        paths = []
         for cnt in contours:
             if len(cnt) < 2:
                 continue
@@ -149,28 +154,18 @@ class Vectorizer:
             
             pts = cnt.reshape(-1, 2)
             
-            # Primo punto (movimento rapido)
-            x0 = pts[0, 0] * scale_x
-            y0 = (h_px - pts[0, 1]) * scale_y
-            lines.append(f"G0 X{x0:.3f} Y{y0:.3f}")
-            lines.append("M3 S{lp}")
-            
-            # Punti successivi (incisione)
-            for pt in pts[1:]:
-                x = pt[0] * scale_x
-                y = (h_px - pt[1]) * scale_y
-                lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-            
-            # Chiudi contorno
-            lines.append(f"G1 X{x0:.3f} Y{y0:.3f}")
-            lines.append("M5")
+            # Pixel -> mm (Y invertita), chiusura sul primo punto
+            pts = np.vstack((pts, pts[:1]))
+            xy = np.column_stack((pts[:, 0] * scale_x,
+                                  (h_px - pts[:, 1]) * scale_y))
+            paths.append(Polyline(xy, closed=True))
         
         if self._strings:
             self.log(self._strings.log_contours_found.format(n=len(contours)))
         else:
             self.log(f"Contorni trovati: {len(contours)}")
         
-        return lines
+        return paths
     
     # ══════════════════════════════════════════════════════════════════════════
     #  METODO: RASTER
@@ -178,7 +173,7 @@ class Vectorizer:
     def raster_paths(self, binary: 'np.ndarray', 
                      width_mm: float, 
                      height_mm: float, 
-                     gap_mm: float = 0.1) -> List[str]:
+                     gap_mm: float = 0.1) -> List[Polyline]:
         """
         Genera percorso raster (scansione lineare bidirezionale).
         
@@ -189,7 +184,7 @@ class Vectorizer:
             gap_mm: Distanza tra le linee di scansione
         
         Returns:
-            Lista di comandi GCode
+            Lista di Polyline (un tratto per ogni run di pixel attivi)
         """
         h_px, w_px = binary.shape
         
@@ -206,43 +201,32 @@ class Vectorizer:
         scale_x = width_mm / cols
         scale_y = height_mm / rows
         
-        lines = []
+        paths = []
+        forward = np.arange(cols)
         for row in range(rows):
             y = row * scale_y
             
             # Direzione alternata (serpentina)
-            if row % 2 == 0:
-                col_range = range(cols)
-            else:
-                col_range = range(cols - 1, -1, -1)
+            order = forward if row % 2 == 0 else forward[::-1]
+            on = img[row, order] > 127
             
-            laser_on = False
-            for col in col_range:
-                pixel_on = img[row, col] > 127
-                x = col * scale_x
-                
-                if pixel_on and not laser_on:
-                    lines.append(f"G0 X{x:.3f} Y{y:.3f}")
-                    lines.append("M3 S{lp}")
-                    laser_on = True
-                elif not pixel_on and laser_on:
-                    lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-                    lines.append("M5")
-                    laser_on = False
-                elif pixel_on:
-                    lines.append(f"G1 X{x:.3f} Y{y:.3f}")
+            # Run di pixel attivi: ogni tratto termina sul primo pixel spento
+            edges = np.diff(np.concatenate(([0], on.view(np.int8), [0])))
+            starts = np.flatnonzero(edges == 1)
+            ends = np.minimum(np.flatnonzero(edges == -1), cols - 1)
             
-            if laser_on:
-                lines.append("M5")
+            for a, b in zip(starts.tolist(), ends.tolist()):
+                xs = order[a:b + 1] * scale_x
+                paths.append(Polyline(np.column_stack((xs, np.full(len(xs), y)))))
         
-        return lines
+        return paths
     
     # ══════════════════════════════════════════════════════════════════════════
     #  METODO: CENTERLINE
     # ══════════════════════════════════════════════════════════════════════════
     def centerline_paths(self, binary: 'np.ndarray', 
                          width_mm: float, 
-                         height_mm: float) -> List[str]:
+                         height_mm: float) -> List[Polyline]:
         """
         Estrae le linee centrali (skeleton) dall'immagine.
         
@@ -252,7 +236,7 @@ class Vectorizer:
             height_mm: Altezza target in mm
         
         Returns:
-            Lista di comandi GCode
+            Lista di Polyline
         """
         if not CV2_AVAILABLE:
             self.log("⚠ OpenCV richiesto per centerline")
@@ -289,10 +273,10 @@ class Vectorizer:
     def _trace_skeleton(self, skel: 'np.ndarray', 
                         scale_x: float, 
                         scale_y: float, 
-                        h_px: int) -> List[str]:
-        """Traccia lo skeleton generando comandi GCode."""
+                        h_px: int) -> List[Polyline]:
+        """Traccia lo skeleton generando un percorso per ogni catena di pixel."""
         visited = np.zeros(skel.shape, dtype=bool)
-        lines = []
+        paths = []
         
         # Trova tutti i pixel dello skeleton
         ys, xs = np.where(skel > 0)
@@ -316,32 +300,26 @@ class Vectorizer:
                 continue
             
             cx, cy = x0, y0
-            first = True
+            chain = []
             
             while True:
                 if visited[cy, cx]:
                     break
                 visited[cy, cx] = True
-                
-                gx = cx * scale_x
-                gy = (h_px - cy) * scale_y
-                
-                if first:
-                    lines.append(f"G0 X{gx:.3f} Y{gy:.3f}")
-                    lines.append("M3 S{lp}")
-                    first = False
-                else:
-                    lines.append(f"G1 X{gx:.3f} Y{gy:.3f}")
+                chain.append((cx, cy))
                 
                 neighbors = get_neighbors(cx, cy)
                 if not neighbors:
                     break
                 cx, cy = neighbors[0]
             
-            if not first:
-                lines.append("M5")
+            if chain:
+                px = np.array(chain, dtype=np.float64)
+                xy = np.column_stack((px[:, 0] * scale_x,
+                                      (h_px - px[:, 1]) * scale_y))
+                paths.append(Polyline(xy))
         
-        return lines
+        return paths
     
     # ══════════════════════════════════════════════════════════════════════════
     #  METODO: HATCHING
@@ -350,7 +328,7 @@ class Vectorizer:
                     width_mm: float, 
                     height_mm: float, 
                     angle: float = 45.0, 
-                    gap_mm: float = 0.2) -> List[str]:
+                    gap_mm: float = 0.2) -> List[Polyline]:
         """
         Genera tratteggio (hatching) con linee angolate.
         
@@ -362,7 +340,7 @@ class Vectorizer:
             gap_mm: Distanza tra le linee
         
         Returns:
-            Lista di comandi GCode
+            Lista di Polyline (una per banda)
         """
         if not CV2_AVAILABLE:
             return self.raster_paths(binary, width_mm, height_mm, gap_mm)
@@ -384,7 +362,7 @@ class Vectorizer:
         # Proiezione lungo la direzione perpendicolare
         proj = (xs * (-sin_a) + ys * cos_a).astype(int)
         
-        lines = []
+        paths = []
         for band in range(proj.min(), proj.max() + gap_px, gap_px):
             mask = (proj >= band) & (proj < band + gap_px)
             bx, by = xs[mask], ys[mask]
@@ -396,20 +374,10 @@ class Vectorizer:
             order = np.argsort(bx * cos_a + by * sin_a)
             bx, by = bx[order], by[order]
             
-            x0 = bx[0] * scale_x
-            y0 = (h_px - by[0]) * scale_y
-            
-            lines.append(f"G0 X{x0:.3f} Y{y0:.3f}")
-            lines.append("M3 S{lp}")
-            
-            for i in range(1, len(bx)):
-                x = bx[i] * scale_x
-                y = (h_px - by[i]) * scale_y
-                lines.append(f"G1 X{x:.3f} Y{y:.3f}")
-            
-            lines.append("M5")
+            xy = np.column_stack((bx * scale_x, (h_px - by) * scale_y))
+            paths.append(Polyline(xy))
         
-        return lines
+        return paths
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -442,14 +410,14 @@ if __name__ == "__main__":
         if CV2_AVAILABLE:
             # Test contorni
             paths = vec.contour_paths(test_img, 50, 50, simplify=1.0)
-            print(f"Contorni: {len(paths)} comandi")
+            print(f"Contorni: {len(paths)} percorsi")
             
             # Test raster
             paths = vec.raster_paths(test_img, 50, 50, gap_mm=0.5)
-            print(f"Raster: {len(paths)} comandi")
+            print(f"Raster: {len(paths)} percorsi")
             
             # Test hatching
             paths = vec.hatch_paths(test_img, 50, 50, angle=45, gap_mm=0.5)
-            print(f"Hatching: {len(paths)} comandi")
+            print(f"Hatching: {len(paths)} percorsi")
     
     print("\n=== Test completati ===")
\ No newline at end of file